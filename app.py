@@ -5,7 +5,7 @@ from datetime import datetime
 
 # === IMPORTS ===
 from db import init_app
-from erate import erate_bp
+from erate import erate_bp, schedule_geometry_warmup, preload_geometry
 from memes import memes_bp
 
 # === CREATE APP ===
@@ -57,4 +57,13 @@ def root():
 # === INIT DB ===
 init_app(app)
 
+# === GEOMETRY PRELOAD / WARM-UP ===
+# GEOMETRY_PRELOAD=1 (with gunicorn --preload): map what is already compiled once in the
+# master, workers share it after fork — never compiles, so the port binds right away.
+# Either flag also starts the background warm-up (one worker, process pool) on first request.
+if os.getenv('GEOMETRY_PRELOAD') == '1':
+    preload_geometry()
+if os.getenv('GEOMETRY_PRELOAD') == '1' or os.getenv('GEOMETRY_WARMUP') == '1':
+    schedule_geometry_warmup()
+
 # === GUNICORN HANDLES $PORT ===
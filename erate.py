@@ -23,10 +23,10 @@ import threading
 import time
 import psycopg
 import traceback
-from datetime import datetime
-from math import radians, cos, sin, sqrt, atan2
-import zipfile
-import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from math import isfinite, cos, radians
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import hashlib
 import re
 import json
@@ -34,6 +34,17 @@ import json
 from io import BytesIO
 from pypdf import PdfReader
 from db import get_conn
+import geo
+from geo import load_geometry, load_combined_index, format_fiber_distance, lod_tolerance_for_zoom, source_fingerprint, LOD_TOLERANCES
+from geo import artifact_path as geo_artifact_path, lod_artifact_path
+from tiles import get_tile, seed_all as seed_tiles, TILE_MAX_ZOOM
+from states import coverage_for_paths, grid_version, state_grid
+from warmup import warm_all, warmup_status
+from light_variants import choose_variant, build_all as build_light_variants, LIGHT_TOLERANCES
+from geocode import geocode as cached_geocode, init_tables as init_geocode_tables, STATS as GEOCODE_STATS
+from zip_centroids import locate as zip_locate, centroid_index, build as build_zip_centroids, ZIP_CENTROIDS_PATH
+from pops import pop_index
+from geohash import encode as geohash_encode, cover_ranges, radius_box, ranges_sql, within_radius
 from flask import Response, stream_with_context
 from flask import jsonify
 from models import Erate  # ← For querying the applicant
@@ -48,53 +59,17 @@ def get_nearest_fiber_distance(lat, lon, kmz_path):
     if not (lat and lon):
         return None
 
-    if not os.path.exists(kmz_path):
-        return None
-
-    R = 3958.8  # Earth radius in miles
-    min_dist = float('inf')
-
     try:
-        with zipfile.ZipFile(kmz_path, 'r') as kmz:
-            kml_files = [f for f in kmz.namelist() if f.lower().endswith('.kml')]
-            if not kml_files:
-                return None
-
-            root = ET.fromstring(kmz.read(kml_files[0]))
-            ns = {'kml': 'http://www.opengis.net/kml/2.2'}
-
-            # Find ALL LineString coordinates (direct + inside MultiGeometry)
-            coord_elems = root.findall('.//kml:LineString/kml:coordinates', ns)
-            coord_elems += root.findall('.//kml:MultiGeometry/kml:LineString/kml:coordinates', ns)
+        geom = load_geometry(kmz_path)
+        if geom is None or geom.n_vertices == 0:
+            return None
 
-            for coord_elem in coord_elems:
-                if not coord_elem.text:
-                    continue
-                for point_str in coord_elem.text.strip().split():
-                    parts = point_str.split(',')
-                    if len(parts) < 2:
-                        continue
-                    try:
-                        p_lon = float(parts[0])
-                        p_lat = float(parts[1])
-                        dlat = radians(p_lat - lat)
-                        dlon = radians(p_lon - lon)
-                        a = sin(dlat / 2)**2 + cos(radians(lat)) * cos(radians(p_lat)) * sin(dlon / 2)**2
-                        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-                        distance = R * c
-                        if distance < min_dist:
-                            min_dist = distance
-                    except ValueError:
-                        continue
-
-            if min_dist == float('inf'):
-                return None
+        hit = geom.spatial_index().nearest(lat, lon)
+        if hit is None:
+            return None
 
-            # Return formatted string
-            if min_dist < 1.0:  # includes 0.9999 etc.
-                return "<1 mi"
-            else:
-                return f"{round(min_dist, 1)} mi"
+        # Return formatted string — "<1 mi" or "N.N mi"
+        return format_fiber_distance(hit[0])
 
     except Exception as e:
         log("Distance calc error [%s]: %s", kmz_path, e)
@@ -149,6 +124,12 @@ try:
 except Exception as e:
     log("DB connection test: FAILED to %s", e)
 
+# === INIT GEOCODE TABLES (request paths only read / upsert them) ===
+try:
+    init_geocode_tables(DATABASE_URL)
+except Exception as e:
+    log("Geocode tables init FAILED: %s", e)
+
 # === POINT SYSTEM ===
 def deduct_point():
     if not session.get('username'):
@@ -207,31 +188,39 @@ def out_of_points():
     else:
         return jsonify({"message": "You have run out of click points. Email sales@santoelectronics.com to top up your account."})
 
-# === SQL INSERT (70 columns) ===
-INSERT_SQL = '''
-    INSERT INTO erate (
-        app_number, form_nickname, form_pdf, funding_year, fcc_status,
-        allowable_contract_date, created_datetime, created_by,
-        certified_datetime, certified_by, last_modified_datetime, last_modified_by,
-        ben, entity_name, org_status, org_type, applicant_type, website,
-        latitude, longitude, fcc_reg_num, address1, address2, city, state,
-        zip_code, zip_ext, email, phone, phone_ext, num_eligible,
-        contact_name, contact_address1, contact_address2, contact_city,
-        contact_state, contact_zip, contact_zip_ext, contact_phone,
-        contact_phone_ext, contact_email, tech_name, tech_title,
-        tech_phone, tech_phone_ext, tech_email, auth_name, auth_address,
-        auth_city, auth_state, auth_zip, auth_zip_ext, auth_phone,
-        auth_phone_ext, auth_email, auth_title, auth_employer,
-        cat1_desc, cat2_desc, installment_type, installment_min,
-        installment_max, rfp_id, state_restrictions, restriction_desc,
-        statewide, all_public, all_nonpublic, all_libraries, form_version
-    ) VALUES (
-        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-    )
-'''
+# === IMPORT COLUMNS (71 — geohash computed from lat/lon), IN _row_to_tuple ORDER ===
+IMPORT_COLUMNS = (
+    'app_number', 'form_nickname', 'form_pdf', 'funding_year', 'fcc_status',
+    'allowable_contract_date', 'created_datetime', 'created_by',
+    'certified_datetime', 'certified_by', 'last_modified_datetime', 'last_modified_by',
+    'ben', 'entity_name', 'org_status', 'org_type', 'applicant_type', 'website',
+    'latitude', 'longitude', 'fcc_reg_num', 'address1', 'address2', 'city', 'state',
+    'zip_code', 'zip_ext', 'email', 'phone', 'phone_ext', 'num_eligible',
+    'contact_name', 'contact_address1', 'contact_address2', 'contact_city',
+    'contact_state', 'contact_zip', 'contact_zip_ext', 'contact_phone',
+    'contact_phone_ext', 'contact_email', 'tech_name', 'tech_title',
+    'tech_phone', 'tech_phone_ext', 'tech_email', 'auth_name', 'auth_address',
+    'auth_city', 'auth_state', 'auth_zip', 'auth_zip_ext', 'auth_phone',
+    'auth_phone_ext', 'auth_email', 'auth_title', 'auth_employer',
+    'cat1_desc', 'cat2_desc', 'installment_type', 'installment_min',
+    'installment_max', 'rfp_id', 'state_restrictions', 'restriction_desc',
+    'statewide', 'all_public', 'all_nonpublic', 'all_libraries', 'form_version',
+    'geohash',
+)
+_IMPORT_COLUMN_LIST = ", ".join(IMPORT_COLUMNS)
+
+# Bulk load: COPY each chunk into a session temp table, then one set-based merge into erate
+IMPORT_STAGING_DDL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS erate_import_staging ON COMMIT DELETE ROWS
+    AS SELECT {_IMPORT_COLUMN_LIST} FROM erate WITH NO DATA
+"""
+IMPORT_COPY_SQL = f"COPY erate_import_staging ({_IMPORT_COLUMN_LIST}) FROM STDIN"
+IMPORT_MERGE_SQL = f"""
+    INSERT INTO erate ({_IMPORT_COLUMN_LIST})
+    SELECT {_IMPORT_COLUMN_LIST} FROM erate_import_staging
+    ON CONFLICT (app_number) DO NOTHING
+"""
+IMPORT_CHUNK_ROWS = 5000
 
 # === PARSE DATETIME ===
 def parse_datetime(value):
@@ -271,8 +260,10 @@ def _row_to_tuple(row):
     while form_pdf_raw.startswith(base):
         form_pdf_raw = form_pdf_raw[len(base):]
     form_pdf = f"http://publicdata.usac.org{form_pdf_raw}" if form_pdf_raw else ''
+    latitude = float(row.get('Latitude') or 0)
+    longitude = float(row.get('Longitude') or 0)
     return (
-        row.get('Application Number', ''),
+        (row.get('Application Number') or '').strip(),
         row.get('Form Nickname', ''),
         form_pdf,
         row.get('Funding Year', ''),
@@ -290,8 +281,8 @@ def _row_to_tuple(row):
         row.get('Organization Type', ''),
         row.get('Applicant Type', ''),
         row.get('Website URL', ''),
-        float(row.get('Latitude') or 0),
-        float(row.get('Longitude') or 0),
+        latitude,
+        longitude,
         row.get('Billed Entity FCC Registration Number', ''),
         row.get('Billed Entity Address 1', ''),
         row.get('Billed Entity Address 2', ''),
@@ -341,7 +332,8 @@ def _row_to_tuple(row):
         row.get('All Public Schools Districts', ''),
         row.get('All Non-Public schools', ''),
         row.get('All Libraries', ''),
-        row.get('Form Version', '')
+        row.get('Form Version', ''),
+        geohash_encode(latitude, longitude)
     )
 
 # === BLUEBIRD POP LIST (223) ===
@@ -469,43 +461,17 @@ pop_data = {
     "Tulsa, OK": (36.1539, -95.9928)
 }
 
-# === GEOCODE + DISTANCE (223 PoPs) ===
-def get_bluebird_distance(address):
-    if not address:
-        return {"distance": float('inf'), "pop_city": "N/A", "coverage": "Unknown"}
-    geocode_url = "https://nominatim.openstreetmap.org/search"
-    geocode_params = {
-        'q': address,
-        'format': 'json',
-        'limit': 1,
-        'addressdetails': 1
-    }
-    headers = {'User-Agent': 'E-Rate Dashboard/1.0'}
-    try:
-        geocode_resp = requests.get(geocode_url, params=geocode_params, headers=headers, timeout=10)
-        geocode_data = geocode_resp.json()
-        if not geocode_data:
-            return {"distance": float('inf'), "pop_city": "N/A", "coverage": "Unknown"}
-        lat = float(geocode_data[0]['lat'])
-        lon = float(geocode_data[0]['lon'])
-    except:
-        return {"distance": float('inf'), "pop_city": "N/A", "coverage": "Unknown"}
-    def haversine(lat1, lon1, lat2, lon2):
-        R = 3958.8
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
-        a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        return R * c
-    min_dist = float('inf')
-    nearest_pop = None
-    for city, (pop_lat, pop_lon) in pop_data.items():
-        dist = haversine(lat, lon, pop_lat, pop_lon)
-        if dist < min_dist:
-            min_dist = dist
-            nearest_pop = city
-    coverage = "Full fiber" if min_dist <= 5 else "Nearby" if min_dist <= 50 else "Extended reach"
-    return {"distance": min_dist, "pop_city": nearest_pop, "coverage": coverage}
+# === NEAREST BLUEBIRD POP (pop_data + Point placemarks of the Bluebird KMZ) ===
+def bluebird_pop_index():
+    return pop_index("bluebird", [(city, lat, lon) for city, (lat, lon) in pop_data.items()], KMZ_PATH_BLUEBIRD)
+
+def get_bluebird_distance(lat, lon, k=1):
+    """Nearest Bluebird PoP to already-resolved coordinates — no geocoding. "nearest" holds the top k."""
+    nearest = bluebird_pop_index().nearest(lat, lon, k) if lat and lon else []
+    if not nearest:
+        return {"distance": float('inf'), "pop_city": "N/A", "coverage": "Unknown", "nearest": []}
+    return {"distance": nearest[0]["miles"], "pop_city": nearest[0]["name"],
+            "coverage": nearest[0]["coverage"], "nearest": nearest}
 
 # === KMZ PATHS ===
 KMZ_PATH_SEGRA_EAST = "SEGRA_EAST.kmz"
@@ -516,15 +482,16 @@ FNA_MEMBERS_DIR = os.path.join(os.path.dirname(__file__), "fna_members")
 FIDUM_REGIONS_DIR = os.path.join(os.path.dirname(__file__), "fidium_regions")
 
 # State → preferred Fidium regional file (smart selection for bbmap)
+# Dense regions need no special casing: map mode picks a light variant by MAP_VERTEX_BUDGET
 STATE_TO_FIDIUM_REGION = {
-    "ME": "FidiumNE.kmz",   # dense — cap
+    "ME": "FidiumNE.kmz",
     "NH": "FidiumNE.kmz",
     "VT": "FidiumNE.kmz",
     "MA": "FidiumNE.kmz",
     "CT": "FidiumNE.kmz",   # if in NNE
     "RI": "FidiumNE.kmz",   # if in NNE
-    "NY": "FidiumNE2.kmz",  # sparse — no cap
-    "PA": "FidiumNE2.kmz",  # sparse — no cap
+    "NY": "FidiumNE2.kmz",
+    "PA": "FidiumNE2.kmz",
     "MN": "FidiumMW.kmz",
     "IL": "FidiumMW.kmz",
     "IA": "FidiumMW.kmz",
@@ -537,6 +504,9 @@ STATE_TO_FIDIUM_REGION = {
     "CA": "FidiumWE.kmz",
 }
 
+# Most route vertices bbmap ships in one response (see light_variants.py)
+MAP_VERTEX_BUDGET = int(os.getenv('MAP_VERTEX_BUDGET', '150000'))
+
 # === FNA MEMBERS LOADING ===
 FNA_MEMBERS = {}
 
@@ -555,115 +525,82 @@ def _load_fna_members():
 
 _load_fna_members()  # ← This line is critical — it runs at import time
 
-# === GLOBAL MAP DATA (LAZY LOADED) — BLUEBIRD & SEGRA ONLY ===
-MAP_DATA = {
-    "bluebird": {"pops": None, "routes": None, "loaded": False},
-    "segra_east": {"pops": None, "routes": None, "loaded": False},
-    "segra_west": {"pops": None, "routes": None, "loaded": False},
+# === PER-PATH KMZ CACHE — LRU UNDER A BYTE BUDGET ===
+# pops/routes as the map templates want them, keyed by absolute path. An entry is only
+# reused while the source fingerprint (mtime/size) matches; least recently used entries
+# are dropped once the estimated size of everything cached passes KMZ_CACHE_BYTES.
+KMZ_CACHE_BYTES = int(os.getenv('KMZ_CACHE_BYTES', str(256 * 1024 * 1024)))
+KMZ_ALIASES = {
+    "bluebird": KMZ_PATH_BLUEBIRD,
+    "segra_east": KMZ_PATH_SEGRA_EAST,
+    "segra_west": KMZ_PATH_SEGRA_WEST,
 }
+_KMZ_CACHE = OrderedDict()  # abs path → (fingerprint, pops, routes, est. bytes)
+_KMZ_CACHE_LOCK = threading.Lock()
+KMZ_CACHE_STATS = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0, "entries": 0}
+
+def _estimate_kmz_bytes(geom):
+    """Rough in-memory size of geom.pops() + geom.routes() (list/float/dict overhead in CPython)."""
+    return geom.n_vertices * 128 + geom.n_routes * 320 + geom.n_pops * 480
 
-# === GENERALIZED KMZ LOADER — FOR BLUEBIRD, SEGRA, FNA, AND FIDIUM REGIONAL FILES ===
 def _load_kmz(arg):
     """
     arg can be:
-    - "bluebird", "segra_east", "segra_west" → cached
+    - "bluebird", "segra_east", "segra_west" → alias for that file
     - direct path string → FNA member or specific Fidium regional file
+    Returns (pops, routes); cached per path (see KMZ_CACHE_BYTES).
     """
-    cache_key = None
-    if arg in ["bluebird", "segra_east", "segra_west"]:
-        cache_key = arg
-
-    if cache_key and MAP_DATA[cache_key]["loaded"]:
-        log(f"Returning cached data for {cache_key}")
-        return MAP_DATA[cache_key]["pops"], MAP_DATA[cache_key]["routes"]
-
-    path = None
-    if arg == "bluebird":
-        path = KMZ_PATH_BLUEBIRD
-    elif arg == "segra_east":
-        path = KMZ_PATH_SEGRA_EAST
-    elif arg == "segra_west":
-        path = KMZ_PATH_SEGRA_WEST
-    else:
-        path = arg  # direct path (FNA or Fidium regional)
-
-    if not os.path.exists(path):
+    path = KMZ_ALIASES.get(arg, arg)
+    fingerprint = source_fingerprint(path)
+    if fingerprint is None:
         log("KMZ not found: %s", path)
-        if cache_key:
-            MAP_DATA[cache_key]["loaded"] = True
-            MAP_DATA[cache_key]["pops"] = []
-            MAP_DATA[cache_key]["routes"] = []
         return [], []
 
-    pops = []
-    routes = []
+    key = os.path.abspath(path)
+    with _KMZ_CACHE_LOCK:
+        entry = _KMZ_CACHE.get(key)
+        if entry is not None and entry[0] == fingerprint:
+            _KMZ_CACHE.move_to_end(key)
+            KMZ_CACHE_STATS["hits"] += 1
+            return entry[1], entry[2]
+        KMZ_CACHE_STATS["misses"] += 1
+
     try:
         log("Loading KMZ: %s", os.path.basename(path))
-        with zipfile.ZipFile(path, 'r') as kmz:
-            kml_files = [f for f in kmz.namelist() if f.lower().endswith('.kml')]
-            if not kml_files:
-                log("No .kml in %s", path)
-                return [], []
-            kml_data = kmz.read(kml_files[0])
-
-        root = ET.fromstring(kml_data)
-        ns = {'kml': 'http://www.opengis.net/kml/2.2'}
-
-        for placemark in root.findall('.//kml:Placemark', ns):
-            name_elem = placemark.find('kml:name', ns)
-            name = name_elem.text.strip() if name_elem is not None and name_elem.text else "Unnamed"
-
-            # POINT (PoP)
-            point = placemark.find('.//kml:Point/kml:coordinates', ns)
-            if point is not None and point.text:
-                parts = point.text.strip().split(',')
-                if len(parts) >= 2:
-                    try:
-                        lon, lat = float(parts[0]), float(parts[1])
-                        pops.append({"name": name, "lon": lon, "lat": lat})
-                    except ValueError:
-                        pass
-
-            # LINESTRING (support MultiGeometry)
-            line_strings = placemark.findall('.//kml:LineString/kml:coordinates', ns)
-            if not line_strings:
-                line_strings = placemark.findall('.//kml:MultiGeometry/kml:LineString/kml:coordinates', ns)
-            for line in line_strings:
-                if line.text:
-                    coords = []
-                    for pair in line.text.strip().split():
-                        parts = pair.split(',')
-                        if len(parts) >= 2:
-                            try:
-                                lon, lat = float(parts[0]), float(parts[1])
-                                coords.append([lat, lon])
-                            except ValueError:
-                                continue
-                    if len(coords) > 1:
-                        routes.append({"name": name, "coords": coords})
-
+        geom = load_geometry(path)
+        pops = geom.pops()
+        routes = geom.routes()
         log("KMZ loaded [%s] – %d PoPs, %d routes", os.path.basename(path), len(pops), len(routes))
-
-        if cache_key:
-            MAP_DATA[cache_key]["pops"] = pops
-            MAP_DATA[cache_key]["routes"] = routes
-            MAP_DATA[cache_key]["loaded"] = True
-
-        return pops, routes
-
     except Exception as e:
         log("KMZ parse error [%s]: %s", path, e)
-        if cache_key:
-            MAP_DATA[cache_key]["loaded"] = True
         return [], []
 
-# === FINAL BBMAP — WORKING VERSION WITH FIDIUM SPLIT + LIGHT ONLY FOR NE ===
-@erate_bp.route('/bbmap/<app_number>')
-def bbmap(app_number):
-    fna_member = request.args.get('fna_member')
-    distance_only = request.args.get('distance_only') == '1'
+    size = _estimate_kmz_bytes(geom)
+    with _KMZ_CACHE_LOCK:
+        old = _KMZ_CACHE.pop(key, None)
+        if old is not None:
+            KMZ_CACHE_STATS["bytes"] -= old[3]
+        if size <= KMZ_CACHE_BYTES:
+            _KMZ_CACHE[key] = (fingerprint, pops, routes, size)
+            KMZ_CACHE_STATS["bytes"] += size
+        while KMZ_CACHE_STATS["bytes"] > KMZ_CACHE_BYTES and _KMZ_CACHE:
+            _, evicted = _KMZ_CACHE.popitem(last=False)
+            KMZ_CACHE_STATS["bytes"] -= evicted[3]
+            KMZ_CACHE_STATS["evictions"] += 1
+        KMZ_CACHE_STATS["entries"] = len(_KMZ_CACHE)
+    return pops, routes
+
+# === APPLICANT LOOKUP HELPERS (shared by bbmap and the batch distance API) ===
+PROVIDER_KEYS = {
+    'Segra EAST': 'segra_east',
+    'Segra WEST': 'segra_west',
+    'FNA Network': 'fna',
+    'Bluebird Network': 'bluebird',
+    'Fidium Network': 'fidium',
+}
 
-    # Determine provider
+def _user_provider():
+    """Logged-in user's network key ('bluebird' for guests or unknown values)."""
     provider = 'bluebird'
     if 'username' in session:
         try:
@@ -673,51 +610,42 @@ def bbmap(app_number):
                 row = cur.fetchone()
             conn.close()
             if row and row[0]:
-                provider_raw = row[0].strip()
-                if provider_raw == 'Segra EAST':
-                    provider = 'segra_east'
-                elif provider_raw == 'Segra WEST':
-                    provider = 'segra_west'
-                elif provider_raw == 'FNA Network':
-                    provider = 'fna'
-                elif provider_raw == 'Bluebird Network':
-                    provider = 'bluebird'
-                elif provider_raw == 'Fidium Network':
-                    provider = 'fidium'
+                provider = PROVIDER_KEYS.get(row[0].strip(), 'bluebird')
         except Exception as e:
             log("Failed to get user provider: %s", e)
+    return provider
 
-    log("bbmap called — app=%s provider=%s member=%s distance_only=%s", app_number, provider, fna_member, distance_only)
+def _full_address(address1, address2, city, state, zip_code):
+    return f"{address1 or ''} {address2 or ''}, {city or ''}, {state or ''} {zip_code or ''}".strip(', ')
 
-    # Fetch applicant data
-    conn = psycopg.connect(DATABASE_URL, connect_timeout=10)
-    with conn.cursor() as cur:
-        cur.execute("SELECT entity_name, address1, address2, city, state, zip_code, latitude, longitude FROM erate WHERE app_number = %s", (app_number,))
-        row = cur.fetchone()
-    conn.close()
-    if not row:
-        return jsonify({"error": "Applicant not found"}), 404
+def _geocode(full_address):
+    """(lat, lon) via the shared geocode cache (Nominatim at most once per address), or (None, None)."""
+    return cached_geocode(full_address, DATABASE_URL)
 
-    entity_name, address1, address2, city, state, zip_code, db_lat, db_lon = row
-    full_address = f"{address1 or ''} {address2 or ''}, {city or ''}, {state or ''} {zip_code or ''}".strip(', ')
+def _offline_coords(db_lat, db_lon, zip_code=None, city=None, state=None):
+    """
+    (lat, lon, accuracy) without touching the network: stored lat/lon when present and
+    non-zero ("exact"), else the bundled ZIP / city centroid ("zip" / "city"), else Nones.
+    """
     applicant_lat = float(db_lat) if db_lat and str(db_lat).strip() and float(db_lat) != 0 else None
     applicant_lon = float(db_lon) if db_lon and str(db_lon).strip() and float(db_lon) != 0 else None
+    if applicant_lat and applicant_lon:
+        return applicant_lat, applicant_lon, "exact"
+    return zip_locate(zip_code, city, state)
 
+def _applicant_coords(db_lat, db_lon, full_address, zip_code=None, city=None, state=None):
+    """(lat, lon, accuracy) — offline tiers first, a geocode of the address only when they miss."""
+    applicant_lat, applicant_lon, accuracy = _offline_coords(db_lat, db_lon, zip_code, city, state)
     if not (applicant_lat and applicant_lon):
-        try:
-            r = requests.get("https://nominatim.openstreetmap.org/search",
-                             params={'q': full_address, 'format': 'json', 'limit': 1},
-                             headers={'User-Agent': 'E-Rate/1.0'}, timeout=10)
-            geo = r.json()
-            if geo:
-                applicant_lat = float(geo[0]['lat'])
-                applicant_lon = float(geo[0]['lon'])
-        except Exception as e:
-            log("Geocoding failed: %s", e)
+        applicant_lat, applicant_lon = _geocode(full_address)
+        accuracy = "geocode" if applicant_lat else None
+    return applicant_lat, applicant_lon, accuracy
 
-    final_applicant_coords = [applicant_lat, applicant_lon] if applicant_lat and applicant_lon else None
-
-    # === SELECT CORRECT KMZ PATH — LIGHT ONLY FOR NE ===
+def _resolve_kmz_path(provider, state, fna_member, applicant_lat, applicant_lon, quiet=False):
+    """
+    Full-detail source file for a provider + applicant (closest FNA member when none is chosen).
+    quiet=True skips the per-call log lines — for bulk jobs.
+    """
     kmz_path = None
     if provider == 'segra_east':
         kmz_path = KMZ_PATH_SEGRA_EAST
@@ -729,61 +657,91 @@ def bbmap(app_number):
 
         if preferred_file:
             base_path = os.path.join(FIDUM_REGIONS_DIR, preferred_file)
-
-            if distance_only:
-                # Use full for accuracy
-                if os.path.exists(base_path):
-                    kmz_path = base_path
-                    log("Fidium distance_only: using full %s", preferred_file)
-                else:
-                    log("Full file missing — using light if available")
-                    kmz_path = base_path.replace(".kmz", "_light.kmz")
+            if os.path.exists(base_path):
+                kmz_path = base_path
+                if not quiet:
+                    log("Fidium: using %s", preferred_file)
             else:
-                # Map: use light only for NE
-                if preferred_file == "FidiumNE.kmz":
-                    light_path = base_path.replace(".kmz", "_light.kmz")
-                    if os.path.exists(light_path):
-                        kmz_path = light_path
-                        log("Fidium map: using light NE file")
-                    else:
-                        kmz_path = base_path
-                        log("NE light missing — using full NE")
-                else:
-                    # MW, SO, WE — use full file
-                    if os.path.exists(base_path):
-                        kmz_path = base_path
-                        log("Fidium map: using full %s", preferred_file)
+                if not quiet:
+                    log("Full file missing — using hand-made light file if available")
+                kmz_path = base_path.replace(".kmz", "_light.kmz")
         else:
             backbone_path = os.path.join(FIDUM_REGIONS_DIR, "FidiumBackbone.kmz")
             if os.path.exists(backbone_path):
                 kmz_path = backbone_path
-                log("Fidium: using FidiumBackbone.kmz")
+                if not quiet:
+                    log("Fidium: using FidiumBackbone.kmz")
             else:
                 ne_full = os.path.join(FIDUM_REGIONS_DIR, "FidiumNE.kmz")
                 kmz_path = ne_full if os.path.exists(ne_full) else KMZ_PATH_BLUEBIRD
-                log("Fidium: fallback to full NE or Bluebird")
+                if not quiet:
+                    log("Fidium: fallback to full NE or Bluebird")
     elif provider == 'fna':
         if fna_member:
             clean = fna_member.lstrip('★ ').split(' (')[0].strip()
             kmz_path = FNA_MEMBERS.get(clean) or KMZ_PATH_BLUEBIRD
         else:
             closest_path = KMZ_PATH_BLUEBIRD
-            min_d = float('inf')
-            for name, path in FNA_MEMBERS.items():
-                if not os.path.exists(path):
-                    continue
-                d = get_nearest_fiber_distance(applicant_lat, applicant_lon, path)
-                if d is not None:
-                    try:
-                        d_num = 0.0 if d == "<1 mi" else float(d)
-                    except:
-                        d_num = float('inf')
-                    if d_num < min_d:
-                        min_d = d_num
-                        closest_path = path
+            try:
+                top = load_combined_index(FNA_MEMBERS).nearest_sources(applicant_lat, applicant_lon, k=1)
+                if top:
+                    closest_path = FNA_MEMBERS[top[0][0]]
+            except Exception as e:
+                log("FNA closest member error: %s", e)
             kmz_path = closest_path
     else:
         kmz_path = KMZ_PATH_BLUEBIRD
+    return kmz_path
+
+NEAREST_POPS_K = 3  # PoPs listed with each bbmap response
+
+# === NEAREST POPS API ===
+@erate_bp.route('/nearest-pops')
+def nearest_pops():
+    """?lat=..&lon=..&k=N → the k closest Bluebird PoPs with distance and coverage class."""
+    lat, lon = request.args.get('lat', type=float), request.args.get('lon', type=float)
+    if lat is None or lon is None:
+        return jsonify({"error": "lat and lon required"}), 400
+    k = min(max(request.args.get('k', 1, type=int), 1), 50)
+    return jsonify({"pops": bluebird_pop_index().nearest(lat, lon, k)})
+
+# === FINAL BBMAP — FIDIUM SPLIT + LIGHT VARIANTS BY VERTEX BUDGET ===
+@erate_bp.route('/bbmap/<app_number>')
+def bbmap(app_number):
+    fna_member = request.args.get('fna_member')
+    distance_only = request.args.get('distance_only') == '1'
+    use_tiles = request.args.get('tiles') == '1'
+
+    provider = _user_provider()
+
+    log("bbmap called — app=%s provider=%s member=%s distance_only=%s", app_number, provider, fna_member, distance_only)
+
+    # Fetch applicant data
+    conn = psycopg.connect(DATABASE_URL, connect_timeout=10)
+    with conn.cursor() as cur:
+        cur.execute("SELECT entity_name, address1, address2, city, state, zip_code, latitude, longitude FROM erate WHERE app_number = %s", (app_number,))
+        row = cur.fetchone()
+    conn.close()
+    if not row:
+        return jsonify({"error": "Applicant not found"}), 404
+
+    entity_name, address1, address2, city, state, zip_code, db_lat, db_lon = row
+
+    # Materialized distance — no geocode, no geometry when the stored row is fresh
+    if distance_only and not fna_member:
+        stored = _stored_fiber_distances(provider, [app_number])
+        if app_number in stored:
+            dist_str = format_fiber_distance(stored[app_number])
+            log("bbmap distance result (stored): %s", dist_str)
+            return jsonify({"nearest_fiber_distance": dist_str})
+
+    full_address = _full_address(address1, address2, city, state, zip_code)
+    applicant_lat, applicant_lon, location_accuracy = _applicant_coords(db_lat, db_lon, full_address, zip_code, city, state)
+
+    final_applicant_coords = [applicant_lat, applicant_lon] if applicant_lat and applicant_lon else None
+
+    # Full source file — map mode swaps in a light variant below
+    kmz_path = _resolve_kmz_path(provider, state, fna_member, applicant_lat, applicant_lon)
 
     # === DISTANCE ONLY MODE ===
     if distance_only:
@@ -800,45 +758,19 @@ def bbmap(app_number):
     # === FNA RANKING — FULLY PRESERVED ===
     if provider == "fna" and not fna_member:
         log("Calculating true closest FNA members for %s", full_address)
-        def haversine(lat1, lon1, lat2, lon2):
-            R = 3958.8
-            from math import radians, sin, cos, sqrt, atan2
-            dlat = radians(lat2 - lat1)
-            dlon = radians(lon2 - lon1)
-            a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-            c = 2 * atan2(sqrt(a), sqrt(1-a))
-            return R * c
-
+        # One combined query ranks every member: each file's KD-tree answers its own nearest
+        # vertex, so the whole dropdown stays in distance order
         rankings = []
-        for name, path in FNA_MEMBERS.items():
-            if not os.path.exists(path):
-                continue
+        if applicant_lat:
             try:
-                with zipfile.ZipFile(path, 'r') as kmz:
-                    kml_file = next((f for f in kmz.namelist() if f.lower().endswith('.kml')), None)
-                    if not kml_file:
-                        continue
-                    root = ET.fromstring(kmz.read(kml_file))
-                    ns = {'kml': 'http://www.opengis.net/kml/2.2'}
-                    coords = []
-                    for c in root.findall('.//kml:coordinates', ns):
-                        if c.text:
-                            for pair in c.text.strip().split():
-                                p = pair.split(',')
-                                if len(p) >= 2:
-                                    try:
-                                        lon, lat = float(p[0]), float(p[1])
-                                        coords.append((lat, lon))
-                                    except: pass
-                    if coords and applicant_lat:
-                        distances = [haversine(applicant_lat, applicant_lon, lat, lon) for lat, lon in coords]
-                        rankings.append((name, min(distances)))
-                    else:
-                        rankings.append((name, 99999))
-            except:
-                rankings.append((name, 99999))
-
-        rankings.sort(key=lambda x: x[1])
+                rankings = load_combined_index(FNA_MEMBERS).nearest_sources(
+                    applicant_lat, applicant_lon, k=len(FNA_MEMBERS))
+            except Exception as e:
+                log("FNA ranking error: %s", e)
+        ranked_names = {name for name, _ in rankings}
+        # Members with no usable geometry (or no applicant coords) go last, as before
+        rankings += [(name, 99999) for name, path in FNA_MEMBERS.items()
+                     if name not in ranked_names and os.path.exists(path)]
         display_list = []
         for i, (name, dist) in enumerate(rankings):
             if i < 3 and dist < 100:
@@ -864,57 +796,793 @@ def bbmap(app_number):
 
     log("bbmap loading full map for provider: %s | kmz_path: %s", provider, kmz_path)
 
-    if provider == "bluebird":
-        if not MAP_DATA["bluebird"]["loaded"]:
-            _load_kmz("bluebird")
-        pops = MAP_DATA["bluebird"]["pops"]
-        routes = MAP_DATA["bluebird"]["routes"]
-    elif provider == "segra_east":
-        pops, routes = _load_kmz(KMZ_PATH_SEGRA_EAST)
-    elif provider == "segra_west":
-        pops, routes = _load_kmz(KMZ_PATH_SEGRA_WEST)
-    elif provider == "fidium" and kmz_path:
-        pops, routes = _load_kmz(kmz_path)
-        log("Fidium map loaded from %s — %d routes", os.path.basename(kmz_path), len(routes))
-    elif provider == "fna" and fna_member and kmz_path:
-        pops, routes = _load_kmz(kmz_path)
+    # Tile mode: the client pulls routes per viewport from /tiles — only PoPs go in the response
+    tile_provider = _catalog_name_for_path(kmz_path) if use_tiles and kmz_path else None
+
+    if tile_provider:
+        geom = load_geometry(kmz_path)
+        pops = geom.pops() if geom is not None else []
+    elif provider in ("bluebird", "segra_east", "segra_west", "fidium") or (provider == "fna" and fna_member):
+        # Routes ship whole in this mode — take the most detailed light variant within budget
+        map_path = choose_variant(kmz_path, MAP_VERTEX_BUDGET) if kmz_path else None
+        if map_path:
+            pops, routes = _load_kmz(map_path)
+            log("Map routes from %s — %d routes", os.path.basename(map_path), len(routes))
     else:
         pops, routes = [], []
 
-    # === TRUE NEAREST FIBER DISTANCE ===
-    if final_applicant_coords and routes:
+    # === TRUE NEAREST FIBER DISTANCE (spatial index over the same geometry) ===
+    if final_applicant_coords and (routes or tile_provider) and kmz_path:
         app_lat, app_lon = final_applicant_coords
-        min_d = float('inf')
-        nearest_point = None
-        for r in routes:
-            for lat, lon in r["coords"]:
-                d = ((app_lat - lat)**2 + (app_lon - lon)**2)**0.5 * 69
-                if d < min_d:
-                    min_d = d
-                    nearest_point = [lat, lon]
-        if nearest_point:
-            nearest_kmz_coords = nearest_point
-            nearest_fiber_distance = "<1 mi" if min_d < 1 else f"{min_d:.1f} mi"
-
-    dist_info = get_bluebird_distance(full_address)
+        try:
+            geom = load_geometry(kmz_path)
+            hit = geom.spatial_index().nearest(app_lat, app_lon) if geom is not None else None
+            if hit:
+                min_d, near_lat, near_lon, _ = hit
+                nearest_kmz_coords = [near_lat, near_lon]
+                nearest_fiber_distance = format_fiber_distance(min_d)
+        except Exception as e:
+            log("Nearest fiber lookup failed [%s]: %s", kmz_path, e)
+
+    dist_info = get_bluebird_distance(applicant_lat, applicant_lon, k=NEAREST_POPS_K)
 
     log("bbmap response ready — sending to frontend")
     return jsonify({
         "entity_name": entity_name,
         "address": full_address,
         "applicant_coords": final_applicant_coords,
+        "location_accuracy": location_accuracy,
         "pop_city": dist_info['pop_city'],
         "distance": f"{dist_info['distance']:.1f} miles" if dist_info['distance'] != float('inf') else "N/A",
         "coverage": dist_info['coverage'],
+        "nearest_pops": dist_info['nearest'],
         "nearest_kmz_pop": "Nearest fiber",
         "nearest_kmz_coords": nearest_kmz_coords,
         "nearest_fiber_distance": nearest_fiber_distance,
         "pops": pops,
         "routes": routes,
+        "tile_provider": tile_provider,
         "network": provider,
         "fna_member": fna_member
     })
 
+# === BATCH DISTANCES — ONE ROUND TRIP FOR A WHOLE DASHBOARD PAGE ===
+MAX_DISTANCE_BATCH = 500
+
+@erate_bp.route('/distances', methods=['POST'])
+def distances():
+    """
+    {"app_numbers": [...], "network": "bluebird"} → {"distances": {app_number: "N.N mi" | "<1 mi" | "—"}}
+    Same values as /bbmap/<app>?distance_only=1, but one DB query for every applicant and
+    each provider file mapped once for the whole batch. Fresh erate_fiber_distance rows are
+    used as-is; only the rest are computed live, from offline coordinates only (stored lat/lon
+    or ZIP / city centroid) — a page never waits on the geocoder. Applicants that can't be
+    placed offline show "—" until the geocode backfill fills in their coordinates.
+    """
+    data = request.get_json(silent=True) or {}
+    app_numbers = [str(a).strip() for a in data.get('app_numbers') or [] if str(a).strip()]
+    app_numbers = list(dict.fromkeys(app_numbers))[:MAX_DISTANCE_BATCH]
+    if not app_numbers:
+        return jsonify({"distances": {}})
+    network = data.get('network')
+    provider = network if network in PROVIDER_KEYS.values() else _user_provider()
+
+    conn = psycopg.connect(DATABASE_URL, connect_timeout=10)
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT app_number, city, state, zip_code, latitude, longitude
+            FROM erate WHERE app_number = ANY(%s)
+        """, (app_numbers,))
+        rows = cur.fetchall()
+    conn.close()
+
+    applicants = {row[0]: row[1:] for row in rows}
+    stored = _stored_fiber_distances(provider, list(applicants))
+
+    results = {app_number: "—" for app_number in app_numbers}
+    for app_number, miles in stored.items():
+        results[app_number] = format_fiber_distance(miles)
+    for app_number, (city, state, zip_code, db_lat, db_lon) in applicants.items():
+        if app_number in stored:
+            continue
+        lat, lon, _ = _offline_coords(db_lat, db_lon, zip_code, city, state)
+        if not (lat and lon):
+            continue
+        kmz_path = _resolve_kmz_path(provider, state, None, lat, lon)
+        results[app_number] = get_nearest_fiber_distance(lat, lon, kmz_path) or "—"
+
+    log("Batch distances: %d requested, %d found, %d stored, provider=%s",
+        len(app_numbers), len(applicants), len(stored), provider)
+    return jsonify({"distances": results})
+
+# =======================================================
+# === MATERIALIZED FIBER DISTANCES — erate_fiber_distance ===
+# =======================================================
+# One row per (applicant, provider): nearest fiber distance + point, computed in the background
+# after each 470 import and whenever a provider's KMZ files change. Each row records the hash
+# of the applicant inputs it was computed from (coords, state, ZIP, city), where its point
+# came from (stored coords, or ZIP / city centroid + centroid table version) and the provider
+# version (its source fingerprints), so a refresh only recomputes new/changed applicants,
+# centroid-placed applicants after a centroid table rebuild, and changed providers.
+FIBER_DISTANCE_DDL = """
+    CREATE TABLE IF NOT EXISTS erate_fiber_distance (
+        app_number VARCHAR(20) NOT NULL,
+        provider VARCHAR(20) NOT NULL,
+        distance_miles DOUBLE PRECISION,
+        nearest_lat DOUBLE PRECISION,
+        nearest_lon DOUBLE PRECISION,
+        provider_version VARCHAR(16) NOT NULL,
+        input_hash VARCHAR(32) NOT NULL,
+        coords_source VARCHAR(40),
+        computed_at TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (app_number, provider)
+    );
+    ALTER TABLE erate_fiber_distance ADD COLUMN IF NOT EXISTS coords_source VARCHAR(40);
+    CREATE INDEX IF NOT EXISTS idx_fiber_distance_provider ON erate_fiber_distance(provider, distance_miles);
+"""
+# Must match the erate row the distance was computed from — any change to these makes the row stale
+FIBER_INPUT_HASH_SQL = "md5(concat_ws('|', e.latitude::text, e.longitude::text, e.state, e.zip_code, e.city))"
+# coords_source is 'exact' (stored lat/lon) or '<zip|city|none>@<centroid table version>';
+# rows placed without stored coords are only fresh for the centroid table they were placed from
+FIBER_COORDS_FRESH_SQL = "(d.coords_source = 'exact' OR split_part(d.coords_source, '@', 2) = %s)"
+FIBER_DISTANCE_BATCH = 1000
+FIBER_DISTANCE_LOCK_ID = 470018  # pg advisory lock — one refresh at a time across all workers
+ZIP_CENTROID_LOCK_ID = 470021  # pg advisory lock — one centroid table rebuild at a time
+
+_FIBER_REFRESH = {"running": False, "reason": None, "updated": 0, "removed": 0, "started": None, "finished": None}
+_FIBER_REFRESH_LOCK = threading.Lock()
+
+def _provider_source_paths(provider):
+    """Every file _resolve_kmz_path can return for a provider."""
+    if provider == 'segra_east':
+        return [KMZ_PATH_SEGRA_EAST]
+    if provider == 'segra_west':
+        return [KMZ_PATH_SEGRA_WEST]
+    if provider == 'fidium':
+        files = sorted(f for f in os.listdir(FIDUM_REGIONS_DIR) if f.lower().endswith('.kmz')) \
+            if os.path.isdir(FIDUM_REGIONS_DIR) else []
+        return [os.path.join(FIDUM_REGIONS_DIR, f) for f in files] + [KMZ_PATH_BLUEBIRD]
+    if provider == 'fna':
+        return [FNA_MEMBERS[name] for name in sorted(FNA_MEMBERS)] + [KMZ_PATH_BLUEBIRD]
+    return [KMZ_PATH_BLUEBIRD]
+
+def _provider_version(provider):
+    """Short hash of the provider's source fingerprints — changes whenever any of its files do."""
+    parts = [f"{os.path.basename(p)}:{source_fingerprint(p)}" for p in _provider_source_paths(provider)]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+def _centroid_version():
+    return source_fingerprint(ZIP_CENTROIDS_PATH) or "none"
+
+def _coords_source(accuracy, centroid_version):
+    return "exact" if accuracy == "exact" else f"{accuracy or 'none'}@{centroid_version}"
+
+def rebuild_zip_centroids(reason="manual"):
+    """
+    Rebuild zip_centroids.csv from every erate row with coordinates (plus the 470 sample and any
+    ZCTA gazetteer on disk). The shipped table only covers the sample's ZIPs. Returns
+    (zips, cities), or None when another process holds the lock. Every process's index reloads
+    on its next lookup; an unchanged table keeps its fingerprint.
+    """
+    conn = psycopg.connect(DATABASE_URL, connect_timeout=10)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (ZIP_CENTROID_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                log("ZIP centroid rebuild skipped (%s) — another worker is running it", reason)
+                return None
+        t0 = time.time()
+        zips, cities = build_zip_centroids(use_db=True, database_url=DATABASE_URL)
+        log("ZIP centroids rebuilt (%s): %d ZIPs, %d cities in %.1fs", reason, zips, cities, time.time() - t0)
+        return zips, cities
+    finally:
+        conn.close()  # releases the advisory lock
+
+def _fiber_geometry_resolver(provider):
+    """
+    (state, lat, lon) → Geometry for one refresh pass. Same choice as _resolve_kmz_path, but the
+    FNA combined index, each state's file and each loaded geometry are resolved once per pass
+    rather than once per applicant.
+    """
+    combined = None
+    if provider == 'fna':
+        try:
+            combined = load_combined_index(FNA_MEMBERS)
+        except Exception as e:
+            log("FNA combined index unavailable: %s", e)
+    paths, geoms = {}, {}
+
+    def geometry(path):
+        if path not in geoms:
+            try:
+                geoms[path] = load_geometry(path) if path else None
+            except Exception as e:
+                log("Fiber distance failed [%s]: %s", path, e)
+                geoms[path] = None
+        return geoms[path]
+
+    def resolve(state, lat, lon):
+        if provider != 'fna':
+            if state not in paths:
+                paths[state] = _resolve_kmz_path(provider, state, None, lat, lon, quiet=True)
+            return geometry(paths[state])
+        path = KMZ_PATH_BLUEBIRD
+        if combined is not None:
+            try:
+                top = combined.nearest_sources(lat, lon, k=1)
+                if top:
+                    path = FNA_MEMBERS[top[0][0]]
+            except Exception as e:
+                log("FNA closest member error: %s", e)
+        return geometry(path)
+
+    return resolve
+
+def _compute_fiber_distance(resolve, state, lat, lon):
+    """(miles, nearest_lat, nearest_lon) from stored coords, or (None, None, None)."""
+    if not (lat and lon):
+        return None, None, None
+    geom = resolve(state, lat, lon)
+    hit = geom.spatial_index().nearest(lat, lon) if geom is not None else None
+    return (hit[0], hit[1], hit[2]) if hit else (None, None, None)
+
+def _upsert_fiber_distances(conn, batch):
+    with conn.cursor() as cur:
+        cur.executemany("""
+            INSERT INTO erate_fiber_distance
+                (app_number, provider, distance_miles, nearest_lat, nearest_lon, provider_version, input_hash,
+                 coords_source, computed_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
+            ON CONFLICT (app_number, provider) DO UPDATE SET
+                distance_miles = EXCLUDED.distance_miles,
+                nearest_lat = EXCLUDED.nearest_lat,
+                nearest_lon = EXCLUDED.nearest_lon,
+                provider_version = EXCLUDED.provider_version,
+                input_hash = EXCLUDED.input_hash,
+                coords_source = EXCLUDED.coords_source,
+                computed_at = NOW()
+        """, batch)
+    conn.commit()
+
+def refresh_fiber_distances(reason="manual"):
+    """
+    Recompute stale rows for every provider: applicants with no row, whose coords/state
+    changed, whose provider files changed since, or that were placed from an older centroid
+    table. No network: applicants without stored coords are placed at their ZIP / city
+    centroid, or get a NULL distance when neither is known. Returns rows written, or None
+    when another process holds the refresh lock.
+    """
+    conn = psycopg.connect(DATABASE_URL, connect_timeout=10)
+    read_conn = psycopg.connect(DATABASE_URL, connect_timeout=10)
+    updated = 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute(FIBER_DISTANCE_DDL)
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (FIBER_DISTANCE_LOCK_ID,))
+            locked = cur.fetchone()[0]
+        conn.commit()
+        if not locked:
+            log("Fiber distance refresh skipped (%s) — another worker is running it", reason)
+            return None
+        log("Fiber distance refresh started (%s)", reason)
+        t0 = time.time()
+
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM erate_fiber_distance d
+                WHERE NOT EXISTS (SELECT 1 FROM erate e WHERE e.app_number = d.app_number)
+            """)
+            removed = cur.rowcount
+        conn.commit()
+
+        centroid_version = _centroid_version()
+        for provider in PROVIDER_KEYS.values():
+            version = _provider_version(provider)
+            resolve = _fiber_geometry_resolver(provider)
+            count = 0
+            # Server-side cursor: stale rows stream in FIBER_DISTANCE_BATCH at a time
+            with read_conn.cursor(name=f"fiber_stale_{provider}") as rc:
+                rc.itersize = FIBER_DISTANCE_BATCH
+                rc.execute(f"""
+                    SELECT e.app_number, e.state, e.zip_code, e.city, e.latitude, e.longitude, {FIBER_INPUT_HASH_SQL}
+                    FROM erate e
+                    LEFT JOIN erate_fiber_distance d ON d.app_number = e.app_number AND d.provider = %s
+                    WHERE d.app_number IS NULL
+                       OR d.provider_version <> %s
+                       OR d.input_hash <> {FIBER_INPUT_HASH_SQL}
+                       OR d.coords_source IS NULL
+                       OR NOT {FIBER_COORDS_FRESH_SQL}
+                """, (provider, version, centroid_version))
+                batch = []
+                for app_number, state, zip_code, city, db_lat, db_lon, input_hash in rc:
+                    lat, lon, accuracy = _offline_coords(db_lat, db_lon, zip_code, city, state)
+                    miles, near_lat, near_lon = _compute_fiber_distance(resolve, state, lat, lon)
+                    batch.append((app_number, provider, miles, near_lat, near_lon, version, input_hash,
+                                  _coords_source(accuracy, centroid_version)))
+                    if len(batch) >= FIBER_DISTANCE_BATCH:
+                        _upsert_fiber_distances(conn, batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    _upsert_fiber_distances(conn, batch)
+                    count += len(batch)
+            read_conn.commit()
+            if count:
+                log("Fiber distances [%s]: %d rows recomputed (version %s)", provider, count, version)
+            updated += count
+            with _FIBER_REFRESH_LOCK:
+                _FIBER_REFRESH["updated"] = updated
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (FIBER_DISTANCE_LOCK_ID,))
+        conn.commit()
+        with _FIBER_REFRESH_LOCK:
+            _FIBER_REFRESH["removed"] = removed
+        log("Fiber distance refresh complete (%s): %d rows in %.1fs, %d removed", reason, updated, time.time() - t0, removed)
+        return updated
+    finally:
+        read_conn.close()
+        conn.close()  # also releases the advisory lock if we bailed out early
+
+def _fiber_refresh_thread(reason):
+    try:
+        refresh_fiber_distances(reason)
+    except Exception as e:
+        log("Fiber distance refresh FAILED (%s): %s", reason, e)
+        log("Traceback: %s", traceback.format_exc())
+    finally:
+        with _FIBER_REFRESH_LOCK:
+            _FIBER_REFRESH["running"] = False
+            _FIBER_REFRESH["finished"] = time.time()
+
+def start_fiber_distance_refresh(reason):
+    """Refresh in a background thread. False if this process already has one running."""
+    with _FIBER_REFRESH_LOCK:
+        if _FIBER_REFRESH["running"]:
+            return False
+        _FIBER_REFRESH.update(running=True, reason=reason, updated=0, removed=0, started=time.time(), finished=None)
+    thread = threading.Thread(target=_fiber_refresh_thread, args=(reason,), daemon=True)
+    thread.start()
+    return True
+
+def _stored_fiber_distances(provider, app_numbers):
+    """
+    {app_number: miles} for rows still fresh (same provider version, same applicant inputs).
+    Missing or stale applicants are left out — callers compute those live. A stale provider
+    version also kicks off a background refresh.
+    """
+    if not app_numbers:
+        return {}
+    version = _provider_version(provider)
+    try:
+        conn = psycopg.connect(DATABASE_URL, connect_timeout=10)
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT d.app_number, d.distance_miles, d.provider_version
+                FROM erate_fiber_distance d
+                JOIN erate e ON e.app_number = d.app_number
+                WHERE d.provider = %s AND d.app_number = ANY(%s)
+                  AND d.input_hash = {FIBER_INPUT_HASH_SQL}
+                  AND {FIBER_COORDS_FRESH_SQL}
+                  AND d.distance_miles IS NOT NULL
+            """, (provider, list(app_numbers), _centroid_version()))
+            rows = cur.fetchall()
+        conn.close()
+    except Exception as e:
+        log("Stored fiber distances unavailable: %s", e)
+        return {}
+    if any(row_version != version for _, _, row_version in rows):
+        start_fiber_distance_refresh(f"{provider} files changed")
+    return {app_number: miles for app_number, miles, row_version in rows if row_version == version}
+
+@erate_bp.route('/fiber-distances/refresh', methods=['POST'])
+def fiber_distances_refresh():
+    if not session.get('is_santo'):
+        return jsonify({"error": "Admin only"}), 403
+    started = start_fiber_distance_refresh("manual")
+    with _FIBER_REFRESH_LOCK:
+        status = dict(_FIBER_REFRESH)
+    return jsonify({"started": started, **status})
+
+# =======================================================
+# === GEOHASH PROXIMITY SEARCH — RADIUS / BBOX WITHOUT POSTGIS ===
+# =======================================================
+# erate.geohash is set at import time (see _row_to_tuple) and backfilled for older rows.
+# COLLATE "C" keeps the btree in plain byte order, so each covering cell is one range scan.
+# The column + index are created by the import and the backfill, never by a request; the
+# index is built CONCURRENTLY so erate stays writable meanwhile.
+GEOHASH_DDL = (
+    'ALTER TABLE erate ADD COLUMN IF NOT EXISTS geohash VARCHAR(12) COLLATE "C"',
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_erate_geohash ON erate(geohash)",
+)
+GEOHASH_BACKFILL_BATCH = 5000
+GEOHASH_LOCK_ID = 470019
+NEARBY_DEFAULT_LIMIT = 100
+NEARBY_MAX_LIMIT = 1000
+NEARBY_MAX_MILES = 500
+NEARBY_CANDIDATE_FACTOR = 2  # radius queries fetch limit × this, nearest first (approx.), then filter exactly
+
+_GEOHASH_READY = False
+_GEOHASH_BACKFILL_RUNNING = threading.Event()
+
+def _ensure_geohash_column():
+    """Add the geohash column + index once per process (no-op when they exist). Jobs only."""
+    global _GEOHASH_READY
+    if _GEOHASH_READY:
+        return
+    conn = psycopg.connect(DATABASE_URL, connect_timeout=10, autocommit=True)
+    try:
+        with conn.cursor() as cur:
+            for statement in GEOHASH_DDL:  # CONCURRENTLY can't share a statement batch
+                cur.execute(statement)
+        _GEOHASH_READY = True
+    finally:
+        conn.close()
+
+def backfill_geohash(reason="manual"):
+    """Fill geohash for rows with coordinates but no cell. Returns rows updated (None if locked)."""
+    _ensure_geohash_column()
+    conn = psycopg.connect(DATABASE_URL, connect_timeout=10)
+    updated = 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (GEOHASH_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                return None
+            while True:
+                cur.execute("""
+                    SELECT app_number, latitude, longitude FROM erate
+                    WHERE geohash IS NULL AND latitude <> 0 AND longitude <> 0
+                    LIMIT %s
+                """, (GEOHASH_BACKFILL_BATCH,))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                cur.executemany("UPDATE erate SET geohash = %s WHERE app_number = %s",
+                                [(geohash_encode(float(lat), float(lon)), app_number) for app_number, lat, lon in rows])
+                conn.commit()
+                updated += len(rows)
+            cur.execute("SELECT pg_advisory_unlock(%s)", (GEOHASH_LOCK_ID,))
+        conn.commit()
+        if updated:
+            log("Geohash backfill (%s): %d rows", reason, updated)
+        return updated
+    finally:
+        conn.close()
+
+def _geohash_backfill_thread(reason):
+    try:
+        backfill_geohash(reason)
+    except Exception as e:
+        log("Geohash backfill FAILED (%s): %s", reason, e)
+    finally:
+        _GEOHASH_BACKFILL_RUNNING.clear()
+
+def start_geohash_backfill(reason):
+    """Backfill in a background thread. False if this process already has one running."""
+    if _GEOHASH_BACKFILL_RUNNING.is_set():
+        return False
+    _GEOHASH_BACKFILL_RUNNING.set()
+    threading.Thread(target=_geohash_backfill_thread, args=(reason,), daemon=True).start()
+    return True
+
+@erate_bp.route('/geohash-backfill', methods=['POST'])
+def geohash_backfill():
+    if not session.get('is_santo'):
+        return jsonify({"error": "Admin only"}), 403
+    return jsonify({"started": start_geohash_backfill("manual")})
+
+def _parse_floats(text, count):
+    try:
+        values = [float(v) for v in (text or '').split(',')]
+    except ValueError:
+        return None
+    return values if len(values) == count else None
+
+@erate_bp.route('/nearby')
+def nearby():
+    """
+    Applicants near a point, a PoP or inside a box:
+      ?lat=..&lon=..&miles=N      radius around a point (closest first)
+      ?pop=Tulsa, OK&miles=N      radius around a Bluebird PoP
+      ?bbox=min_lat,min_lon,max_lat,max_lon
+    Optional &state=XX, &limit=N. Candidates come from geohash range scans, then an exact
+    bbox / haversine filter. Radius queries fetch at most limit × NEARBY_CANDIDATE_FACTOR
+    candidates, ordered by approximate (equirectangular) distance in SQL.
+    """
+    limit = min(max(request.args.get('limit', NEARBY_DEFAULT_LIMIT, type=int), 1), NEARBY_MAX_LIMIT)
+    state_filter = request.args.get('state', '').strip().upper()
+    center, miles = None, None
+
+    bbox = request.args.get('bbox')
+    if bbox:
+        box = _parse_floats(bbox, 4)
+        if not box:
+            return jsonify({"error": "bbox must be min_lat,min_lon,max_lat,max_lon"}), 400
+        min_lat, min_lon, max_lat, max_lon = box
+    else:
+        miles = request.args.get('miles', type=float)
+        if not miles or miles <= 0 or miles > NEARBY_MAX_MILES:
+            return jsonify({"error": f"miles must be between 0 and {NEARBY_MAX_MILES}"}), 400
+        pop = request.args.get('pop')
+        if pop:
+            if pop not in pop_data:
+                return jsonify({"error": "Unknown PoP"}), 404
+            center = pop_data[pop]
+        else:
+            lat, lon = request.args.get('lat', type=float), request.args.get('lon', type=float)
+            if lat is None or lon is None:
+                return jsonify({"error": "lat/lon, pop or bbox required"}), 400
+            center = (lat, lon)
+        min_lat, max_lat, min_lon, max_lon = radius_box(center[0], center[1], miles)
+
+    if min_lat > max_lat or min_lon > max_lon:
+        return jsonify({"error": "Empty box"}), 400
+
+    ranges = cover_ranges(min_lat, max_lat, min_lon, max_lon)
+    cell_clause, params = ranges_sql(ranges)
+    sql = f"""
+        SELECT app_number, entity_name, city, state, funding_year, latitude, longitude
+        FROM erate
+        WHERE {cell_clause}
+          AND latitude BETWEEN %s AND %s AND longitude BETWEEN %s AND %s
+    """
+    params += [min_lat, max_lat, min_lon, max_lon]
+    if state_filter:
+        sql += " AND state = %s"
+        params.append(state_filter)
+    if center is None:
+        sql += " ORDER BY last_modified_datetime DESC, app_number LIMIT %s"
+        params.append(limit)
+    else:
+        # Planar distance with longitude scaled at the centre — same order as haversine to
+        # well within the candidate margin at these radii
+        sql += """ ORDER BY (latitude - %s) * (latitude - %s)
+                          + (longitude - %s) * (longitude - %s) * %s
+                   LIMIT %s"""
+        cos_lat = cos(radians(center[0]))
+        params += [center[0], center[0], center[1], center[1], cos_lat * cos_lat,
+                   limit * NEARBY_CANDIDATE_FACTOR]
+
+    t0 = time.time()
+    conn = psycopg.connect(DATABASE_URL, connect_timeout=10)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+    except psycopg.errors.UndefinedColumn:
+        return jsonify({"error": "Proximity index not built yet — run an import or the geohash backfill"}), 503
+    finally:
+        conn.close()
+
+    if center is not None:
+        hits = within_radius(rows, center[0], center[1], miles)[:limit]
+    else:
+        hits = [(None, row) for row in rows]
+
+    applicants = [{
+        "app_number": row[0],
+        "entity_name": row[1],
+        "city": row[2],
+        "state": row[3],
+        "funding_year": row[4],
+        "latitude": float(row[5]),
+        "longitude": float(row[6]),
+        "distance_miles": round(d, 2) if d is not None else None,
+    } for d, row in hits]
+
+    log("Nearby: %d cell ranges, %d candidates, %d returned in %.0fms",
+        len(ranges), len(rows), len(applicants), (time.time() - t0) * 1000)
+    return jsonify({
+        "center": list(center) if center else None,
+        "miles": miles,
+        "bbox": [min_lat, min_lon, max_lat, max_lon],
+        "count": len(applicants),
+        "applicants": applicants,
+    })
+
+# =======================================================
+# === GEOCODING BACKFILL — WRITE COORDS BACK TO erate / erate2 ===
+# =======================================================
+# Rows imported with 0/NULL coordinates are geocoded once in the background (through the
+# shared geocode cache, so repeated addresses cost one lookup) and written back, so request
+# paths read stored coordinates instead of geocoding. Progress lives in geocode_backfill_run,
+# rows that could not be placed in geocode_backfill_log.
+GEOCODE_BACKFILL_DDL = """
+    CREATE TABLE IF NOT EXISTS geocode_backfill_run (
+        run_id SERIAL PRIMARY KEY,
+        reason TEXT,
+        status VARCHAR(20) NOT NULL DEFAULT 'running',
+        total INTEGER NOT NULL DEFAULT 0,
+        done INTEGER NOT NULL DEFAULT 0,
+        geocoded INTEGER NOT NULL DEFAULT 0,
+        not_found INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        started_at TIMESTAMP DEFAULT NOW(),
+        finished_at TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS geocode_backfill_log (
+        id BIGSERIAL PRIMARY KEY,
+        run_id INTEGER NOT NULL,
+        table_name VARCHAR(10) NOT NULL,
+        app_number VARCHAR(20) NOT NULL,
+        address TEXT,
+        outcome VARCHAR(10) NOT NULL,
+        message TEXT,
+        created_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+GEOCODE_BACKFILL_WORKERS = int(os.getenv('GEOCODE_BACKFILL_WORKERS', '4'))  # paced by GEOCODER_MIN_INTERVAL
+GEOCODE_BACKFILL_COMMIT_EVERY = 200
+GEOCODE_BACKFILL_LOCK_ID = 470022
+
+# table, key column, address1, address2, city, state, zip, extra SET clause
+GEOCODE_BACKFILL_TABLES = (
+    ("erate", "app_number", "address1", "address2", "city", "state", "zip_code", ", geohash = %s"),
+    ("erate2", "application_number", "billed_entity_address1", "billed_entity_address2",
+     "billed_entity_city", "billed_entity_state", "billed_entity_zip_code", ""),
+)
+
+_GEOCODE_BACKFILL_RUNNING = threading.Event()
+
+def _missing_coordinate_rows(cur, table, key, address1, address2, city, state, zip_code):
+    """{full address: [keys]} for rows with no usable coordinates."""
+    cur.execute(f"""
+        SELECT {key}, {address1}, {address2}, {city}, {state}, {zip_code} FROM {table}
+        WHERE latitude IS NULL OR longitude IS NULL OR latitude = 0 OR longitude = 0
+    """)
+    by_address = {}
+    for row_key, a1, a2, c, st, z in cur.fetchall():
+        if a1 or c or z:
+            by_address.setdefault(_full_address(a1, a2, c, st, z), []).append(row_key)
+    return by_address
+
+def _abort_orphaned_backfill_runs(cur):
+    """Mark 'running' runs as aborted — only call while holding GEOCODE_BACKFILL_LOCK_ID."""
+    cur.execute("""
+        UPDATE geocode_backfill_run SET status = 'aborted', finished_at = NOW()
+        WHERE status = 'running'
+    """)
+    if cur.rowcount:
+        log("Geocode backfill: %d orphaned run(s) marked aborted", cur.rowcount)
+
+def backfill_geocodes(reason="manual"):
+    """
+    Geocode every erate / erate2 row with missing coordinates on a small thread pool and write
+    the results back. Returns the run id, or None when another process is already running it.
+    """
+    conn = psycopg.connect(DATABASE_URL, connect_timeout=10)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(GEOCODE_BACKFILL_DDL)
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (GEOCODE_BACKFILL_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                conn.commit()
+                log("Geocode backfill skipped (%s) — already running elsewhere", reason)
+                return None
+            # We hold the lock, so any run still marked running died with its process
+            _abort_orphaned_backfill_runs(cur)
+            work = [(spec, _missing_coordinate_rows(cur, *spec[:7])) for spec in GEOCODE_BACKFILL_TABLES]
+            total = sum(len(by_address) for _, by_address in work)
+            cur.execute("INSERT INTO geocode_backfill_run (reason, total) VALUES (%s, %s) RETURNING run_id",
+                        (reason, total))
+            run_id = cur.fetchone()[0]
+        conn.commit()
+        log("Geocode backfill #%s started (%s): %d addresses", run_id, reason, total)
+
+        counts = {"done": 0, "geocoded": 0, "not_found": 0, "failed": 0}
+        erate_changed = False
+        with ThreadPoolExecutor(max_workers=GEOCODE_BACKFILL_WORKERS) as pool, conn.cursor() as cur:
+            for (table, key, _, _, _, _, _, extra_set), by_address in work:
+                futures = {pool.submit(cached_geocode, address, DATABASE_URL, True): address
+                           for address in by_address}
+                for future in as_completed(futures):
+                    address = futures[future]
+                    keys = by_address[address]
+                    try:
+                        lat, lon = future.result()
+                        outcome, message = ("ok", None) if lat is not None else ("not_found", None)
+                    except Exception as e:
+                        lat = lon = None
+                        outcome, message = "error", str(e)[:500]
+                    if outcome == "ok":
+                        params = [lat, lon] + ([geohash_encode(lat, lon)] if extra_set else []) + [keys]
+                        cur.execute(f"UPDATE {table} SET latitude = %s, longitude = %s{extra_set} "
+                                    f"WHERE {key} = ANY(%s)", params)
+                        counts["geocoded"] += 1
+                        erate_changed = erate_changed or table == "erate"
+                    else:
+                        cur.executemany("""
+                            INSERT INTO geocode_backfill_log (run_id, table_name, app_number, address, outcome, message)
+                            VALUES (%s, %s, %s, %s, %s, %s)
+                        """, [(run_id, table, k, address, outcome, message) for k in keys])
+                        counts["not_found" if outcome == "not_found" else "failed"] += 1
+                    counts["done"] += 1
+                    if counts["done"] % GEOCODE_BACKFILL_COMMIT_EVERY == 0:
+                        cur.execute("""
+                            UPDATE geocode_backfill_run SET done = %s, geocoded = %s, not_found = %s, failed = %s
+                            WHERE run_id = %s
+                        """, (counts["done"], counts["geocoded"], counts["not_found"], counts["failed"], run_id))
+                        conn.commit()
+                        log("Geocode backfill #%s: %d / %d", run_id, counts["done"], total)
+            cur.execute("""
+                UPDATE geocode_backfill_run SET done = %s, geocoded = %s, not_found = %s, failed = %s,
+                    status = 'finished', finished_at = NOW()
+                WHERE run_id = %s
+            """, (counts["done"], counts["geocoded"], counts["not_found"], counts["failed"], run_id))
+            cur.execute("SELECT pg_advisory_unlock(%s)", (GEOCODE_BACKFILL_LOCK_ID,))
+        conn.commit()
+        log("Geocode backfill #%s complete: %d geocoded, %d not found, %d failed",
+            run_id, counts["geocoded"], counts["not_found"], counts["failed"])
+        if erate_changed:
+            start_fiber_distance_refresh("geocode backfill")
+        return run_id
+    finally:
+        conn.close()
+
+def _geocode_backfill_thread(reason):
+    try:
+        backfill_geocodes(reason)
+    except Exception as e:
+        log("Geocode backfill FAILED (%s): %s", reason, e)
+        log("Traceback: %s", traceback.format_exc())
+    finally:
+        _GEOCODE_BACKFILL_RUNNING.clear()
+
+def start_geocode_backfill(reason):
+    """Backfill in a background thread. False if this process already has one running."""
+    if _GEOCODE_BACKFILL_RUNNING.is_set():
+        return False
+    _GEOCODE_BACKFILL_RUNNING.set()
+    threading.Thread(target=_geocode_backfill_thread, args=(reason,), daemon=True).start()
+    return True
+
+@erate_bp.route('/geocode-backfill', methods=['POST'])
+def geocode_backfill():
+    if not session.get('is_santo'):
+        return jsonify({"error": "Admin only"}), 403
+    return jsonify({"started": start_geocode_backfill("manual")})
+
+@erate_bp.route('/geocode-backfill-status')
+def geocode_backfill_status():
+    """Latest run's progress plus its most recent failures."""
+    if not session.get('is_santo'):
+        return jsonify({"error": "Admin only"}), 403
+    conn = psycopg.connect(DATABASE_URL, connect_timeout=10)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(GEOCODE_BACKFILL_DDL)
+            cur.execute("""
+                SELECT run_id, reason, status, total, done, geocoded, not_found, failed, started_at, finished_at
+                FROM geocode_backfill_run ORDER BY run_id DESC LIMIT 1
+            """)
+            row = cur.fetchone()
+            if not row:
+                return jsonify({"run": None, "running": _GEOCODE_BACKFILL_RUNNING.is_set()})
+            run = dict(zip(("run_id", "reason", "status", "total", "done", "geocoded",
+                            "not_found", "failed", "started_at", "finished_at"), row))
+            if run["status"] == 'running':
+                # Free lock = nobody is running it: the run's process died mid-way
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (GEOCODE_BACKFILL_LOCK_ID,))
+                if cur.fetchone()[0]:
+                    _abort_orphaned_backfill_runs(cur)
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (GEOCODE_BACKFILL_LOCK_ID,))
+                    cur.execute("SELECT status, finished_at FROM geocode_backfill_run WHERE run_id = %s",
+                                (run["run_id"],))
+                    run["status"], run["finished_at"] = cur.fetchone()
+            cur.execute("""
+                SELECT table_name, app_number, address, outcome, message FROM geocode_backfill_log
+                WHERE run_id = %s ORDER BY id DESC LIMIT 50
+            """, (run["run_id"],))
+            failures = [dict(zip(("table", "app_number", "address", "outcome", "message"), r))
+                        for r in cur.fetchall()]
+        conn.commit()
+    finally:
+        conn.close()
+    for field in ("started_at", "finished_at"):
+        run[field] = run[field].isoformat() if run[field] else None
+    return jsonify({"run": run, "failures": failures, "running": _GEOCODE_BACKFILL_RUNNING.is_set()})
+
 # === DASHBOARD (WITH AUTH CHECK + ADVANCED TEXT FILTER PARSING + DUAL C1/C2 SUFFIX) ===
 @erate_bp.route('/')
 def dashboard():
@@ -938,12 +1606,17 @@ def dashboard():
 
     # LOGGED-IN USER
     # DEDUCT POINT ON ANY FILTER
-    if any(request.args.get(k) for k in ['state', 'modified_after', 'text']):
+    if any(request.args.get(k) for k in ['state', 'modified_after', 'text', 'max_miles']):
         deduct_point()
 
     state_filter = request.args.get('state', '').strip().upper()
     modified_after_str = request.args.get('modified_after', '').strip()
     raw_text = request.args.get('text', '').strip()
+    max_miles_str = request.args.get('max_miles', '').strip()
+    try:
+        max_miles = float(max_miles_str) if max_miles_str else None
+    except ValueError:
+        max_miles, max_miles_str = None, ''
     offset = max(int(request.args.get('offset', 0)), 0)
     limit = 10
 
@@ -1007,6 +1680,16 @@ def dashboard():
                 if search_clauses:
                     where_clauses.append('(' + ' AND '.join(search_clauses) + ')')
 
+            # === DISTANCE FILTER — READS erate_fiber_distance FOR THE USER'S NETWORK ===
+            distance_provider = _user_provider() if max_miles is not None else None
+            if distance_provider:
+                where_clauses.append(
+                    'app_number IN (SELECT app_number FROM erate_fiber_distance '
+                    'WHERE provider = %s AND distance_miles <= %s)'
+                )
+                count_params.extend([distance_provider, max_miles])
+                params.extend([distance_provider, max_miles])
+
             # Total count query
             count_sql = 'SELECT COUNT(*) FROM erate'
             if where_clauses:
@@ -1023,7 +1706,15 @@ def dashboard():
             if where_clauses:
                 sql += ' WHERE ' + ' AND '.join(where_clauses)
 
-            sql += ' ORDER BY last_modified_datetime DESC, app_number LIMIT %s OFFSET %s'
+            if distance_provider:
+                # Closest first when filtering by distance
+                sql += '''
+                ORDER BY (SELECT distance_miles FROM erate_fiber_distance d
+                          WHERE d.app_number = erate.app_number AND d.provider = %s), app_number
+                LIMIT %s OFFSET %s'''
+                params.append(distance_provider)
+            else:
+                sql += ' ORDER BY last_modified_datetime DESC, app_number LIMIT %s OFFSET %s'
             params.extend([limit + 1, offset])
             cur.execute(sql, params)
             rows = cur.fetchall()
@@ -1077,7 +1768,8 @@ def dashboard():
             filters={
                 'state': state_filter,
                 'modified_after': modified_after_str,
-                'text': raw_text
+                'text': raw_text,
+                'max_miles': max_miles_str
             },
             total_count=total_count,
             total_filtered=total_filtered,
@@ -1561,17 +2253,57 @@ def import_interactive():
     return render_template('erate_import.html', progress=progress, is_importing=is_importing)
 
 def _import_all_background(app):
+    """
+    Stream the CSV through COPY into a temp staging table and merge each chunk into erate
+    with one INSERT ... ON CONFLICT. Existing app_numbers are preloaded into a set, so
+    duplicates (already in erate or repeated in the CSV) never leave this process.
+    """
     global CSV_HEADERS_LOGGED, ROW_DEBUG_COUNT
     CSV_HEADERS_LOGGED = False
     ROW_DEBUG_COUNT = 0
+    conn = None
     log("=== IMPORT STARTED — DEBUG ENABLED ===")
     try:
         log("Bulk import started")
+        t0 = time.time()
         with app.app_context():
             total = app.config['import_total']
             start_index = app.config['import_index']
+        _ensure_geohash_column()  # IMPORT_COLUMNS writes it
         conn = psycopg.connect(DATABASE_URL, autocommit=False, connect_timeout=10)
+
+        with conn.cursor(name="erate_import_keys") as keys:
+            keys.itersize = 50000
+            keys.execute("SELECT app_number FROM erate")
+            seen = {row[0] for row in keys}
+        conn.commit()
+        log("Preloaded %s existing app_numbers", len(seen))
+
         cur = conn.cursor()
+        cur.execute(IMPORT_STAGING_DDL)
+        conn.commit()
+
+        def flush(chunk, rows_read):
+            """COPY + merge one chunk; returns rows actually inserted."""
+            inserted = 0
+            if chunk:
+                try:
+                    with cur.copy(IMPORT_COPY_SQL) as copy:
+                        for values in chunk:
+                            copy.write_row(values)
+                    cur.execute(IMPORT_MERGE_SQL)
+                    inserted = cur.rowcount
+                    conn.commit()  # ON COMMIT DELETE ROWS empties the staging table
+                except Exception as e:
+                    log("COMMIT FAILED: %s", e)
+                    conn.rollback()
+                    raise
+            with app.app_context():
+                app.config['import_index'] += rows_read
+                app.config['import_success'] += inserted
+                log("Progress: %s / %s (+%s inserted)", app.config['import_index'], total, inserted)
+            return inserted
+
         with open(CSV_FILE, 'r', encoding='utf-8-sig', newline='') as f:
             reader = csv.DictReader(f, dialect='excel')
             log("CSV reader created with excel dialect")
@@ -1579,66 +2311,27 @@ def _import_all_background(app):
                 try: next(reader)
                 except StopIteration: break
             log("Skipped to record %s", start_index)
-            batch = []
-            imported = 0
-            last_heartbeat = time.time()
+            chunk = []
+            rows_read = 0
             for row in reader:
-                if time.time() - last_heartbeat > 5:
-                    log("HEARTBEAT: %s rows processed", imported)
-                    last_heartbeat = time.time()
-                app_number = row.get('Application Number', '').strip()
-                if not app_number: continue
-                batch.append(row)
-                imported += 1
-                if len(batch) >= 1000:
-                    cur.execute(
-                        "SELECT app_number FROM erate WHERE app_number = ANY(%s)",
-                        ([r['Application Number'] for r in batch],)
-                    )
-                    existing = {row[0] for row in cur.fetchall()}
-                    filtered_batch = [r for r in batch if r['Application Number'] not in existing]
-                    if filtered_batch:
-                        try:
-                            cur.executemany(INSERT_SQL, [_row_to_tuple(r) for r in filtered_batch])
-                            conn.commit()
-                            log("COMMITTED BATCH OF %s", len(filtered_batch))
-                            cur.execute("SELECT COUNT(*) FROM erate WHERE app_number = ANY(%s)",
-                                        ([r['Application Number'] for r in filtered_batch],))
-                            actual = cur.fetchone()[0]
-                            log("VERIFIED: %s rows", actual)
-                        except Exception as e:
-                            log("COMMIT FAILED: %s", e)
-                            conn.rollback()
-                            raise
-                    with app.app_context():
-                        app.config['import_index'] += len(batch)
-                        app.config['import_success'] += len(filtered_batch)
-                        log("Progress: %s / %s", app.config['import_index'], total)
-                    batch = []
-            if batch:
-                cur.execute(
-                    "SELECT app_number FROM erate WHERE app_number = ANY(%s)",
-                    ([r['Application Number'] for r in batch],)
-                )
-                existing = {row[0] for row in cur.fetchall()}
-                filtered_batch = [r for r in batch if r['Application Number'] not in existing]
-                if filtered_batch:
+                rows_read += 1
+                app_number = (row.get('Application Number') or '').strip()
+                if app_number and app_number not in seen:
                     try:
-                        cur.executemany(INSERT_SQL, [_row_to_tuple(r) for r in filtered_batch])
-                        conn.commit()
-                        log("FINAL BATCH COMMITTED: %s", len(filtered_batch))
-                        cur.execute("SELECT COUNT(*) FROM erate WHERE app_number = ANY(%s)",
-                                    ([r['Application Number'] for r in filtered_batch],))
-                        actual = cur.fetchone()[0]
-                        log("FINAL VERIFIED: %s rows", actual)
-                    except Exception as e:
-                        log("FINAL COMMIT FAILED: %s", e)
-                        conn.rollback()
-                        raise
-                with app.app_context():
-                    app.config['import_index'] = total + 1
-                    app.config['import_success'] += len(filtered_batch)
-        log("Bulk import complete: %s imported", app.config['import_success'])
+                        chunk.append(_row_to_tuple(row))
+                        seen.add(app_number)
+                    except (ValueError, TypeError) as e:
+                        with app.app_context():
+                            app.config['import_error'] += 1
+                        log("Row %s skipped (%s): %s", app_number, type(e).__name__, e)
+                # rows_read too: a re-import that skips nearly everything still reports progress
+                if len(chunk) >= IMPORT_CHUNK_ROWS or rows_read >= IMPORT_CHUNK_ROWS:
+                    flush(chunk, rows_read)
+                    chunk, rows_read = [], 0
+            flush(chunk, rows_read)
+        with app.app_context():
+            app.config['import_index'] = total + 1
+        log("Bulk import complete: %s imported in %.0fs", app.config['import_success'], time.time() - t0)
     except Exception as e:
         log("IMPORT thread CRASHED: %s", e)
         log("Traceback: %s", traceback.format_exc())
@@ -1648,6 +2341,13 @@ def _import_all_background(app):
         with app.app_context():
             app.config['BULK_IMPORT_IN_PROGRESS'] = False
         log("Import thread finished")
+        try:
+            rebuild_zip_centroids("470 import")  # before the refresh, which places rows from it
+        except Exception as e:
+            log("ZIP centroid rebuild FAILED (470 import): %s", e)
+        start_geohash_backfill("470 import")
+        start_fiber_distance_refresh("470 import")
+        start_geocode_backfill("470 import")
 
 @erate_bp.route('/view-log')
 def view_log():
@@ -1670,74 +2370,122 @@ def reset_import():
 # =====================================================
 # === HASH-BASED SMART IMPORT — FULL RUN MODE (SAFE) ===
 # =====================================================
+HASH_IMPORT_STAGING_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS hash_import_staging (
+        seq BIGINT,
+        app_number VARCHAR(20),
+        row_hash VARCHAR(32),
+        payload JSONB
+    )
+"""
+HASH_IMPORT_PROGRESS_EVERY = 50000
+
+def _hash_import_rows(valid_columns):
+    """Stream (app_number, row_hash, clean_row) from the CSV — same hash as always, one row in memory."""
+    with open(CSV_FILE, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            app_number = (row.get('Applicant #') or row.get('Application Number') or '').strip()
+            if not app_number:
+                continue
+
+            clean_row = {}
+            for k, v in row.items():
+                db_col = k.strip()
+                if db_col in ['Application Number', 'Applicant #']:
+                    continue
+                if db_col in ['Billed Entity Name', 'BEN Name']:
+                    db_col = 'entity_name'
+                if db_col in ['Form Nickname', 'Nickname']:
+                    db_col = 'form_nickname'
+                if db_col in valid_columns:
+                    clean_row[db_col] = v or ''
+
+            row_hash = hashlib.md5(str(sorted(clean_row.items())).encode()).hexdigest()
+            yield app_number, row_hash, clean_row
+
 def run_full_hash_import(app, username):
+    """
+    Set-based smart import: stream (app_number, row hash, mapped values) through COPY into a
+    temp table, find changed rows with one join against erate_hash, then apply every change
+    with one UPDATE ... FROM and one hash upsert. Memory stays at one CSV row.
+    """
     with app.app_context():
         log(f"=== FULL SMART HASH IMPORT STARTED (BACKGROUND) — User: {username} ===")
         start_time = time.time()
+        conn = None
 
         try:
-            with open(CSV_FILE, 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                rows = list(reader)
-
             conn = psycopg.connect(DATABASE_URL)
-            updated = 0
-
             with conn.cursor() as cur:
-                cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name='erate' AND column_name != 'app_number'")
-                valid_columns = {row[0] for row in cur.fetchall()}
-
-                for i, row in enumerate(rows, 1):
-                    if i % 5000 == 0:
-                        elapsed = int(time.time() - start_time)
-                        log(f"PROGRESS: {i:,}/{len(rows):,} rows | Updated: {updated} | Elapsed: {elapsed}s")
-
-                    app_number = (row.get('Applicant #') or row.get('Application Number') or '').strip()
-                    if not app_number:
-                        continue
-
-                    cur.execute("SELECT 1 FROM erate WHERE app_number = %s", (app_number,))
-                    if not cur.fetchone():
-                        continue
-
-                    clean_row = {}
-                    for k, v in row.items():
-                        db_col = k.strip()
-                        if db_col in ['Application Number', 'Applicant #']:
-                            continue
-                        if db_col in ['Billed Entity Name', 'BEN Name']:
-                            db_col = 'entity_name'
-                        if db_col in ['Form Nickname', 'Nickname']:
-                            db_col = 'form_nickname'
-                        if db_col in valid_columns:
-                            clean_row[db_col] = v or ''
-
-                    row_hash = hashlib.md5(str(sorted(clean_row.items())).encode()).hexdigest()
-
-                    cur.execute("SELECT row_hash FROM erate_hash WHERE app_number = %s", (app_number,))
-                    db_hash = cur.fetchone()
-
-                    if db_hash and db_hash[0] != row_hash:
-                        update_parts = [f'"{k}"=%s' for k in clean_row]
-                        cur.execute(f"UPDATE erate SET {', '.join(update_parts)} WHERE app_number = %s",
-                                    list(clean_row.values()) + [app_number])
-                        cur.execute("""INSERT INTO erate_hash (app_number, row_hash) VALUES (%s,%s) 
-                                       ON CONFLICT (app_number) DO UPDATE SET row_hash = EXCLUDED.row_hash""",
-                                    (app_number, row_hash))
-                        updated += 1
-
-                        if updated % 1000 == 0:
-                            conn.commit()
-
-                conn.commit()
+                cur.execute("""
+                    SELECT column_name, data_type FROM information_schema.columns
+                    WHERE table_name='erate' AND column_name != 'app_number'
+                """)
+                column_types = dict(cur.fetchall())
+                valid_columns = set(column_types)
+
+                cur.execute(HASH_IMPORT_STAGING_DDL)
+                cur.execute("TRUNCATE hash_import_staging")
+                streamed = 0
+                mapped_columns = set()
+                with cur.copy("COPY hash_import_staging (seq, app_number, row_hash, payload) FROM STDIN") as copy:
+                    for app_number, row_hash, clean_row in _hash_import_rows(valid_columns):
+                        streamed += 1
+                        mapped_columns.update(clean_row)
+                        copy.write_row((streamed, app_number, row_hash, json.dumps(clean_row)))
+                        if streamed % HASH_IMPORT_PROGRESS_EVERY == 0:
+                            elapsed = int(time.time() - start_time)
+                            log(f"PROGRESS: {streamed:,} rows staged | Elapsed: {elapsed}s")
+
+                # Last CSV row per app_number wins; only rows already in erate with a different stored hash
+                cur.execute("""
+                    CREATE TEMP TABLE hash_import_changed ON COMMIT DROP AS
+                    SELECT DISTINCT ON (s.app_number) s.app_number, s.row_hash, s.payload
+                    FROM hash_import_staging s
+                    JOIN erate_hash h ON h.app_number = s.app_number
+                    WHERE EXISTS (SELECT 1 FROM erate e WHERE e.app_number = s.app_number)
+                    ORDER BY s.app_number, s.seq DESC
+                """)
+                cur.execute("""
+                    DELETE FROM hash_import_changed c USING erate_hash h
+                    WHERE h.app_number = c.app_number AND h.row_hash = c.row_hash
+                """)
+                cur.execute("SELECT COUNT(*) FROM hash_import_changed")
+                updated = cur.fetchone()[0]
+
+                if updated and mapped_columns:
+                    columns = sorted(mapped_columns)
+                    assignments = [
+                        f'"{col}" = (c.payload ->> %s)::{column_types[col]}' if column_types[col] in ('text', 'character varying')
+                        else f'"{col}" = NULLIF(c.payload ->> %s, \'\')::{column_types[col]}'
+                        for col in columns
+                    ]
+                    if 'latitude' in mapped_columns or 'longitude' in mapped_columns:
+                        assignments.append('"geohash" = NULL')  # re-set by the geohash backfill
+                    cur.execute(f"""
+                        UPDATE erate e SET {', '.join(assignments)}
+                        FROM hash_import_changed c
+                        WHERE e.app_number = c.app_number
+                    """, columns)
+                    cur.execute("""
+                        INSERT INTO erate_hash (app_number, row_hash)
+                        SELECT app_number, row_hash FROM hash_import_changed
+                        ON CONFLICT (app_number) DO UPDATE SET row_hash = EXCLUDED.row_hash
+                    """)
+                cur.execute("TRUNCATE hash_import_staging")
+            conn.commit()
 
             total_time = int(time.time() - start_time)
-            log(f"FULL SMART HASH IMPORT FINISHED — Updated {updated} records in {total_time}s")
+            log(f"FULL SMART HASH IMPORT FINISHED — {streamed:,} rows, updated {updated} records in {total_time}s")
+            if updated:
+                start_geohash_backfill("hash import")
+                start_fiber_distance_refresh("hash import")
 
         except Exception as e:
             log(f"SMART HASH IMPORT FAILED: {e}")
         finally:
-            conn.close()
+            if conn is not None:
+                conn.close()
 
 @erate_bp.route('/import-hash')
 def import_hash_start():
@@ -1890,6 +2638,7 @@ def _import471_all_background(app):
         with app.app_context():
             app.config['IMPORT471_IN_PROGRESS'] = False
         log("471 Import thread finished")
+        start_geocode_backfill("471 import")
 
 def _process_471_batch(cur, conn, app, batch, total):
     # Safe numeric conversion
@@ -2261,101 +3010,29 @@ def user_settings():
 def coverage_report():
     view = request.args.get('view', 'by_provider')  # by_provider or by_state
 
-    import zipfile
-    import xml.etree.ElementTree as ET
     from collections import defaultdict
-    import os
-
-    # === STATE BOUNDS ===
-    STATE_BOUNDS = {
-        "AL": (30.2, 35.0, -88.5, -84.9), "AK": (51.2, 71.4, -179.2, -129.9),
-        "AZ": (31.3, 37.0, -114.8, -109.0), "AR": (33.0, 36.5, -94.6, -89.6),
-        "CA": (32.5, 42.0, -124.4, -114.1), "CO": (37.0, 41.0, -109.1, -102.0),
-        "CT": (40.9, 42.1, -73.7, -71.8), "DE": (38.4, 39.8, -75.8, -75.0),
-        "FL": (24.5, 31.0, -87.6, -80.0), "GA": (30.4, 35.0, -85.6, -80.8),
-        "ID": (42.0, 49.0, -117.0, -111.0), "IL": (37.0, 42.5, -91.5, -87.5),
-        "IN": (37.8, 41.8, -88.1, -84.8), "IA": (40.4, 43.5, -96.6, -90.1),
-        "KS": (37.0, 40.0, -102.1, -94.6), "KY": (36.5, 39.1, -89.6, -81.9),
-        "LA": (28.9, 33.0, -94.0, -88.8), "ME": (43.1, 47.5, -71.1, -66.9),
-        "MD": (37.9, 39.7, -79.5, -75.0), "MA": (41.2, 42.9, -73.5, -69.9),
-        "MI": (41.7, 48.3, -90.4, -82.4), "MN": (43.5, 49.4, -97.2, -89.5),
-        "MS": (30.2, 35.0, -91.7, -88.1), "MO": (36.0, 40.6, -95.8, -89.1),
-        "MT": (44.4, 49.0, -116.0, -104.0), "NE": (40.0, 43.0, -104.1, -95.3),
-        "NV": (35.0, 42.0, -120.0, -114.0), "NH": (42.7, 45.3, -72.6, -70.6),
-        "NJ": (38.9, 41.4, -75.6, -73.9), "NM": (31.3, 37.0, -109.1, -103.0),
-        "NY": (40.5, 45.0, -79.8, -71.9), "NC": (33.8, 36.6, -84.3, -75.4),
-        "ND": (45.9, 49.0, -104.1, -96.5), "OH": (38.4, 41.9, -84.8, -80.5),
-        "OK": (33.6, 37.0, -103.0, -94.4), "OR": (42.0, 46.3, -124.6, -116.5),
-        "PA": (39.7, 42.3, -80.6, -74.7), "RI": (41.1, 42.0, -71.9, -71.1),
-        "SC": (32.0, 35.2, -83.4, -78.5), "SD": (42.5, 45.9, -104.1, -96.5),
-        "TN": (34.9, 36.7, -90.3, -81.6), "TX": (25.8, 36.5, -106.6, -93.5),
-        "UT": (37.0, 42.0, -114.1, -109.0), "VT": (42.7, 45.0, -73.4, -71.5),
-        "VA": (36.5, 39.5, -83.7, -75.2), "WA": (45.5, 49.0, -124.8, -116.9),
-        "WV": (37.2, 40.6, -82.6, -77.7), "WI": (42.5, 47.1, -92.9, -86.8),
-        "WY": (41.0, 45.0, -111.1, -104.1)
-    }
 
-    def point_in_state(lat, lon):
-        for state, (min_lat, max_lat, min_lon, max_lon) in STATE_BOUNDS.items():
-            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
-                return state
-        return None
-
-    # Build coverage
-    provider_to_states = defaultdict(set)
-    state_to_providers = defaultdict(set)
-
-    # Bluebird Network
-    if os.path.exists(KMZ_PATH_BLUEBIRD):
-        with zipfile.ZipFile(KMZ_PATH_BLUEBIRD, 'r') as kmz:
-            kml_files = [f for f in kmz.namelist() if f.lower().endswith('.kml')]
-            if kml_files:
-                root = ET.fromstring(kmz.read(kml_files[0]))
-                ns = {'kml': 'http://www.opengis.net/kml/2.2'}
-                for coord_elem in root.findall('.//kml:coordinates', ns):
-                    if coord_elem.text:
-                        for point in coord_elem.text.strip().split():
-                            parts = point.split(',')
-                            if len(parts) >= 2:
-                                try:
-                                    lon, lat = float(parts[0]), float(parts[1])
-                                    state = point_in_state(lat, lon)
-                                    if state:
-                                        provider_to_states["Bluebird Network"].add(state)
-                                        state_to_providers[state].add("Bluebird Network")
-                                except:
-                                    pass
-
-    # FNA Members
+    # Provider files → display names (Bluebird + every FNA member)
+    sources = {KMZ_PATH_BLUEBIRD: "Bluebird Network"}
     for filename in os.listdir(FNA_MEMBERS_DIR):
         if not filename.lower().endswith('.kmz'):
             continue
         member_name = os.path.splitext(filename)[0].replace('_', ' ').strip()
-        path = os.path.join(FNA_MEMBERS_DIR, filename)
-        if not os.path.exists(path):
-            continue
-        try:
-            with zipfile.ZipFile(path, 'r') as kmz:
-                kml_files = [f for f in kmz.namelist() if f.lower().endswith('.kml')]
-                if not kml_files:
-                    continue
-                root = ET.fromstring(kmz.read(kml_files[0]))
-                ns = {'kml': 'http://www.opengis.net/kml/2.2'}
-                for coord_elem in root.findall('.//kml:coordinates', ns):
-                    if coord_elem.text:
-                        for point in coord_elem.text.strip().split():
-                            parts = point.split(',')
-                            if len(parts) >= 2:
-                                try:
-                                    lon, lat = float(parts[0]), float(parts[1])
-                                    state = point_in_state(lat, lon)
-                                    if state:
-                                        provider_to_states[member_name].add(state)
-                                        state_to_providers[state].add(member_name)
-                                except:
-                                    pass
-        except:
-            pass
+        sources[os.path.join(FNA_MEMBERS_DIR, filename)] = member_name
+
+    etag, last_modified = _source_validators(sources, f"coverage-report|{view}|{grid_version()}")
+    cached = _not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
+    # Fingerprint-keyed coverage — geometry is only touched for files that changed
+    provider_to_states = defaultdict(set)
+    state_to_providers = defaultdict(set)
+    for path, states in coverage_for_paths(sources).items():
+        provider_name = sources[path]
+        for state in states:
+            provider_to_states[provider_name].add(state)
+            state_to_providers[state].add(provider_name)
 
     # === RETURN PURE LIST — NO HEADERS, NO BUTTONS ===
     lines = []
@@ -2368,70 +3045,83 @@ def coverage_report():
             states = sorted(provider_to_states[provider])
             lines.append(f"<strong>{provider}</strong>: {', '.join(states) or 'None'}")
 
-    return "<br>".join(lines), 200, {'Content-Type': 'text/html; charset=utf-8'}
+    resp = Response("<br>".join(lines), 200, {'Content-Type': 'text/html; charset=utf-8'})
+    return _with_validators(resp, etag, last_modified)
+
+# =======================================================
+# === CONDITIONAL GET — VALIDATORS FROM SOURCE FINGERPRINTS ===
+# =======================================================
+def _source_validators(paths, variant=""):
+    """(etag, last_modified) for a response built only from these files + request variant."""
+    parts, newest = [variant], 0
+    for path in sorted(set(paths)):
+        fingerprint = source_fingerprint(path)
+        if fingerprint is None:
+            continue
+        parts.append(f"{path}|{fingerprint}")
+        newest = max(newest, os.path.getmtime(path))
+    etag = hashlib.sha1("\n".join(parts).encode('utf-8')).hexdigest()[:20]
+    last_modified = datetime.fromtimestamp(int(newest), timezone.utc) if newest else None
+    return etag, last_modified
+
+def _not_modified(etag, last_modified):
+    """304 if the client's cached copy is still current, else None — checked before any work."""
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        fresh = bool(last_modified and request.if_modified_since
+                     and last_modified <= request.if_modified_since)
+    if not fresh:
+        return None
+    return _with_validators(Response(status=304), etag, last_modified)
+
+def _with_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'public, no-cache'  # cache, but revalidate
+    return response
 
 # =======================================================
 # === FULL NATIONAL MAP =================================
 # =======================================================
 @erate_bp.route('/coverage-map-data')
 def coverage_map_data():
+    try:
+        tolerance = _requested_lod_tolerance(None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # One listing for both the validator and the stream, so a member file added or removed
+    # since import changes the ETag exactly when it changes the body
+    fna_files = sorted(f for f in os.listdir(FNA_MEMBERS_DIR) if f.lower().endswith('.kmz')) \
+        if os.path.isdir(FNA_MEMBERS_DIR) else []
+    fna_paths = [os.path.join(FNA_MEMBERS_DIR, f) for f in fna_files]
+    etag, last_modified = _source_validators([KMZ_PATH_BLUEBIRD] + fna_paths,
+                                             f"{request.query_string.decode()}|{'|'.join(fna_files)}")
+    cached = _not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
     print("\n=== NATIONAL FIBER MAP – NDJSON STREAMING v4 – INSTANT RENDER ===")
+    polyline = request.args.get('format') == 'polyline'
 
     def process_kmz(kmz_path, provider_name, color):
-        if not os.path.exists(kmz_path):
-            print(f" [MISSING] {kmz_path}")
-            return
-
         try:
-            with zipfile.ZipFile(kmz_path, 'r') as z:
-                kml_files = [f for f in z.namelist() if f.lower().endswith('.kml')]
-                if not kml_files:
-                    return
-
-                root = ET.fromstring(z.read(kml_files[0]))
-                ns = {'kml': 'http://www.opengis.net/kml/2.2'}
-                added = 0
-
-                # Standard LineString parsing
-                for coord_elem in root.findall('.//kml:LineString/kml:coordinates', ns):
-                    if not coord_elem.text:
-                        continue
-                    coords = []
-                    for token in coord_elem.text.strip().split():
-                        parts = token.split(',')
-                        if len(parts) >= 2:
-                            try:
-                                lon = float(parts[0])
-                                lat = float(parts[1])
-                                coords.append([lat, lon])
-                            except:
-                                continue
-                    if len(coords) >= 2:
-                        line = {"name": provider_name, "color": color, "coords": coords}
-                        yield json.dumps(line, separators=(',', ':')) + '\n'
-                        added += 1
-
-                # Segra West gx:Track fallback
-                if added == 0 and 'segra' in provider_name.lower() and 'west' in provider_name.lower():
-                    gx_ns = 'http://www.google.com/kml/ext/2.2'
-                    for track in root.findall(f'.//{{{gx_ns}}}Track'):
-                        coords = []
-                        for coord in track.findall(f'{{{gx_ns}}}coord'):
-                            if coord.text:
-                                parts = coord.text.strip().split()
-                                if len(parts) >= 2:
-                                    try:
-                                        lon = float(parts[0])
-                                        lat = float(parts[1])
-                                        coords.append([lat, lon])
-                                    except:
-                                        continue
-                            if len(coords) >= 2:
-                                line = {"name": provider_name, "color": color, "coords": coords}
-                                yield json.dumps(line, separators=(',', ':')) + '\n'
-                                added += 1
-
-                print(f" → {provider_name}: {added} lines streamed")
+            geom = load_geometry(kmz_path)
+            if geom is None:
+                print(f" [MISSING] {kmz_path}")
+                return
+            lod = geom.lod(tolerance)
+            if polyline:
+                yield from _polyline_ndjson(lod, provider_name, color)
+                print(f" → {provider_name}: {lod.n_routes} lines streamed (polyline)")
+                return
+            added = 0
+            for _, coords in lod.iter_routes():
+                line = {"name": provider_name, "color": color, "coords": coords}
+                yield json.dumps(line, separators=(',', ':')) + '\n'
+                added += 1
+            print(f" → {provider_name}: {added} lines streamed")
         except Exception as e:
             print(f" [ERROR] {kmz_path}: {e}")
 
@@ -2440,15 +3130,103 @@ def coverage_map_data():
             yield from process_kmz(KMZ_PATH_BLUEBIRD, "Bluebird Network", "#0066cc")
 
         colors = ["#dc3545","#28a745","#fd7e14","#6f42c1","#20c997","#e83e8c","#6610f2","#17a2b8","#ffc107","#6c757d"]
+        for idx, (f, path) in enumerate(zip(fna_files, fna_paths)):
+            name = os.path.splitext(f)[0].replace('_', ' ').title()
+            yield from process_kmz(path, name, colors[idx % len(colors)])
+
+    return _with_validators(Response(generate(), mimetype='application/x-ndjson'), etag, last_modified)
+
+def _requested_lod_tolerance(default):
+    """
+    Simplification tolerance (degrees) from ?tolerance= or ?zoom=, else `default`.
+    Raises ValueError (→ 400) for a non-numeric, non-finite or negative tolerance and for
+    a zoom outside 0–22.
+    """
+    if request.args.get('tolerance'):
+        try:
+            tolerance = float(request.args['tolerance'])
+        except ValueError:
+            raise ValueError("tolerance must be a number") from None
+        if not isfinite(tolerance) or tolerance < 0:
+            raise ValueError("tolerance must be a finite, non-negative number of degrees")
+        return tolerance
+    if request.args.get('zoom'):
+        try:
+            zoom = float(request.args['zoom'])
+        except ValueError:
+            raise ValueError("zoom must be a number") from None
+        if not (0 <= zoom <= 22):  # also rejects nan / inf
+            raise ValueError("zoom must be between 0 and 22")
+        return lod_tolerance_for_zoom(int(zoom))
+    return default
+
+POLYLINE_BATCH = 500  # routes per NDJSON line in ?format=polyline streams
+
+def _polyline_ndjson(geom, name, color):
+    """?format=polyline — {"name", "color", "p": [encoded polyline, ...]} per batch of routes."""
+    encoded = [p for _, p in geom.encoded_routes()]
+    for i in range(0, len(encoded), POLYLINE_BATCH):
+        line = {"name": name, "color": color, "p": encoded[i:i + POLYLINE_BATCH]}
+        yield json.dumps(line, separators=(',', ':')) + '\n'
+
+# === FIBER PROVIDER CATALOG (display name → source file) ===
+FNA_COLORS = ["#dc3545","#28a745","#fd7e14","#6f42c1","#20c997","#e83e8c","#6610f2","#17a2b8","#ffc107","#6c757d"]
+
+def _provider_catalog():
+    """{display name: (path, color)} for every fiber file that exists — same names as /providers."""
+    catalog = {
+        "Bluebird Network": (KMZ_PATH_BLUEBIRD, "#0066cc"),
+        "Segra East": (KMZ_PATH_SEGRA_EAST, "#ff6600"),
+        "Segra West": (KMZ_PATH_SEGRA_WEST, "#ffaa00"),
+        "CDT": ("CDT.kml", "#00ff00"),
+    }
+    if os.path.isdir(FIDUM_REGIONS_DIR):
+        for f in sorted(os.listdir(FIDUM_REGIONS_DIR)):
+            if f.lower().endswith('.kmz'):
+                region = os.path.splitext(f)[0].replace("Fidium", "").strip()
+                display_name = f"Fidium Network ({region})" if region else "Fidium Network"
+                catalog[display_name] = (os.path.join(FIDUM_REGIONS_DIR, f), "#9932CC")
+    if os.path.isdir(FNA_MEMBERS_DIR):
         idx = 0
-        if os.path.isdir(FNA_MEMBERS_DIR):
-            for f in sorted(os.listdir(FNA_MEMBERS_DIR)):
-                if f.lower().endswith('.kmz'):
-                    name = os.path.splitext(f)[0].replace('_', ' ').title()
-                    yield from process_kmz(os.path.join(FNA_MEMBERS_DIR, f), name, colors[idx % len(colors)])
-                    idx += 1
+        for f in sorted(os.listdir(FNA_MEMBERS_DIR)):
+            if f.lower().endswith('.kmz'):
+                name = os.path.splitext(f)[0].replace('_', ' ').title()
+                catalog[name] = (os.path.join(FNA_MEMBERS_DIR, f), FNA_COLORS[idx % len(FNA_COLORS)])
+                idx += 1
+    return {name: entry for name, entry in catalog.items() if os.path.exists(entry[0])}
+
+def _catalog_name_for_path(path):
+    target = os.path.abspath(path)
+    for name, (entry_path, _) in _provider_catalog().items():
+        if os.path.abspath(entry_path) == target:
+            return name
+    return None
 
-    return Response(generate(), mimetype='application/x-ndjson')
+# === FIBER TILES — ONLY WHAT IS ON SCREEN ===
+@erate_bp.route('/tiles/<provider>/<int:z>/<int:x>/<int:y>')
+def fiber_tile(provider, z, x, y):
+    if z > TILE_MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({"error": "Tile out of range"}), 404
+    catalog = _provider_catalog()
+    if provider.lower() == "all":
+        sources = [(name, color, path) for name, (path, color) in catalog.items()]
+    elif provider in catalog:
+        path, color = catalog[provider]
+        sources = [(provider, color, path)]
+    else:
+        return jsonify({"error": "Unknown provider"}), 404
+    etag, last_modified = _source_validators([path for _, _, path in sources], f"{provider}/{z}/{x}/{y}")
+    cached = _not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+    try:
+        data = get_tile(provider, sources, z, x, y)
+    except Exception as e:
+        log("Tile error [%s %d/%d/%d]: %s", provider, z, x, y, e)
+        return jsonify({"error": "Tile failed"}), 500
+    response = _with_validators(Response(data, mimetype='application/json'), etag, last_modified)
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
 
 # =======================================================
 # === FINAL NATIONAL MAP — STRICT SINGLE PROVIDER + ALL SUPPORT ===
@@ -2459,124 +3237,43 @@ def national_map():
 
 @erate_bp.route('/stream-national')
 def stream_national():
+    try:
+        tolerance = _requested_lod_tolerance(0.001)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    catalog_paths = [path for path, _ in _provider_catalog().values()]
+    etag, last_modified = _source_validators(catalog_paths, request.query_string.decode())
+    cached = _not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
     print("=== STREAMING NATIONAL FIBER MAP — STRICT SINGLE PROVIDER + ALL ===")
     requested_provider = request.args.get('provider', '').strip()
     requested_lower = requested_provider.lower() if requested_provider else ""
     print(f"Provider selected: '{requested_provider}' (lower: '{requested_lower}')")
+    polyline = request.args.get('format') == 'polyline'
 
-    import zipfile
-    import xml.etree.ElementTree as ET
-    import json
-    import re
-    import os
-
-    # === DOUGLAS-PEUCKER SIMPLIFICATION ===
-    def simplify_coords(points, tolerance):
-        if len(points) <= 2:
-            return points
-        max_dist = 0
-        index = 0
-        end = len(points) - 1
-        for i in range(1, end):
-            dist = perpendicular_distance(points[i], points[0], points[end])
-            if dist > max_dist:
-                index = i
-                max_dist = dist
-        if max_dist > tolerance:
-            left = simplify_coords(points[:index + 1], tolerance)
-            right = simplify_coords(points[index:], tolerance)
-            return left[:-1] + right
-        else:
-            return [points[0], points[end]]
-
-    def perpendicular_distance(point, line_start, line_end):
-        x0, y0 = point
-        x1, y1 = line_start
-        x2, y2 = line_end
-        if line_start == line_end:
-            return ((x0 - x1)**2 + (y0 - y1)**2)**0.5
-        numerator = abs((y2 - y1) * x0 - (x2 - x1) * y0 + x2 * y1 - y2 * x1)
-        denominator = ((y2 - y1)**2 + (x2 - x1)**2)**0.5
-        return numerator / denominator if denominator != 0 else 0
-
-    # === STREAM KMZ ===
+    # === STREAM KMZ / KML (compiled geometry) ===
     def stream_kmz(path, name, color):
-        if not os.path.exists(path):
-            print(f"Missing KMZ: {path}")
-            return
-        try:
-            with zipfile.ZipFile(path, 'r') as z:
-                kml_files = [f for f in z.namelist() if f.lower().endswith('.kml')]
-                if not kml_files:
-                    return
-                root = ET.fromstring(z.read(kml_files[0]))
-                ns = {'kml': 'http://www.opengis.net/kml/2.2'}
-                count = 0
-                coord_split = re.compile(r'\s+')
-                tolerance = 0.001
-                for coords_elem in root.findall('.//kml:LineString/kml:coordinates', ns):
-                    if not coords_elem.text:
-                        continue
-                    tokens = coord_split.split(coords_elem.text.strip())
-                    raw_points = []
-                    for token in tokens:
-                        if not token:
-                            continue
-                        parts = token.split(',')
-                        if len(parts) >= 2:
-                            try:
-                                lon = float(parts[0])
-                                lat = float(parts[1])
-                                raw_points.append((lat, lon))
-                            except ValueError:
-                                continue
-                    if len(raw_points) < 2:
-                        continue
-                    simplified = simplify_coords(raw_points, tolerance)
-                    if len(simplified) >= 2:
-                        yield json.dumps({"name": name, "color": color, "coords": simplified}) + "\n"
-                        count += 1
-                print(f" → {name}: {count} lines streamed")
-        except Exception as e:
-            print(f"KMZ error {path}: {e}")
-
-    # === STREAM KML (CDT) ===
-    def stream_kml(path, name, color):
-        if not os.path.exists(path):
-            print(f"Missing KML: {path}")
-            return
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                root = ET.fromstring(f.read())
-            ns = {'kml': 'http://www.opengis.net/kml/2.2'}
+            geom = load_geometry(path)
+            if geom is None:
+                print(f"Missing KMZ: {path}")
+                return
+            # Precompiled pyramid level — no simplification work per request
+            lod = geom.lod(tolerance)
+            if polyline:
+                yield from _polyline_ndjson(lod, name, color)
+                print(f" → {name}: {lod.n_routes} lines streamed (polyline)")
+                return
             count = 0
-            coord_split = re.compile(r'\s+')
-            tolerance = 0.001
-            for coords_elem in root.findall('.//kml:LineString/kml:coordinates', ns):
-                if not coords_elem.text:
-                    continue
-                tokens = coord_split.split(coords_elem.text.strip())
-                raw_points = []
-                for token in tokens:
-                    if not token:
-                        continue
-                    parts = token.split(',')
-                    if len(parts) >= 2:
-                        try:
-                            lon = float(parts[0])
-                            lat = float(parts[1])
-                            raw_points.append((lat, lon))
-                        except ValueError:
-                            continue
-                if len(raw_points) < 2:
-                    continue
-                simplified = simplify_coords(raw_points, tolerance)
-                if len(simplified) >= 2:
-                    yield json.dumps({"name": name, "color": color, "coords": simplified}) + "\n"
+            for _, coords in lod.iter_routes():
+                if len(coords) >= 2:
+                    yield json.dumps({"name": name, "color": color, "coords": coords}) + "\n"
                     count += 1
             print(f" → {name}: {count} lines streamed")
         except Exception as e:
-            print(f"KML error {path}: {e}")
+            print(f"KMZ error {path}: {e}")
 
     def generate():
         # === ALL PROVIDERS ===
@@ -2621,7 +3318,7 @@ def stream_national():
             # CDT
             if os.path.exists("CDT.kml"):
                 print("STREAMING CDT")
-                yield from stream_kml("CDT.kml", "CDT", "#00ff00")
+                yield from stream_kmz("CDT.kml", "CDT", "#00ff00")
 
             # All FNA members
             fna_dir = "fna_members"
@@ -2665,7 +3362,7 @@ def stream_national():
             elif "cdt" in requested_lower:
                 if os.path.exists("CDT.kml"):
                     print("STREAMING CDT ONLY")
-                    yield from stream_kml("CDT.kml", "CDT", "#00ff00")
+                    yield from stream_kmz("CDT.kml", "CDT", "#00ff00")
 
             # FNA member — only trigger if provider looks like FNA member name
             elif os.path.isdir("fna_members") and "fidium" not in requested_lower:
@@ -2709,7 +3406,7 @@ def stream_national():
             else:
                 print("Unknown provider — streaming nothing")
 
-    return Response(generate(), mimetype='application/x-ndjson')
+    return _with_validators(Response(generate(), mimetype='application/x-ndjson'), etag, last_modified)
     
 # =======================================================
 # === RETURN STATE BOUNDS  =================================
@@ -2748,13 +3445,23 @@ def state_bounds():
         "VA": [[36.5, -83.7], [39.5, -75.2]],
         "WV": [[37.2, -82.6], [40.6, -77.7]]
     }
-    return jsonify(bounds)
+    etag = hashlib.sha1(json.dumps(bounds, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+    cached = _not_modified(etag, None)
+    if cached is not None:
+        return cached
+    return _with_validators(jsonify(bounds), etag, None)
 
 # =======================================================
 # === UPDATED: RETURN PROVIDERS INCLUDING SPLIT FIDUM REGIONS ===
 # =======================================================
 @erate_bp.route('/providers')
 def providers():
+    catalog_paths = [path for path, _ in _provider_catalog().values()]
+    etag, last_modified = _source_validators(catalog_paths, "providers")
+    cached = _not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
     providers = ["Bluebird Network", "CDT"]
 
     # FNA Members (from fna_members directory)
@@ -2796,7 +3503,136 @@ def providers():
     unique_providers = sorted(set(providers))
 
     print(f"Providers endpoint returning: {unique_providers}")  # Helpful for debugging
-    return jsonify(unique_providers)
+    return _with_validators(jsonify(unique_providers), etag, last_modified)
+
+# =======================================================
+# === GEOMETRY WARM-UP — COMPILE EVERY PROVIDER FILE ON ALL CORES ===
+# =======================================================
+GEOMETRY_WARMUP_LOCK_ID = 470013  # pg advisory lock — one worker warms the shared cache
+_WARMUP_ON_FIRST_REQUEST = False
+_WARMUP_STARTED = False
+
+def _geometry_warmup_stages():
+    """Jobs run in the warm-up pool once every provider file is compiled: [(label, fn, args)]."""
+    catalog = _provider_catalog()
+    tile_providers = {name: [(name, color, path)] for name, (path, color) in catalog.items()}
+    tile_providers["all"] = [(name, color, path) for name, (path, color) in catalog.items()]
+    return [
+        ("seed tiles", seed_tiles, (tile_providers, geo.GEOMETRY_CACHE_DIR)),
+        ("light variants", build_light_variants, (None, LIGHT_TOLERANCES, geo.GEOMETRY_CACHE_DIR)),
+        # Pick up KMZ files changed by a deploy and rows imported before the geohash column
+        # existed — in a pool process, so a fresh deploy's full recompute never holds a web
+        # worker's GIL (each takes its own advisory lock and is cheap when nothing is stale).
+        # Centroids first: the refresh re-places rows whose centroid table changed.
+        ("zip centroids", rebuild_zip_centroids, ("warm-up",)),
+        ("geohash backfill", backfill_geohash, ("warm-up",)),
+        ("fiber distances", refresh_fiber_distances, ("warm-up",)),
+    ]
+
+def _geometry_warmup_job(reason):
+    """Blocking warm-up under the cross-worker lock; other workers skip and just mmap the results."""
+    paths = [path for path, _ in _provider_catalog().values()]
+    conn = None
+    try:
+        conn = psycopg.connect(DATABASE_URL, connect_timeout=10, autocommit=True)
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (GEOMETRY_WARMUP_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                log("Geometry warm-up skipped (%s) — another worker is running it", reason)
+                return
+    except Exception as e:
+        log("Geometry warm-up lock unavailable, warming anyway: %s", e)
+    try:
+        log("Geometry warm-up started (%s)", reason)
+        warm_all(paths, stages=_geometry_warmup_stages())
+    except Exception as e:
+        log("Geometry warm-up FAILED (%s): %s", reason, e)
+    finally:
+        if conn is not None:
+            conn.close()  # releases the advisory lock
+
+def start_geometry_warmup(reason="manual"):
+    """Compile the whole provider catalog (+ LOD pyramid) in a process pool. False if already running."""
+    if warmup_status()["running"]:
+        return False
+    threading.Thread(target=_geometry_warmup_job, args=(reason,), daemon=True).start()
+    return True
+
+def schedule_geometry_warmup():
+    """Warm up from each worker's first request — after fork, with the port already bound."""
+    global _WARMUP_ON_FIRST_REQUEST
+    _WARMUP_ON_FIRST_REQUEST = True
+
+@erate_bp.before_app_request
+def _start_geometry_warmup_once():
+    global _WARMUP_STARTED
+    if not _WARMUP_ON_FIRST_REQUEST or _WARMUP_STARTED:
+        return
+    _WARMUP_STARTED = True
+    start_geometry_warmup("worker start")
+
+def preload_geometry():
+    """
+    Map every already-compiled provider file, its LOD levels and the FNA combined index into
+    this process — called in the gunicorn master under --preload, so workers inherit it on
+    fork. Nothing is compiled here: the master must bind the port quickly, so missing or
+    stale artifacts are left to the background warm-up (and compile lazily on first use).
+    Geometry is mmap'd read-only columns (shared page cache, no per-vertex objects);
+    gc.freeze() keeps the collector from writing to the few Python objects that remain, so
+    their pages stay shared too.
+    """
+    import gc
+    paths = [path for path, _ in _provider_catalog().values()]
+    mapped = 0
+    for path in paths:
+        fingerprint = source_fingerprint(path)
+        if fingerprint is None or not os.path.exists(geo_artifact_path(path, fingerprint)):
+            continue
+        try:
+            geom = load_geometry(path)
+            for tolerance in LOD_TOLERANCES:
+                if os.path.exists(lod_artifact_path(path, fingerprint, tolerance)):
+                    geom.lod(tolerance)
+            mapped += 1
+        except Exception as e:
+            log("Preload failed [%s]: %s", path, e)
+    if mapped == len(paths):
+        load_combined_index(FNA_MEMBERS)
+        bluebird_pop_index()
+    state_grid()
+    centroid_index()
+    gc.collect()
+    gc.freeze()
+    log("Preloaded geometry for %d of %d provider files", mapped, len(paths))
+
+@erate_bp.route('/warmup', methods=['POST'])
+def warmup():
+    if not session.get('is_santo'):
+        return jsonify({"error": "Admin only"}), 403
+    started = start_geometry_warmup("manual")
+    return jsonify({"started": started, **warmup_status()})
+
+@erate_bp.route('/warmup-status')
+def warmup_progress():
+    if not session.get('is_santo'):
+        return jsonify({"error": "Admin only"}), 403
+    return jsonify(warmup_status())
+
+@erate_bp.route('/kmz-cache-stats')
+def kmz_cache_stats():
+    if not session.get('is_santo'):
+        return jsonify({"error": "Admin only"}), 403
+    with _KMZ_CACHE_LOCK:
+        stats = dict(KMZ_CACHE_STATS)
+        stats["paths"] = [os.path.basename(p) for p in _KMZ_CACHE]
+    stats["budget"] = KMZ_CACHE_BYTES
+    return jsonify(stats)
+
+@erate_bp.route('/geocode-stats')
+def geocode_stats():
+    if not session.get('is_santo'):
+        return jsonify({"error": "Admin only"}), 403
+    return jsonify(dict(GEOCODE_STATS))
 
 # === ADD TO EXPORT FILE ON CLICK =======================
 @erate_bp.route('/add-to-export', methods=['POST'])
@@ -2938,31 +3774,7 @@ def guest_reset():
 
 @erate_bp.route('/get-provider')
 def get_provider():
-    provider = 'bluebird'  # default for guest
-    if 'username' in session:
-        try:
-            conn = psycopg.connect(DATABASE_URL)
-            with conn.cursor() as cur:
-                cur.execute('SELECT "Provider" FROM users WHERE username = %s', (session['username'],))
-                row = cur.fetchone()
-            conn.close()
-            if row and row[0]:
-                provider_raw = row[0].strip()
-                if provider_raw == 'Segra EAST':
-                    provider = 'segra_east'
-                elif provider_raw == 'Segra WEST':
-                    provider = 'segra_west'
-                elif provider_raw == 'FNA Network':
-                    provider = 'fna'
-                elif provider_raw == 'Bluebird Network':
-                    provider = 'bluebird'
-                elif provider_raw == 'Fidium Network':  # NEW: Fidium support
-                    provider = 'fidium'
-                else:
-                    provider = 'bluebird'
-        except Exception as e:
-            log("Failed to get provider: %s", e)
-    return jsonify({'provider': provider})
+    return jsonify({'provider': _user_provider()})
 
 @erate_bp.route('/set-network', methods=['POST'])
 def set_network():
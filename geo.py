@@ -0,0 +1,777 @@
+# geo.py — Compiled fiber geometry: KMZ/KML → columnar binary cache, memory-mapped at read time
+# Every provider file (Bluebird, Segra, Fidium regions, FNA members, CDT) is parsed ONCE per
+# source version into a flat artifact under geometry_cache/. Request handlers only mmap it.
+
+import os
+import json
+import mmap
+import struct
+import hashlib
+import logging
+import tempfile
+import zipfile
+import threading
+import xml.etree.ElementTree as ET
+from array import array
+from itertools import repeat
+from math import radians, degrees, cos, sin, tan, sqrt, atan2
+
+from simplify import simplify
+
+logger = logging.getLogger('erate.geo')
+
+# === PATHS / FORMAT ===
+GEOMETRY_CACHE_DIR = os.getenv(
+    'GEOMETRY_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "geometry_cache")
+)
+
+KML_NS = 'http://www.opengis.net/kml/2.2'
+GX_NS = 'http://www.google.com/kml/ext/2.2'
+
+ARTIFACT_MAGIC = b'M4GEO\x00\x00\x00'
+ARTIFACT_VERSION = 3
+# magic, version, n_vertices, n_routes, n_pops, names_len, n_index_nodes,
+# footprint (min_lat, max_lat, min_lon, max_lon over routes + PoPs)
+_HEADER = struct.Struct('<8sIIIIII4d')
+
+
+# === SOURCE FINGERPRINT (mtime + size + path) ===
+def source_fingerprint(path):
+    """Short hash identifying one version of a source file, or None if it is missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|v{ARTIFACT_VERSION}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def _artifact_prefix(path):
+    base = os.path.basename(path)
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in base)
+
+
+def artifact_path(path, fingerprint):
+    return os.path.join(GEOMETRY_CACHE_DIR, f"{_artifact_prefix(path)}.{fingerprint}.geo")
+
+
+# === KML READING (streaming) ===
+_PLACEMARK = f'{{{KML_NS}}}Placemark'
+_NAME = f'{{{KML_NS}}}name'
+_POINT = f'{{{KML_NS}}}Point'
+_LINESTRING = f'{{{KML_NS}}}LineString'
+_COORDINATES = f'{{{KML_NS}}}coordinates'
+_GX_TRACK = f'{{{GX_NS}}}Track'
+_GX_COORD = f'{{{GX_NS}}}coord'
+# Children of these are dropped as soon as they close, so the tree never grows past one feature
+_CONTAINERS = {f'{{{KML_NS}}}{tag}' for tag in ('kml', 'Document', 'Folder')}
+
+
+def open_kml(path):
+    """Binary stream of the KML in a .kmz (first .kml member) or a plain .kml file, or None."""
+    if path.lower().endswith('.kml'):
+        return open(path, 'rb')
+    kmz = zipfile.ZipFile(path, 'r')
+    kml_files = [f for f in kmz.namelist() if f.lower().endswith('.kml')]
+    if not kml_files:
+        kmz.close()
+        return None
+    stream = kmz.open(kml_files[0])
+    kmz.close()  # the member stream keeps its own handle on the archive
+    return stream
+
+
+def iter_placemark_elements(path):
+    """
+    Yield each <Placemark> element as soon as it is fully parsed, then discard it.
+    The element is only valid until the next iteration — copy what you need.
+    """
+    stream = open_kml(path)
+    if stream is None:
+        return
+    with stream:
+        stack = []
+        for event, elem in ET.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem)
+                continue
+            stack.pop()
+            if elem.tag == _PLACEMARK:
+                yield elem
+            if stack and stack[-1].tag in _CONTAINERS:
+                stack[-1].remove(elem)
+                elem.clear()
+
+
+def iter_placemarks(path):
+    """
+    Stream a provider file one Placemark at a time:
+    (name, points, lines, tracks) — raw <coordinates> text for each Point and LineString,
+    and a list of gx:coord texts per gx:Track. Peak memory is one Placemark.
+    """
+    for placemark in iter_placemark_elements(path):
+        name_elem = placemark.find(_NAME)
+        name = name_elem.text.strip() if name_elem is not None and name_elem.text else "Unnamed"
+        points = [c.text for point in placemark.iter(_POINT) for c in point.iter(_COORDINATES) if c.text]
+        lines = [c.text for line in placemark.iter(_LINESTRING) for c in line.iter(_COORDINATES) if c.text]
+        tracks = [[c.text for c in track.iter(_GX_COORD) if c.text] for track in placemark.iter(_GX_TRACK)]
+        yield name, points, lines, tracks
+
+
+_BULK_DECODE_MIN = 16  # below this many tuples the plain loop is cheaper than the bulk setup
+
+
+def decode_coords(text):
+    """
+    Decode a whole KML <coordinates> block ("lon,lat[,alt] ...") into (lats, lons) float arrays.
+    Well-formed blocks — every tuple the same width, no empty fields — go through one C-level
+    split and float map per column (altitude is never converted); short or irregular blocks
+    fall back to a per-tuple loop that skips malformed tuples, so both paths agree.
+
+    >>> decode_coords(" ".join(["-71.5,42.1,0"] * 20))[0][:2].tolist()
+    [42.1, 42.1]
+    >>> decode_coords(" ".join(["-71.5,42.1,"] * 20))[1][:2].tolist()
+    [-71.5, -71.5]
+    >>> [len(col) for col in decode_coords(" ".join(["-71.5,,42.1"] * 20))]
+    [0, 0]
+    """
+    tokens = text.split()
+    if len(tokens) >= _BULK_DECODE_MIN:
+        widths = set(map(str.count, tokens, repeat(',', len(tokens))))
+        if len(widths) == 1:
+            stride = widths.pop() + 1
+            if stride in (2, 3):
+                values = text.replace(',', ' ').split()
+                # an empty field ("lon,lat," / "lon,,lat") vanishes in the split and shifts the columns
+                if len(values) == stride * len(tokens):
+                    try:
+                        return array('d', map(float, values[1::stride])), array('d', map(float, values[0::stride]))
+                    except ValueError:
+                        pass  # a non-numeric field somewhere — decode tuple by tuple
+
+    lats, lons = array('d'), array('d')
+    for token in tokens:
+        parts = token.split(',')
+        if len(parts) < 2:
+            continue
+        try:
+            lon, lat = float(parts[0]), float(parts[1])
+        except ValueError:
+            continue
+        lats.append(lat)
+        lons.append(lon)
+    return lats, lons
+
+
+def parse_kml(path):
+    """
+    Parse a provider file into (pops, routes), streaming one Placemark at a time:
+    - pops:   [(name, lat, lon), ...]       — first Point of each Placemark
+    - routes: [(name, lats, lons), ...]     — every LineString with ≥2 vertices
+    Files with no LineStrings fall back to gx:Track (Segra West export).
+    """
+    pops, routes, tracks = [], [], []
+    for name, points, lines, track_coords in iter_placemarks(path):
+        if points:
+            lats, lons = decode_coords(points[0])
+            if lats:
+                pops.append((name, lats[0], lons[0]))
+
+        for text in lines:
+            lats, lons = decode_coords(text)
+            if len(lats) > 1:
+                routes.append((name, lats, lons))
+
+        if routes:
+            continue  # gx:Track is only a fallback
+        for coords in track_coords:
+            # gx:coord is "lon lat alt" — one tuple per element
+            lats, lons = decode_coords(' '.join(text.strip().replace(' ', ',') for text in coords))
+            if len(lats) > 1:
+                tracks.append(("Unnamed", lats, lons))
+
+    return pops, routes or tracks
+
+
+# === COMPILER ===
+def _pad8(n):
+    return (-n) % 8
+
+
+def write_artifact(out_path, pops, routes):
+    """
+    Write pops/routes as one columnar blob: float64 columns, uint32 offsets, JSON name table,
+    plus the KD-tree over route vertices so readers never rebuild it.
+    """
+    names, name_idx = [], {}
+
+    def intern(name):
+        if name not in name_idx:
+            name_idx[name] = len(names)
+            names.append(name)
+        return name_idx[name]
+
+    lat, lon = array('d'), array('d')
+    offsets = array('I', [0])
+    route_names = array('I')
+    route_box = array('d')  # min_lat, max_lat, min_lon, max_lon per route
+    for name, r_lats, r_lons in routes:
+        lat.extend(r_lats)
+        lon.extend(r_lons)
+        offsets.append(len(lat))
+        route_names.append(intern(name))
+        route_box.extend((min(r_lats), max(r_lats), min(r_lons), max(r_lons)) if len(r_lats) else (0.0,) * 4)
+
+    pop_lat, pop_lon, pop_names = array('d'), array('d'), array('I')
+    for name, p_lat, p_lon in pops:
+        pop_lat.append(p_lat)
+        pop_lon.append(p_lon)
+        pop_names.append(intern(name))
+
+    index = build_spatial_index(lat, lon)
+
+    all_lat, all_lon = list(lat) + list(pop_lat), list(lon) + list(pop_lon)
+    footprint = ((min(all_lat), max(all_lat), min(all_lon), max(all_lon)) if all_lat
+                 else (0.0, -1.0, 0.0, -1.0))  # empty: min > max
+
+    names_blob = json.dumps(names, separators=(',', ':')).encode('utf-8')
+    header = _HEADER.pack(ARTIFACT_MAGIC, ARTIFACT_VERSION, len(lat), len(route_names),
+                          len(pop_lat), len(names_blob), len(index.start), *footprint)
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    # unique per writer (process and thread) — the finished file appears atomically
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(out_path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(header)
+        # float64 columns first → every column stays 8-byte aligned
+        for col in (lat, lon, pop_lat, pop_lon, index.lat, index.lon, index.box, route_box):
+            f.write(col.tobytes())
+        for col in (offsets, route_names, pop_names,
+                    index.vertex_ids, index.start, index.end, index.left, index.right):
+            blob = col.tobytes()
+            f.write(blob)
+            f.write(b'\x00' * _pad8(len(blob)))
+        f.write(names_blob)
+    os.replace(tmp_path, out_path)
+
+
+_COMPILE_LOCKS = {}
+_COMPILE_LOCKS_LOCK = threading.Lock()
+
+
+def _compile_lock(path):
+    """Per-source lock: one thread compiles a file while others wait and reuse its artifact."""
+    key = os.path.abspath(path)
+    with _COMPILE_LOCKS_LOCK:
+        lock = _COMPILE_LOCKS.get(key)
+        if lock is None:
+            lock = _COMPILE_LOCKS[key] = threading.RLock()
+        return lock
+
+
+def compile_geometry(path, force=False):
+    """Compile one source file if its artifact is missing or stale. Returns the artifact path."""
+    fingerprint = source_fingerprint(path)
+    if fingerprint is None:
+        return None
+    out_path = artifact_path(path, fingerprint)
+    if os.path.exists(out_path) and not force:
+        return out_path
+    with _compile_lock(path):
+        if os.path.exists(out_path) and not force:
+            return out_path  # compiled by the thread we waited on
+        return _compile(path, fingerprint, out_path)
+
+
+def _compile(path, fingerprint, out_path):
+    pops, routes = parse_kml(path)
+    write_artifact(out_path, pops, routes)
+    logger.info("Compiled geometry [%s] – %d PoPs, %d routes, %d vertices",
+                os.path.basename(path), len(pops), len(routes), sum(len(r[1]) for r in routes))
+
+    # Drop artifacts from older versions of the same source
+    prefix = _artifact_prefix(path) + "."
+    for f in os.listdir(GEOMETRY_CACHE_DIR):
+        stale = os.path.join(GEOMETRY_CACHE_DIR, f)
+        if f.startswith(prefix) and fingerprint not in f:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return out_path
+
+
+# === LEVEL OF DETAIL (route pyramid) ===
+# Douglas-Peucker tolerances in degrees, finest → coarsest. Each level is simplified from the
+# raw routes (not from the level below), so its error is bounded by its own tolerance.
+LOD_TOLERANCES = (0.0001, 0.001, 0.005, 0.02)
+
+
+def lod_level(tolerance):
+    """Coarsest pyramid tolerance ≤ `tolerance`, or None if raw geometry is needed."""
+    if tolerance is None:
+        return None
+    levels = [t for t in LOD_TOLERANCES if t <= tolerance]
+    return levels[-1] if levels else None
+
+
+def lod_tolerance_for_zoom(zoom):
+    """Roughly one screen pixel in degrees at a web-mercator zoom level (256px tiles)."""
+    return 360.0 / (256 * 2 ** max(0, min(int(zoom), 22)))
+
+
+def lod_artifact_path(path, fingerprint, tolerance):
+    return os.path.join(GEOMETRY_CACHE_DIR, f"{_artifact_prefix(path)}.{fingerprint}.lod{tolerance:g}.geo")
+
+
+def compile_lods(path, geom):
+    """Write every pyramid level for a loaded base Geometry."""
+    offsets = geom.offsets.tolist()
+    pops = [(p["name"], p["lat"], p["lon"]) for p in geom.pops()]
+    for tolerance in LOD_TOLERANCES:
+        routes, total = [], 0
+        for i in range(geom.n_routes):
+            start, end = offsets[i], offsets[i + 1]
+            r_lat, r_lon = simplify(geom.lat[start:end], geom.lon[start:end], tolerance)
+            routes.append((geom.route_name(i), r_lat, r_lon))
+            total += len(r_lat)
+        write_artifact(lod_artifact_path(path, geom.fingerprint, tolerance), pops, routes)
+        logger.info("Compiled LOD [%s] tolerance %g – %d → %d vertices",
+                    os.path.basename(path), tolerance, geom.n_vertices, total)
+
+
+# === DISTANCE HELPERS ===
+EARTH_RADIUS_MI = 3958.8
+MILES_PER_DEG_LAT = 69.0
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2)**2
+    return EARTH_RADIUS_MI * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+def format_fiber_distance(miles):
+    """Distance column text: "<1 mi" or "N.N mi" (None → None)."""
+    if miles is None:
+        return None
+    return "<1 mi" if miles < 1.0 else f"{round(miles, 1)} mi"
+
+
+# === ENCODED POLYLINE (compact wire format) ===
+POLYLINE_PRECISION = 5  # 1e-5° ≈ 1.1 m
+
+
+def _encode_value(delta, out):
+    value = ~(delta << 1) if delta < 0 else delta << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_polyline(lats, lons, precision=POLYLINE_PRECISION):
+    """Google encoded-polyline string: delta-coded fixed-point lat/lon pairs."""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in zip(lats, lons):
+        i_lat, i_lon = round(lat * factor), round(lon * factor)
+        _encode_value(i_lat - prev_lat, out)
+        _encode_value(i_lon - prev_lon, out)
+        prev_lat, prev_lon = i_lat, i_lon
+    return "".join(out)
+
+
+# === MEMORY-MAPPED READER ===
+class Geometry:
+    """Read-only view over a compiled artifact. Columns are memoryviews into the mmap."""
+
+    def __init__(self, source, fingerprint, buf):
+        self.source = source
+        self.fingerprint = fingerprint
+        self._buf = buf
+        magic, version, n_vertices, n_routes, n_pops, names_len, n_nodes, *footprint = _HEADER.unpack_from(buf, 0)
+        if magic != ARTIFACT_MAGIC or version != ARTIFACT_VERSION:
+            raise ValueError(f"Bad geometry artifact for {source}")
+        self.n_vertices, self.n_routes, self.n_pops = n_vertices, n_routes, n_pops
+        # Box around every route vertex and PoP — None for an empty file
+        self.footprint = tuple(footprint) if footprint[0] <= footprint[1] else None
+
+        mv = memoryview(buf)
+        pos = _HEADER.size
+
+        def take(count, fmt, size):
+            nonlocal pos
+            col = mv[pos:pos + count * size].cast(fmt)
+            pos += count * size
+            pos += _pad8(count * size)
+            return col
+
+        self.lat = take(n_vertices, 'd', 8)
+        self.lon = take(n_vertices, 'd', 8)
+        self.pop_lat = take(n_pops, 'd', 8)
+        self.pop_lon = take(n_pops, 'd', 8)
+        kd_lat = take(n_vertices, 'd', 8)
+        kd_lon = take(n_vertices, 'd', 8)
+        kd_box = take(n_nodes * 4, 'd', 8)
+        self._route_bounds = take(n_routes * 4, 'd', 8)
+        self.offsets = take(n_routes + 1, 'I', 4)
+        self.route_name_idx = take(n_routes, 'I', 4)
+        self.pop_name_idx = take(n_pops, 'I', 4)
+        kd_ids = take(n_vertices, 'I', 4)
+        kd_start = take(n_nodes, 'I', 4)
+        kd_end = take(n_nodes, 'I', 4)
+        kd_left = take(n_nodes, 'i', 4)
+        kd_right = take(n_nodes, 'i', 4)
+        self.names = json.loads(bytes(mv[pos:pos + names_len]).decode('utf-8'))
+
+        self._index = SpatialIndex(kd_lat, kd_lon, kd_ids, kd_start, kd_end, kd_left, kd_right, kd_box)
+        # Route-only box (root node box) — None when the file has no routes
+        self.bbox = tuple(kd_box[0:4].tolist()) if n_nodes else None
+        self._lods = {}
+        self._lod_lock = threading.Lock()
+        self._encoded = None
+
+    def spatial_index(self):
+        """KD-tree over all route vertices — compiled into the artifact, so free to use."""
+        return self._index
+
+    def lower_bound(self, lat, lon):
+        """Miles from (lat, lon) to this file's bounding box — no vertex is closer."""
+        if self.bbox is None:
+            return float('inf')
+        return box_lower_bound(lat, lon, *self.bbox)
+
+    def lod(self, tolerance):
+        """
+        This geometry simplified to the coarsest pyramid level within `tolerance` degrees
+        (self when tolerance is None or finer than every level). Levels are compiled once
+        per source version and memory-mapped like the base artifact.
+        """
+        level = lod_level(tolerance)
+        if level is None:
+            return self
+        cached = self._lods.get(level)
+        if cached is not None:
+            return cached
+        with self._lod_lock:
+            cached = self._lods.get(level)
+            if cached is None:
+                out_path = lod_artifact_path(self.source, self.fingerprint, level)
+                if not os.path.exists(out_path):
+                    compile_lods(self.source, self)
+                with open(out_path, 'rb') as f:
+                    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                cached = Geometry(self.source, self.fingerprint, buf)
+                self._lods[level] = cached
+            return cached
+
+    def route_bounds(self):
+        """min_lat, max_lat, min_lon, max_lon per route (4 doubles each) — stored in the artifact."""
+        return self._route_bounds
+
+    def route_name(self, i):
+        return self.names[self.route_name_idx[i]]
+
+    def route_coords(self, i):
+        """[[lat, lon], ...] for route i — the shape the Leaflet templates expect."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return [[a, b] for a, b in zip(self.lat[start:end].tolist(), self.lon[start:end].tolist())]
+
+    def iter_routes(self):
+        for i in range(self.n_routes):
+            yield self.route_name(i), self.route_coords(i)
+
+    def encoded_routes(self):
+        """[(name, encoded polyline), ...] for every route — encoded once, then reused."""
+        if self._encoded is None:
+            offsets = self.offsets.tolist()
+            self._encoded = [
+                (self.route_name(i), encode_polyline(self.lat[offsets[i]:offsets[i + 1]],
+                                                     self.lon[offsets[i]:offsets[i + 1]]))
+                for i in range(self.n_routes)
+            ]
+        return self._encoded
+
+    def routes(self):
+        return [{"name": name, "coords": coords} for name, coords in self.iter_routes()]
+
+    def pops(self):
+        return [
+            {"name": self.names[self.pop_name_idx[i]], "lon": self.pop_lon[i], "lat": self.pop_lat[i]}
+            for i in range(self.n_pops)
+        ]
+
+
+# === SPATIAL INDEX (bucketed KD-tree) ===
+def box_lower_bound(lat, lon, min_lat, max_lat, min_lon, max_lon):
+    """Miles from (lat, lon) to the closest point of a lat/lon box (0 if inside)."""
+    if min_lon <= lon <= max_lon:
+        if min_lat <= lat <= max_lat:
+            return 0.0
+        # Same meridian band — straight north/south
+        return EARTH_RADIUS_MI * radians(min(abs(lat - min_lat), abs(lat - max_lat)))
+    edge_lon = min_lon if abs(lon - min_lon) < abs(lon - max_lon) else max_lon
+    dlon = radians(edge_lon - lon)
+    # Closest point on the edge meridian sits poleward of lat, not at lat itself
+    c_lat = lat
+    if cos(dlon) > 0:
+        c_lat = degrees(atan2(tan(radians(lat)), cos(dlon)))
+    c_lat = min(max(c_lat, min_lat), max_lat)
+    return haversine_miles(lat, lon, c_lat, edge_lon)
+
+
+class SpatialIndex:
+    """
+    Bucketed KD-tree over a set of vertices, stored in flat columns (arrays or mmap views).
+    Vertices are permuted so every node covers a contiguous slice; each node keeps
+    its lat/lon bounding box so whole subtrees are skipped by lower-bound distance.
+    Answers exact nearest-vertex and within-radius queries.
+    """
+
+    def __init__(self, lat, lon, vertex_ids, start, end, left, right, box):
+        # lat/lon/vertex_ids: vertices in tree order; start/end/left/right/box: one entry per node
+        self.lat, self.lon, self.vertex_ids = lat, lon, vertex_ids
+        self.start, self.end = start, end
+        self.left, self.right = left, right
+        self.box = box  # min_lat, max_lat, min_lon, max_lon per node
+        self.n = len(lat)
+
+    def _lower_bound(self, node, lat, lon):
+        b = node * 4
+        box = self.box
+        return box_lower_bound(lat, lon, box[b], box[b + 1], box[b + 2], box[b + 3])
+
+    def nearest(self, lat, lon, max_miles=None):
+        """(miles, lat, lon, vertex_id) of the closest vertex, or None."""
+        if not self.n:
+            return None
+        cos_lat = cos(radians(lat))
+        best = float('inf') if max_miles is None else max_miles
+        best_i = -1
+        v_lat, v_lon = self.lat, self.lon
+
+        stack = [(0, self._lower_bound(0, lat, lon))]
+        while stack:
+            node, lb = stack.pop()
+            if lb >= best:
+                continue
+            left = self.left[node]
+            if left < 0:
+                for i in range(self.start[node], self.end[node]):
+                    p_lat = v_lat[i]
+                    dlat = radians(p_lat - lat)
+                    dlon = radians(v_lon[i] - lon)
+                    a = sin(dlat / 2)**2 + cos_lat * cos(radians(p_lat)) * sin(dlon / 2)**2
+                    d = EARTH_RADIUS_MI * 2 * atan2(sqrt(a), sqrt(1 - a))
+                    if d < best:
+                        best, best_i = d, i
+                continue
+            right = self.right[node]
+            lb_left = self._lower_bound(left, lat, lon)
+            lb_right = self._lower_bound(right, lat, lon)
+            # Push the farther child first so the nearer one is explored first
+            if lb_left <= lb_right:
+                stack.append((right, lb_right))
+                stack.append((left, lb_left))
+            else:
+                stack.append((left, lb_left))
+                stack.append((right, lb_right))
+
+        if best_i < 0:
+            return None
+        return best, v_lat[best_i], v_lon[best_i], self.vertex_ids[best_i]
+
+    def within(self, lat, lon, radius_miles):
+        """[(miles, lat, lon, vertex_id), ...] for every vertex within radius, nearest first."""
+        if not self.n:
+            return []
+        cos_lat = cos(radians(lat))
+        hits = []
+        v_lat, v_lon = self.lat, self.lon
+
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._lower_bound(node, lat, lon) > radius_miles:
+                continue
+            left = self.left[node]
+            if left >= 0:
+                stack.append(left)
+                stack.append(self.right[node])
+                continue
+            for i in range(self.start[node], self.end[node]):
+                p_lat = v_lat[i]
+                dlat = radians(p_lat - lat)
+                dlon = radians(v_lon[i] - lon)
+                a = sin(dlat / 2)**2 + cos_lat * cos(radians(p_lat)) * sin(dlon / 2)**2
+                d = EARTH_RADIUS_MI * 2 * atan2(sqrt(a), sqrt(1 - a))
+                if d <= radius_miles:
+                    hits.append((d, p_lat, v_lon[i], self.vertex_ids[i]))
+        hits.sort()
+        return hits
+
+
+KD_LEAF_SIZE = 32
+
+
+def build_spatial_index(lat, lon):
+    """Build a SpatialIndex over lat/lon columns (compile time — not per request)."""
+    lat_list, lon_list = lat.tolist(), lon.tolist()
+    n = len(lat_list)
+    order = list(range(n))
+    start, end = array('I'), array('I')
+    left, right = array('i'), array('i')
+    box = array('d')
+
+    stack = [(0, n, -1, False)] if n else []
+    while stack:
+        lo, hi, parent, is_right = stack.pop()
+        sub = order[lo:hi]
+        lats = [lat_list[i] for i in sub]
+        lons = [lon_list[i] for i in sub]
+        min_lat, max_lat, min_lon, max_lon = min(lats), max(lats), min(lons), max(lons)
+        node = len(start)
+        start.append(lo)
+        end.append(hi)
+        left.append(-1)
+        right.append(-1)
+        box.extend((min_lat, max_lat, min_lon, max_lon))
+        if parent >= 0:
+            (right if is_right else left)[parent] = node
+        if hi - lo <= KD_LEAF_SIZE:
+            continue
+        # Split the longer side (longitude scaled by latitude)
+        lon_scale = cos(radians((max_lat + min_lat) / 2))
+        axis = lat_list if (max_lat - min_lat) >= (max_lon - min_lon) * lon_scale else lon_list
+        sub.sort(key=axis.__getitem__)
+        order[lo:hi] = sub
+        mid = (lo + hi) // 2
+        stack.append((mid, hi, node, True))
+        stack.append((lo, mid, node, False))
+
+    return SpatialIndex(
+        array('d', [lat_list[i] for i in order]),
+        array('d', [lon_list[i] for i in order]),
+        array('I', order), start, end, left, right, box,
+    )
+
+
+_GEOMETRY = {}
+_GEOMETRY_LOCK = threading.Lock()
+
+
+def load_geometry(path):
+    """
+    Compiled geometry for a provider file (KMZ or KML), or None if the file is missing.
+    Recompiles automatically when the source mtime/size changes.
+    """
+    fingerprint = source_fingerprint(path)
+    if fingerprint is None:
+        return None
+    key = os.path.abspath(path)
+    cached = _GEOMETRY.get(key)
+    if cached is not None and cached.fingerprint == fingerprint:
+        return cached
+
+    with _GEOMETRY_LOCK:
+        cached = _GEOMETRY.get(key)
+        if cached is not None and cached.fingerprint == fingerprint:
+            return cached
+        out_path = compile_geometry(path)
+        with open(out_path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        geom = Geometry(path, fingerprint, buf)
+        _GEOMETRY[key] = geom
+        return geom
+
+
+def geometry_footprint(path):
+    """
+    A file's footprint (box around routes + PoPs) from the artifact header alone — no mmap,
+    no name table. Compiles the source if needed; None if missing or empty.
+    """
+    fingerprint = source_fingerprint(path)
+    if fingerprint is None:
+        return None
+    cached = _GEOMETRY.get(os.path.abspath(path))
+    if cached is not None and cached.fingerprint == fingerprint:
+        return cached.footprint
+    out_path = artifact_path(path, fingerprint)
+    if not os.path.exists(out_path):
+        with _compile_lock(path):
+            out_path = compile_geometry(path)
+    with open(out_path, 'rb') as f:
+        header = _HEADER.unpack(f.read(_HEADER.size))
+    footprint = header[7:]
+    return tuple(footprint) if footprint[0] <= footprint[1] else None
+
+
+# === COMBINED INDEX (many providers, two levels) ===
+class CombinedIndex:
+    """
+    Nearest-provider lookups across several compiled files. Sources are visited in
+    order of their footprint distance and skipped once that alone can't beat the
+    current k-th best, so only the few providers near the point are ever mapped or searched.
+    """
+
+    def __init__(self, sources):
+        self.sources = sources  # [(name, path, footprint), ...]
+
+    def nearest_sources(self, lat, lon, k=3, max_miles=None):
+        """[(name, miles), ...] for the k closest sources (routes or PoPs), nearest first."""
+        limit = float('inf') if max_miles is None else max_miles
+        candidates = sorted(
+            (box_lower_bound(lat, lon, *footprint), name, path)
+            for name, path, footprint in self.sources
+        )
+
+        best = []  # [(miles, name)], sorted, at most k
+        for lb, name, path in candidates:
+            cutoff = best[-1][0] if len(best) >= k else limit
+            if lb >= cutoff:
+                break
+            geom = load_geometry(path)
+            if geom is None:
+                continue
+            # PoPs aren't in the route tree — there are only a handful per file, scan them
+            d = min(
+                (haversine_miles(lat, lon, p_lat, p_lon)
+                 for p_lat, p_lon in zip(geom.pop_lat.tolist(), geom.pop_lon.tolist())),
+                default=float('inf'),
+            )
+            hit = geom.spatial_index().nearest(lat, lon, max_miles=min(cutoff, d))
+            if hit is not None:
+                d = hit[0]
+            if d < cutoff:
+                best.append((d, name))
+                best.sort()
+                del best[k:]
+        return [(name, d) for d, name in best]
+
+
+_COMBINED = {}
+_COMBINED_LOCK = threading.Lock()
+
+
+def load_combined_index(paths):
+    """CombinedIndex over {name: path}; footprints come from the artifact headers."""
+    key = tuple((name, path, source_fingerprint(path)) for name, path in sorted(paths.items()))
+    cached = _COMBINED.get(key)
+    if cached is not None:
+        return cached
+    with _COMBINED_LOCK:
+        cached = _COMBINED.get(key)
+        if cached is None:
+            sources = []
+            for name, path, fingerprint in key:
+                footprint = geometry_footprint(path) if fingerprint else None
+                if footprint is not None:
+                    sources.append((name, path, footprint))
+            cached = CombinedIndex(sources)
+            _COMBINED.clear()  # one generation is enough
+            _COMBINED[key] = cached
+        return cached
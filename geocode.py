@@ -0,0 +1,225 @@
+# geocode.py — Address → (lat, lon) through a persistent cache in front of a remote geocoder
+# Lookups go memory → geocode_cache table → geocoder. A miss is resolved by one caller only:
+# concurrent requests for the same address in this process wait on the first one, and across
+# workers a transaction-scoped advisory lock on the address key serializes the remote call, so
+# each address reaches the geocoder at most once. "Not found" is cached too (retried after
+# NEGATIVE_TTL_DAYS); network errors are not, so an outage never poisons the cache and
+# already-seen addresses keep resolving from the table.
+# The geocoder is Nominatim by default, or any compatible search endpoint (GEOCODER_URL) — a
+# local stand-in answering ?q=...&format=json with [{"lat": .., "lon": ..}] works for tests.
+# Request slots are handed out by one row in geocode_throttle, so the rate limit holds across
+# every worker and background job, not just per process.
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+import psycopg
+import requests
+
+logger = logging.getLogger('erate.geocode')
+
+GEOCODER_URL = os.getenv('GEOCODER_URL', "https://nominatim.openstreetmap.org/search")
+GEOCODER_SOURCE = os.getenv('GEOCODER_SOURCE', 'nominatim')   # recorded in geocode_cache.source
+USER_AGENT = 'E-Rate/1.0'
+REQUEST_TIMEOUT = 10
+# Nominatim usage policy: at most one request per second (across all processes)
+MIN_REQUEST_INTERVAL = float(os.getenv('GEOCODER_MIN_INTERVAL', '1.0'))
+NEGATIVE_TTL_DAYS = 30
+MEMORY_ENTRIES = 4096
+
+GEOCODE_CACHE_DDL = """
+    CREATE TABLE IF NOT EXISTS geocode_cache (
+        address_key TEXT PRIMARY KEY,
+        query TEXT,
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        source VARCHAR(20) NOT NULL DEFAULT 'nominatim',
+        created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    CREATE TABLE IF NOT EXISTS geocode_throttle (
+        source VARCHAR(20) PRIMARY KEY,
+        next_slot TIMESTAMPTZ NOT NULL
+    );
+"""
+# Claim the next slot: the row lock serializes callers, the slot moves MIN_REQUEST_INTERVAL on.
+# Returns seconds to wait (<= 0: go now).
+_CLAIM_SLOT_SQL = """
+    INSERT INTO geocode_throttle AS t (source, next_slot)
+    VALUES (%(source)s, clock_timestamp() + make_interval(secs => %(interval)s))
+    ON CONFLICT (source) DO UPDATE
+        SET next_slot = GREATEST(t.next_slot, clock_timestamp()) + make_interval(secs => %(interval)s)
+    RETURNING EXTRACT(EPOCH FROM t.next_slot - clock_timestamp()) - %(interval)s
+"""
+
+# === ADDRESS NORMALIZATION ===
+_ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'road': 'rd', 'drive': 'dr', 'boulevard': 'blvd',
+    'lane': 'ln', 'court': 'ct', 'place': 'pl', 'highway': 'hwy', 'parkway': 'pkwy',
+    'circle': 'cir', 'terrace': 'ter', 'suite': 'ste', 'north': 'n', 'south': 's',
+    'east': 'e', 'west': 'w', 'northeast': 'ne', 'northwest': 'nw', 'southeast': 'se',
+    'southwest': 'sw', 'route': 'rt', 'post office box': 'po box', 'p o box': 'po box',
+}
+_ABBREVIATION_RE = re.compile(r'\b(' + '|'.join(sorted(map(re.escape, _ABBREVIATIONS), key=len, reverse=True)) + r')\b')
+_PUNCTUATION_RE = re.compile(r"[^\w\s,]")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_address(address):
+    """Cache key: lower case, no punctuation, common suffixes abbreviated, empty parts dropped."""
+    text = _PUNCTUATION_RE.sub(' ', (address or '').lower())
+    text = _ABBREVIATION_RE.sub(lambda m: _ABBREVIATIONS[m.group(1)], text)
+    parts = [_SPACES_RE.sub(' ', part).strip() for part in text.split(',')]
+    return ', '.join(part for part in parts if part)
+
+
+# === IN-PROCESS STATE ===
+_MEMORY = OrderedDict()        # address_key → (lat, lon) | (None, None)
+_INFLIGHT = {}                 # address_key → Event set when the leader finishes
+_LOCK = threading.Lock()
+_THROTTLE_LOCK = threading.Lock()
+_NEXT_SLOT = [0.0]
+STATS = {"memory": 0, "table": 0, "remote": 0, "coalesced": 0, "errors": 0}
+
+
+def _remember(key, coords):
+    with _LOCK:
+        _MEMORY[key] = coords
+        _MEMORY.move_to_end(key)
+        while len(_MEMORY) > MEMORY_ENTRIES:
+            _MEMORY.popitem(last=False)
+
+
+def init_tables(database_url):
+    """Create geocode_cache + geocode_throttle — at app start, not inside a lookup."""
+    conn = psycopg.connect(database_url, connect_timeout=10, autocommit=True)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(GEOCODE_CACHE_DDL)
+    finally:
+        conn.close()
+
+
+def _local_slot_wait():
+    with _THROTTLE_LOCK:
+        now = time.time()
+        slot = max(now, _NEXT_SLOT[0])
+        _NEXT_SLOT[0] = slot + MIN_REQUEST_INTERVAL
+    return slot - now
+
+
+def _throttle(database_url):
+    """
+    Wait for the next request slot — slots are MIN_REQUEST_INTERVAL apart across all processes
+    sharing the database; requests may overlap. Without the database, paces this process only.
+    """
+    try:
+        conn = psycopg.connect(database_url, connect_timeout=10, autocommit=True)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(_CLAIM_SLOT_SQL, {"source": GEOCODER_SOURCE, "interval": MIN_REQUEST_INTERVAL})
+                wait = float(cur.fetchone()[0])
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning("Shared geocoder throttle unavailable, pacing this process only: %s", e)
+        wait = _local_slot_wait()
+    if wait > 0:
+        time.sleep(wait)
+
+
+def _remote(query, database_url):
+    """(lat, lon), (None, None) when nothing matched. Raises on network / HTTP errors."""
+    _throttle(database_url)
+    r = requests.get(GEOCODER_URL, params={'q': query, 'format': 'json', 'limit': 1},
+                     headers={'User-Agent': USER_AGENT}, timeout=REQUEST_TIMEOUT)
+    r.raise_for_status()
+    results = r.json()
+    if results:
+        return float(results[0]['lat']), float(results[0]['lon'])
+    return None, None
+
+
+def _fresh_row(cur, key):
+    cur.execute("""
+        SELECT latitude, longitude FROM geocode_cache
+        WHERE address_key = %s
+          AND (latitude IS NOT NULL OR created_at > NOW() - make_interval(days => %s))
+    """, (key, NEGATIVE_TTL_DAYS))
+    return cur.fetchone()
+
+
+def _resolve(key, query, database_url):
+    """Table lookup, else one remote call under the per-address advisory lock."""
+    try:
+        conn = psycopg.connect(database_url, connect_timeout=10)
+    except Exception as e:
+        logger.warning("Geocode cache unavailable, asking the geocoder directly: %s", e)
+        STATS["remote"] += 1
+        return _remote(query, database_url)
+    try:
+        with conn.cursor() as cur:
+            row = _fresh_row(cur, key)
+            if row:
+                STATS["table"] += 1
+                return row[0], row[1]
+            # Other workers asking for this address block here until we commit
+            cur.execute("SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))", (key,))
+            row = _fresh_row(cur, key)
+            if row:
+                STATS["coalesced"] += 1
+                return row[0], row[1]
+            STATS["remote"] += 1
+            lat, lon = _remote(query, database_url)
+            cur.execute("""
+                INSERT INTO geocode_cache (address_key, query, latitude, longitude, source)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (address_key) DO UPDATE SET
+                    query = EXCLUDED.query, latitude = EXCLUDED.latitude,
+                    longitude = EXCLUDED.longitude, source = EXCLUDED.source, created_at = NOW()
+            """, (key, query, lat, lon, GEOCODER_SOURCE))
+        conn.commit()
+        return lat, lon
+    finally:
+        conn.close()
+
+
+def geocode(address, database_url, raise_errors=False):
+    """
+    (lat, lon) for an address, or (None, None) when it cannot be resolved right now.
+    raise_errors=True re-raises geocoder failures so batch callers can tell them from "not found".
+    """
+    key = normalize_address(address)
+    if not key:
+        return None, None
+    with _LOCK:
+        if key in _MEMORY:
+            _MEMORY.move_to_end(key)
+            STATS["memory"] += 1
+            return _MEMORY[key]
+        event = _INFLIGHT.get(key)
+        leader = event is None
+        if leader:
+            event = _INFLIGHT[key] = threading.Event()
+    if not leader:
+        event.wait(REQUEST_TIMEOUT * 2)
+        STATS["coalesced"] += 1
+        with _LOCK:
+            return _MEMORY.get(key, (None, None))
+    try:
+        coords = _resolve(key, address, database_url)
+        _remember(key, coords)
+        return coords
+    except Exception as e:
+        STATS["errors"] += 1
+        logger.warning("Geocoding failed [%s]: %s", key, e)
+        if raise_errors:
+            raise
+        return None, None
+    finally:
+        with _LOCK:
+            _INFLIGHT.pop(key, None)
+        event.set()
@@ -0,0 +1,127 @@
+# geohash.py — Geohash cells for applicant proximity search without PostGIS
+# erate.geohash holds each applicant's cell at GEOHASH_PRECISION. A cell's sub-cells share its
+# prefix, so under a "C"-collated btree every cell is one contiguous key range. A radius or box
+# query becomes a handful of range scans over the cells covering it, then an exact filter.
+
+from math import cos, radians, ceil
+
+from geo import haversine_miles, MILES_PER_DEG_LAT
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(BASE32)}
+GEOHASH_PRECISION = 9     # ≈ 4.8m × 4.8m — finer than any stored applicant coordinate
+MAX_COVER_CELLS = 32      # most cells one query may scan (coarser cells above this)
+RANGE_END = "~"           # sorts after every base32 character under COLLATE "C"
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Geohash string for a point, or None for missing / 0,0 coordinates."""
+    if lat is None or lon is None or (not lat and not lon):
+        return None
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                value, lon_lo = (value << 1) | 1, mid
+            else:
+                value, lon_hi = value << 1, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value, lat_lo = (value << 1) | 1, mid
+            else:
+                value, lat_hi = value << 1, mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(lat degrees, lon degrees) spanned by one cell."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def _next_cell(cell):
+    """Following cell in key order at the same precision, or None past the last one."""
+    chars = list(cell)
+    for i in range(len(chars) - 1, -1, -1):
+        n = _DECODE[chars[i]] + 1
+        if n < 32:
+            chars[i] = BASE32[n]
+            return "".join(chars)
+        chars[i] = BASE32[0]
+    return None
+
+
+def _cover_precision(min_lat, max_lat, min_lon, max_lon, max_cells):
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        h, w = cell_size(precision)
+        if (ceil((max_lat - min_lat) / h) + 1) * (ceil((max_lon - min_lon) / w) + 1) <= max_cells:
+            return precision
+    return 1
+
+
+def cover_ranges(min_lat, max_lat, min_lon, max_lon, max_cells=MAX_COVER_CELLS):
+    """
+    [(low, high)] key ranges (low <= geohash < high) whose union holds every cell touching
+    the box. Neighbouring cells that are adjacent in key order are merged into one range.
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0)
+    precision = _cover_precision(min_lat, max_lat, min_lon, max_lon, max_cells)
+    h, w = cell_size(precision)
+    cells = set()
+    lat = min_lat
+    while True:
+        lon = min_lon
+        while True:
+            cells.add(encode(min(lat, 90.0 - 1e-9), min(lon, 180.0 - 1e-9), precision))
+            if lon >= max_lon:
+                break
+            lon = min(lon + w, max_lon)
+        if lat >= max_lat:
+            break
+        lat = min(lat + h, max_lat)
+
+    ranges = []
+    for cell in sorted(cells):
+        if ranges and _next_cell(ranges[-1][1]) == cell:
+            ranges[-1][1] = cell
+        else:
+            ranges.append([cell, cell])
+    return [(first, last + RANGE_END) for first, last in ranges]
+
+
+def radius_box(lat, lon, miles):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing a circle of `miles` around a point."""
+    dlat = miles / MILES_PER_DEG_LAT
+    dlon = miles / (MILES_PER_DEG_LAT * max(cos(radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def ranges_sql(ranges, column="geohash"):
+    """WHERE fragment + params for a list of cover ranges."""
+    clause = " OR ".join(f"({column} >= %s AND {column} < %s)" for _ in ranges)
+    params = [bound for pair in ranges for bound in pair]
+    return f"({clause})", params
+
+
+def within_radius(rows, lat, lon, miles):
+    """[(miles, row)] for rows (… lat, lon as the last two fields) inside the circle, closest first."""
+    hits = []
+    for row in rows:
+        r_lat, r_lon = row[-2], row[-1]
+        if r_lat is None or r_lon is None:
+            continue
+        d = haversine_miles(lat, lon, float(r_lat), float(r_lon))
+        if d <= miles:
+            hits.append((d, row))
+    hits.sort(key=lambda hit: hit[0])
+    return hits
@@ -0,0 +1,183 @@
+# light_variants.py — Build simplified "light" KMZs for every provider file + a manifest
+# Usage: python light_variants.py [tolerance ...]     (degrees; default LIGHT_TOLERANCES)
+# Each source gets one KMZ per tolerance under light_variants/, all PoPs kept. The manifest
+# records vertex counts and the measured max deviation per variant, and bbmap picks the
+# most detailed variant that fits its vertex budget (choose_variant). The geometry warm-up
+# rebuilds stale variants after every compile; until a source has a manifest entry, its
+# hand-made *_light file (if any) is used instead.
+
+import os
+import sys
+import json
+import zipfile
+import logging
+import threading
+from xml.sax.saxutils import escape
+
+import geo
+from geo import KML_NS, load_geometry, source_fingerprint
+from simplify import simplify_indices, max_deviation
+
+logger = logging.getLogger('erate.light')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LIGHT_DIR = os.path.join(BASE_DIR, "light_variants")
+MANIFEST_PATH = os.path.join(LIGHT_DIR, "manifest.json")
+LIGHT_TOLERANCES = (0.0002, 0.0005, 0.001, 0.005)
+METERS_PER_DEG = 111320.0  # error bound in metres is an upper bound (≤ 1° of latitude)
+
+
+def default_sources():
+    """Every provider file the app serves (the hand-made *_light files are superseded)."""
+    paths = [os.path.join(BASE_DIR, f) for f in ("BBN Map KMZ 122023.kmz", "SEGRA_EAST.kmz", "SEGRA_WEST.kmz", "CDT.kml")]
+    for folder in ("fidium_regions", "fna_members"):
+        full = os.path.join(BASE_DIR, folder)
+        if os.path.isdir(full):
+            paths.extend(os.path.join(full, f) for f in sorted(os.listdir(full))
+                         if f.lower().endswith('.kmz') and not f.lower().endswith('_light.kmz'))
+    return [p for p in paths if os.path.exists(p)]
+
+
+def manifest_key(path):
+    return os.path.relpath(os.path.abspath(path), BASE_DIR)
+
+
+def _variant_path(path, tolerance):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(LIGHT_DIR, f"{stem}.tol{tolerance:g}.kmz")
+
+
+def _write_kmz(out_path, title, pops, routes):
+    """pops: [(name, lat, lon)], routes: [(name, lats, lons)] → a KMZ geo.parse_kml reads back."""
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as kmz:
+        with kmz.open('doc.kml', 'w') as out:
+            out.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="{KML_NS}"><Document>'
+                      f'<name>{escape(title)}</name>\n'.encode('utf-8'))
+            for name, lat, lon in pops:
+                out.write(f'<Placemark><name>{escape(name)}</name><Point><coordinates>'
+                          f'{lon:.6f},{lat:.6f}</coordinates></Point></Placemark>\n'.encode('utf-8'))
+            for name, lats, lons in routes:
+                coords = " ".join(f"{x:.6f},{y:.6f}" for y, x in zip(lats, lons))
+                out.write(f'<Placemark><name>{escape(name)}</name><LineString><coordinates>'
+                          f'{coords}</coordinates></LineString></Placemark>\n'.encode('utf-8'))
+            out.write(b"</Document></kml>\n")
+    os.replace(tmp_path, out_path)
+
+
+def build_variants(path, tolerances=LIGHT_TOLERANCES):
+    """Write every light variant of one source. Returns its manifest entry."""
+    geom = load_geometry(path)
+    pops = [(p["name"], p["lat"], p["lon"]) for p in geom.pops()]
+    offsets = geom.offsets.tolist()
+    entry = {
+        "fingerprint": geom.fingerprint,
+        "vertices": geom.n_vertices,
+        "routes": geom.n_routes,
+        "pops": geom.n_pops,
+        "variants": [],
+    }
+    for tolerance in sorted(tolerances):
+        routes, total, worst = [], 0, 0.0
+        for i in range(geom.n_routes):
+            lats, lons = geom.lat[offsets[i]:offsets[i + 1]], geom.lon[offsets[i]:offsets[i + 1]]
+            kept = simplify_indices(lats, lons, tolerance)
+            worst = max(worst, max_deviation(lats, lons, kept))
+            routes.append((geom.route_name(i), [lats[k] for k in kept], [lons[k] for k in kept]))
+            total += len(kept)
+        out_path = _variant_path(path, tolerance)
+        _write_kmz(out_path, os.path.basename(path), pops, routes)
+        entry["variants"].append({
+            "tolerance": tolerance,
+            "path": os.path.relpath(out_path, BASE_DIR),
+            "vertices": total,
+            "max_error_deg": round(worst, 7),
+            "max_error_m": round(worst * METERS_PER_DEG, 1),
+            "bytes": os.path.getsize(out_path),
+        })
+    return entry
+
+
+def build_all(paths=None, tolerances=LIGHT_TOLERANCES, cache_dir=None):
+    """
+    Rebuild variants for every source whose fingerprint changed, then rewrite the manifest.
+    cache_dir: the caller's geometry cache, when run as a warm-up stage in a pool process.
+    """
+    if cache_dir:
+        geo.GEOMETRY_CACHE_DIR = cache_dir
+    os.makedirs(LIGHT_DIR, exist_ok=True)
+    manifest = dict(_read_manifest())
+    wanted = sorted(tolerances)
+    for path in paths or default_sources():
+        key = manifest_key(path)
+        current = manifest.get(key)
+        if (current and current["fingerprint"] == source_fingerprint(path)
+                and [v["tolerance"] for v in current["variants"]] == wanted
+                and all(os.path.exists(os.path.join(BASE_DIR, v["path"])) for v in current["variants"])):
+            print(f"= {key} (up to date)")
+            continue
+        entry = build_variants(path, wanted)
+        manifest[key] = entry
+        sizes = ", ".join(f"{v['tolerance']:g}→{v['vertices']} (≤{v['max_error_m']}m)" for v in entry["variants"])
+        print(f"→ {key}: {entry['vertices']} vertices; {sizes}")
+    tmp_path = f"{MANIFEST_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+    return manifest
+
+
+# === VARIANT SELECTION (used by bbmap) ===
+_MANIFEST = {"mtime": None, "data": {}}
+_MANIFEST_LOCK = threading.Lock()
+
+
+def _read_manifest():
+    """Manifest dict, re-read only when the file changes."""
+    try:
+        mtime = os.path.getmtime(MANIFEST_PATH)
+    except OSError:
+        return {}
+    with _MANIFEST_LOCK:
+        if _MANIFEST["mtime"] != mtime:
+            try:
+                with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+                    _MANIFEST["data"] = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("Light manifest unreadable: %s", e)
+                _MANIFEST["data"] = {}
+            _MANIFEST["mtime"] = mtime
+        return _MANIFEST["data"]
+
+
+def _hand_made_light(path):
+    stem, ext = os.path.splitext(path)
+    light_path = f"{stem}_light{ext}"
+    return light_path if os.path.exists(light_path) else path
+
+
+def choose_variant(path, vertex_budget):
+    """
+    Most detailed file for `path` whose route vertices fit the budget: the source itself if
+    it fits, else the finest light variant that does, else the coarsest one. Variants built
+    from an older version of the source are ignored; without a current manifest entry the
+    hand-made <name>_light file is used when one exists.
+    """
+    entry = _read_manifest().get(manifest_key(path))
+    if not entry or entry["fingerprint"] != source_fingerprint(path):
+        return _hand_made_light(path)
+    if entry["vertices"] <= vertex_budget:
+        return path
+    variants = [v for v in entry["variants"] if os.path.exists(os.path.join(BASE_DIR, v["path"]))]
+    if not variants:
+        return path
+    fitting = [v for v in variants if v["vertices"] <= vertex_budget]
+    chosen = max(fitting, key=lambda v: v["vertices"]) if fitting else min(variants, key=lambda v: v["vertices"])
+    return os.path.join(BASE_DIR, chosen["path"])
+
+
+if __name__ == "__main__":
+    tolerances = tuple(float(a) for a in sys.argv[1:]) or LIGHT_TOLERANCES
+    print(f"Building light variants at tolerances {', '.join(f'{t:g}' for t in tolerances)}...")
+    result = build_all(tolerances=tolerances)
+    print(f"\nDone! {len(result)} sources in {MANIFEST_PATH}")
@@ -0,0 +1,107 @@
+# pops.py — Nearest-PoP lookups from coordinates
+# A PopIndex holds every PoP as a unit vector in three float columns. The closest PoP on the
+# sphere is the one with the largest dot product, so a lookup is one pass of multiply-adds
+# over the columns plus a k-largest selection — no trig per PoP, and no geocoding: callers
+# pass the applicant coordinates they already have.
+
+import heapq
+import logging
+import threading
+from array import array
+from math import radians, cos, sin, asin, sqrt
+
+from geo import load_geometry, source_fingerprint, EARTH_RADIUS_MI
+
+logger = logging.getLogger('erate.pops')
+
+# Coverage class by distance to the nearest PoP (miles)
+COVERAGE_CLASSES = ((5.0, "Full fiber"), (50.0, "Nearby"))
+COVERAGE_FALLBACK = "Extended reach"
+
+
+def coverage_class(miles):
+    for limit, label in COVERAGE_CLASSES:
+        if miles <= limit:
+            return label
+    return COVERAGE_FALLBACK
+
+
+def _unit(lat, lon):
+    phi, lam = radians(lat), radians(lon)
+    return cos(phi) * cos(lam), cos(phi) * sin(lam), sin(phi)
+
+
+class PopIndex:
+    """Points [(name, lat, lon)] → unit-vector columns. Duplicate locations are kept once."""
+
+    def __init__(self, points):
+        self.names, self.lat, self.lon = [], array('d'), array('d')
+        self.x, self.y, self.z = array('d'), array('d'), array('d')
+        seen = set()
+        for name, lat, lon in points:
+            key = (round(lat, 4), round(lon, 4))
+            if key in seen:
+                continue
+            seen.add(key)
+            x, y, z = _unit(lat, lon)
+            self.names.append(name)
+            self.lat.append(lat)
+            self.lon.append(lon)
+            self.x.append(x)
+            self.y.append(y)
+            self.z.append(z)
+
+    def __len__(self):
+        return len(self.names)
+
+    def nearest(self, lat, lon, k=1):
+        """[{"name", "lat", "lon", "miles", "coverage"}] for the k closest PoPs, closest first."""
+        if not self.names or lat is None or lon is None:
+            return []
+        ax, ay, az = _unit(lat, lon)
+        dots = [ax * x + ay * y + az * z for x, y, z in zip(self.x, self.y, self.z)]
+        best = heapq.nlargest(k, range(len(dots)), key=dots.__getitem__)
+        out = []
+        for i in best:
+            # chord length between unit vectors → great-circle distance
+            chord = sqrt(max(0.0, 2.0 - 2.0 * dots[i]))
+            miles = 2.0 * EARTH_RADIUS_MI * asin(min(1.0, chord / 2.0))
+            out.append({
+                "name": self.names[i],
+                "lat": self.lat[i],
+                "lon": self.lon[i],
+                "miles": miles,
+                "coverage": coverage_class(miles),
+            })
+        return out
+
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def pop_index(name, static_points=(), kmz_path=None):
+    """
+    Cached index over a fixed PoP list plus the Point placemarks of a provider file. Rebuilt
+    only when the file's fingerprint changes.
+    """
+    key = (name, kmz_path, source_fingerprint(kmz_path) if kmz_path else None)
+    index = _INDEXES.get(key)
+    if index is not None:
+        return index
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(key)
+        if index is None:
+            points = list(static_points)
+            if kmz_path:
+                try:
+                    geom = load_geometry(kmz_path)
+                    if geom is not None:
+                        points += [(p["name"], p["lat"], p["lon"]) for p in geom.pops()]
+                except Exception as e:
+                    logger.warning("PoP placemarks unavailable [%s]: %s", kmz_path, e)
+            for stale in [k for k in _INDEXES if k[:2] == key[:2]]:
+                del _INDEXES[stale]
+            index = _INDEXES[key] = PopIndex(points)
+            logger.info("PoP index [%s]: %d PoPs", name, len(index))
+    return index
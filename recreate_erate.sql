@@ -87,7 +87,8 @@ CREATE TABLE erate (
     all_public VARCHAR(10),
     all_nonpublic VARCHAR(10),
     all_libraries VARCHAR(10),
-    form_version VARCHAR(50)
+    form_version VARCHAR(50),
+    geohash VARCHAR(12) COLLATE "C"   -- geohash.encode(latitude, longitude), set at import
 );
 
 -- INDEXES
@@ -97,6 +98,62 @@ CREATE INDEX idx_erate_funding_year ON erate(funding_year);
 CREATE INDEX idx_erate_last_modified ON erate(last_modified_datetime);
 CREATE INDEX idx_erate_entity_name ON erate(entity_name);
 CREATE INDEX idx_erate_fcc_status ON erate(fcc_status);
+CREATE INDEX idx_erate_geohash ON erate(geohash);
+
+-- MATERIALIZED NEAREST-FIBER DISTANCES (filled by erate.refresh_fiber_distances)
+CREATE TABLE IF NOT EXISTS erate_fiber_distance (
+    app_number VARCHAR(20) NOT NULL,
+    provider VARCHAR(20) NOT NULL,
+    distance_miles DOUBLE PRECISION,
+    nearest_lat DOUBLE PRECISION,
+    nearest_lon DOUBLE PRECISION,
+    provider_version VARCHAR(16) NOT NULL,
+    input_hash VARCHAR(32) NOT NULL,
+    coords_source VARCHAR(40),
+    computed_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (app_number, provider)
+);
+CREATE INDEX IF NOT EXISTS idx_fiber_distance_provider ON erate_fiber_distance(provider, distance_miles);
+
+-- GEOCODE CACHE (geocode.py) — normalized address → coords; NULL coords = not found
+CREATE TABLE IF NOT EXISTS geocode_cache (
+    address_key TEXT PRIMARY KEY,
+    query TEXT,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    source VARCHAR(20) NOT NULL DEFAULT 'nominatim',
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- GEOCODER RATE LIMIT (geocode.py) — next free request slot, shared by every process
+CREATE TABLE IF NOT EXISTS geocode_throttle (
+    source VARCHAR(20) PRIMARY KEY,
+    next_slot TIMESTAMPTZ NOT NULL
+);
+
+-- GEOCODING BACKFILL PROGRESS + FAILURES (erate.backfill_geocodes)
+CREATE TABLE IF NOT EXISTS geocode_backfill_run (
+    run_id SERIAL PRIMARY KEY,
+    reason TEXT,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    total INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    geocoded INTEGER NOT NULL DEFAULT 0,
+    not_found INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    started_at TIMESTAMP DEFAULT NOW(),
+    finished_at TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS geocode_backfill_log (
+    id BIGSERIAL PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    table_name VARCHAR(10) NOT NULL,
+    app_number VARCHAR(20) NOT NULL,
+    address TEXT,
+    outcome VARCHAR(10) NOT NULL,   -- not_found | error
+    message TEXT,
+    created_at TIMESTAMP DEFAULT NOW()
+);
 
 -- OPTIMIZE
 VACUUM ANALYZE erate;
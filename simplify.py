@@ -0,0 +1,80 @@
+# simplify.py — Douglas-Peucker line simplification over array-backed coordinates
+# Used offline by the LOD pyramid compiler (geo.compile_lods) and online by anything that
+# needs to thin a route on the fly. Iterative over index ranges: no recursion, no list slicing.
+# The per-vertex distance step is one comprehension over zero-copy memoryview ranges.
+
+from array import array
+from math import sqrt
+
+
+def _as_view(values):
+    """Zero-copy memoryview for arrays/mmap columns; lists are packed once into a double array."""
+    if isinstance(values, memoryview):
+        return values
+    if isinstance(values, array):
+        return memoryview(values)
+    return memoryview(array('d', values))
+
+
+def _farthest(xs, ys, first, last):
+    """(index, distance) of the vertex strictly between first and last farthest from their chord."""
+    x1, y1, x2, y2 = xs[first], ys[first], xs[last], ys[last]
+    inner = zip(xs[first + 1:last], ys[first + 1:last])
+    dx, dy = x2 - x1, y2 - y1
+    seg_len = sqrt(dx * dx + dy * dy)
+    if seg_len == 0:
+        # Closed loop — distance to the shared endpoint
+        dists = [sqrt((x - x1) ** 2 + (y - y1) ** 2) for x, y in inner]
+        seg_len = 1.0
+    else:
+        # Perpendicular distance × chord length; only the winner is divided
+        c1, c2 = x2 * y1, y2 * x1
+        dists = [abs(dy * x - dx * y + c1 - c2) for x, y in inner]
+    best = max(dists)
+    return first + 1 + dists.index(best), best / seg_len
+
+
+def simplify_indices(xs, ys, tolerance):
+    """Indexes of the vertices Douglas-Peucker keeps (endpoints always kept), ascending."""
+    n = len(xs)
+    if n <= 2:
+        return array('I', range(n))
+    xs, ys = _as_view(xs), _as_view(ys)
+    keep = bytearray(n)
+    keep[0] = keep[n - 1] = 1
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        index, dist = _farthest(xs, ys, first, last)
+        if dist > tolerance:
+            keep[index] = 1
+            stack.append((index, last))
+            stack.append((first, index))
+    return array('I', [i for i in range(n) if keep[i]])
+
+
+def simplify(xs, ys, tolerance):
+    """Simplified copies of two coordinate columns: (xs, ys) as double arrays."""
+    kept = simplify_indices(xs, ys, tolerance)
+    return array('d', [xs[i] for i in kept]), array('d', [ys[i] for i in kept])
+
+
+def simplify_coords(coords, tolerance):
+    """[[lat, lon], ...] → simplified [[lat, lon], ...] — for callers holding point lists."""
+    if len(coords) <= 2:
+        return list(coords)
+    xs = array('d', [c[0] for c in coords])
+    ys = array('d', [c[1] for c in coords])
+    return [coords[i] for i in simplify_indices(xs, ys, tolerance)]
+
+
+def max_deviation(xs, ys, kept):
+    """Largest distance from a dropped vertex to its simplified segment — the variant's real error."""
+    xs, ys = _as_view(xs), _as_view(ys)
+    worst = 0.0
+    for first, last in zip(kept, kept[1:]):
+        if last - first >= 2:
+            worst = max(worst, _farthest(xs, ys, first, last)[1])
+    return worst
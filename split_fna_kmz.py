@@ -1,60 +1,70 @@
 # split_fna_kmz.py — Split AllMemberFiber.kmz by FNA Member
+# Streams the source one Placemark at a time (geo.iter_placemark_elements) and appends each
+# to a per-member temp file, so memory stays flat however large the combined export gets.
 import zipfile
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
 import os
 import sys
+import tempfile
+
+from geo import KML_NS, GX_NS, iter_placemark_elements, open_kml
 
 KMZ_IN = "AllMemberFiber.kmz"
 OUTPUT_DIR = "fna_members"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+ET.register_namespace('', KML_NS)
+ET.register_namespace('gx', GX_NS)
+NAME_TAG = f'{{{KML_NS}}}name'
+
 print(f"Reading {KMZ_IN}...")
 
-with zipfile.ZipFile(KMZ_IN, 'r') as kmz:
-    kml_files = [f for f in kmz.namelist() if f.lower().endswith('.kml')]
-    if not kml_files:
-        print("No .kml found in KMZ")
-        sys.exit(1)
-    kml_data = kmz.read(kml_files[0])
-
-print("Parsing KML...")
-root = ET.fromstring(kml_data)
-ns = {'kml': 'http://www.opengis.net/kml/2.2'}
-
-# Group placemarks by member (from <name>)
-members = {}
-for placemark in root.findall('.//kml:Placemark', ns):
-    name_elem = placemark.find('kml:name', ns)
-    if name_elem is None or not name_elem.text:
-        continue
-    member_name = name_elem.text.strip()
-    if not member_name or member_name == "Unnamed":
-        continue
-    if member_name not in members:
-        members[member_name] = []
-    members[member_name].append(placemark)
-
-print(f"Found {len(members)} FNA members")
-
-# Create one KMZ per member
-for member, placemarks in members.items():
-    safe_name = "".join(c if c.isalnum() or c in " _-" else "_" for c in member)[:50]
-    kmz_out = os.path.join(OUTPUT_DIR, f"{safe_name}.kmz")
-    
-    with zipfile.ZipFile(kmz_out, 'w', zipfile.ZIP_DEFLATED) as out_kmz:
-        # Create new KML
-        doc = ET.Element('kml', xmlns="http://www.opengis.net/kml/2.2")
-        document = ET.SubElement(doc, 'Document')
-        name = ET.SubElement(document, 'name')
-        name.text = member
-        
-        for pm in placemarks:
-            document.append(pm)
-        
-        kml_bytes = ET.tostring(doc, encoding='utf-8')
-        out_kmz.writestr('doc.kml', kml_bytes)
-    
-    print(f"→ {kmz_out} ({len(placemarks)} features)")
-
-print(f"\nDone! {len(members)} member KMZ files in '{OUTPUT_DIR}/'")
+probe = open_kml(KMZ_IN)
+if probe is None:
+    print("No .kml found in KMZ")
+    sys.exit(1)
+probe.close()
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    # Group placemarks by member (from <name>) — one temp file of KML fragments per member
+    parts = {}  # member → (temp path, open file, feature count)
+    print("Parsing KML...")
+    for placemark in iter_placemark_elements(KMZ_IN):
+        name_elem = placemark.find(NAME_TAG)
+        if name_elem is None or not name_elem.text:
+            continue
+        member_name = name_elem.text.strip()
+        if not member_name or member_name == "Unnamed":
+            continue
+        if member_name not in parts:
+            part_path = os.path.join(tmp_dir, f"{len(parts)}.part")
+            parts[member_name] = [part_path, open(part_path, 'wb'), 0]
+        part = parts[member_name]
+        part[1].write(ET.tostring(placemark, encoding='utf-8', xml_declaration=False))
+        part[1].write(b"\n")
+        part[2] += 1
+
+    print(f"Found {len(parts)} FNA members")
+
+    # Create one KMZ per member
+    for member, (part_path, part_file, count) in parts.items():
+        part_file.close()
+        safe_name = "".join(c if c.isalnum() or c in " _-" else "_" for c in member)[:50]
+        kmz_out = os.path.join(OUTPUT_DIR, f"{safe_name}.kmz")
+
+        with zipfile.ZipFile(kmz_out, 'w', zipfile.ZIP_DEFLATED) as out_kmz:
+            with out_kmz.open('doc.kml', 'w') as kml_out, open(part_path, 'rb') as fragments:
+                kml_out.write(
+                    f'<?xml version="1.0" encoding="UTF-8"?>\n'
+                    f'<kml xmlns="{KML_NS}" xmlns:gx="{GX_NS}"><Document>'
+                    f'<name>{escape(member)}</name>\n'.encode('utf-8')
+                )
+                for chunk in iter(lambda: fragments.read(1 << 20), b""):
+                    kml_out.write(chunk)
+                kml_out.write(b"</Document></kml>\n")
+
+        print(f"→ {kmz_out} ({count} features)")
+
+print(f"\nDone! {len(parts)} member KMZ files in '{OUTPUT_DIR}/'")
 print("Next: Update erate.py to load from this folder")
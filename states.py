@@ -0,0 +1,282 @@
+# states.py — US state lookup for fiber vertices + persisted provider↔state coverage
+# State boundaries are rasterized ONCE into a 0.1° grid, so a vertex lookup is one index. The
+# repo ships no boundary data: by default the grid is the STATE_BOUNDS boxes (overlaps resolved
+# by depth), which is approximate along borders. Drop in a boundary file for polygon cells.
+# Coverage per provider file is cached on disk, keyed by its path and fingerprint.
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from itertools import chain
+from math import cos, radians
+
+import geo
+from geo import load_geometry, source_fingerprint
+
+logger = logging.getLogger('erate.states')
+
+# (min_lat, max_lat, min_lon, max_lon)
+STATE_BOUNDS = {
+    "AL": (30.2, 35.0, -88.5, -84.9), "AK": (51.2, 71.4, -179.2, -129.9),
+    "AZ": (31.3, 37.0, -114.8, -109.0), "AR": (33.0, 36.5, -94.6, -89.6),
+    "CA": (32.5, 42.0, -124.4, -114.1), "CO": (37.0, 41.0, -109.1, -102.0),
+    "CT": (40.9, 42.1, -73.7, -71.8), "DE": (38.4, 39.8, -75.8, -75.0),
+    "FL": (24.5, 31.0, -87.6, -80.0), "GA": (30.4, 35.0, -85.6, -80.8),
+    "ID": (42.0, 49.0, -117.0, -111.0), "IL": (37.0, 42.5, -91.5, -87.5),
+    "IN": (37.8, 41.8, -88.1, -84.8), "IA": (40.4, 43.5, -96.6, -90.1),
+    "KS": (37.0, 40.0, -102.1, -94.6), "KY": (36.5, 39.1, -89.6, -81.9),
+    "LA": (28.9, 33.0, -94.0, -88.8), "ME": (43.1, 47.5, -71.1, -66.9),
+    "MD": (37.9, 39.7, -79.5, -75.0), "MA": (41.2, 42.9, -73.5, -69.9),
+    "MI": (41.7, 48.3, -90.4, -82.4), "MN": (43.5, 49.4, -97.2, -89.5),
+    "MS": (30.2, 35.0, -91.7, -88.1), "MO": (36.0, 40.6, -95.8, -89.1),
+    "MT": (44.4, 49.0, -116.0, -104.0), "NE": (40.0, 43.0, -104.1, -95.3),
+    "NV": (35.0, 42.0, -120.0, -114.0), "NH": (42.7, 45.3, -72.6, -70.6),
+    "NJ": (38.9, 41.4, -75.6, -73.9), "NM": (31.3, 37.0, -109.1, -103.0),
+    "NY": (40.5, 45.0, -79.8, -71.9), "NC": (33.8, 36.6, -84.3, -75.4),
+    "ND": (45.9, 49.0, -104.1, -96.5), "OH": (38.4, 41.9, -84.8, -80.5),
+    "OK": (33.6, 37.0, -103.0, -94.4), "OR": (42.0, 46.3, -124.6, -116.5),
+    "PA": (39.7, 42.3, -80.6, -74.7), "RI": (41.1, 42.0, -71.9, -71.1),
+    "SC": (32.0, 35.2, -83.4, -78.5), "SD": (42.5, 45.9, -104.1, -96.5),
+    "TN": (34.9, 36.7, -90.3, -81.6), "TX": (25.8, 36.5, -106.6, -93.5),
+    "UT": (37.0, 42.0, -114.1, -109.0), "VT": (42.7, 45.0, -73.4, -71.5),
+    "VA": (36.5, 39.5, -83.7, -75.2), "WA": (45.5, 49.0, -124.8, -116.9),
+    "WV": (37.2, 40.6, -82.6, -77.7), "WI": (42.5, 47.1, -92.9, -86.8),
+    "WY": (41.0, 45.0, -111.1, -104.1)
+}
+
+# Optional boundary file — not shipped and not built by anything here (GeoJSON FeatureCollection,
+# e.g. Census cartographic boundaries cb_*_us_state_*.zip converted, with a STUSPS property).
+# When present its polygons are scan-filled into the grid; the boxes only decide cells no
+# polygon covers (offshore / outside the file).
+STATE_POLYGONS_PATH = "us_states.geojson"
+_POSTAL_KEYS = ("STUSPS", "postal", "abbr", "state")
+
+# === RASTER GRID ===
+GRID_STEP = 0.1
+GRID_MIN_LAT = min(b[0] for b in STATE_BOUNDS.values())
+GRID_MIN_LON = min(b[2] for b in STATE_BOUNDS.values())
+GRID_ROWS = int((max(b[1] for b in STATE_BOUNDS.values()) - GRID_MIN_LAT) / GRID_STEP) + 1
+GRID_COLS = int((max(b[3] for b in STATE_BOUNDS.values()) - GRID_MIN_LON) / GRID_STEP) + 1
+
+
+def grid_version():
+    """Changes with the boxes, the grid step or the boundary file — invalidates persisted coverage."""
+    parts = [GRID_STEP, sorted(STATE_BOUNDS.items()), source_fingerprint(STATE_POLYGONS_PATH)]
+    return hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest()[:12]
+
+
+def _load_polygons(path):
+    """{state: [ring, ...]} from a GeoJSON file (rings as [(lon, lat), ...]), or {} if absent."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            features = json.load(f).get('features', [])
+    except (OSError, ValueError) as e:
+        if os.path.exists(path):
+            logger.warning("State polygons unreadable [%s]: %s", path, e)
+        return {}
+    polygons = {}
+    for feature in features:
+        props = feature.get('properties') or {}
+        state = next((props[k] for k in _POSTAL_KEYS if props.get(k) in STATE_BOUNDS), None)
+        geometry = feature.get('geometry') or {}
+        if state is None:
+            continue
+        if geometry.get('type') == 'Polygon':
+            parts = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiPolygon':
+            parts = geometry['coordinates']
+        else:
+            continue
+        rings = polygons.setdefault(state, [])
+        for polygon in parts:
+            rings.extend([(p[0], p[1]) for p in ring] for ring in polygon)
+    return polygons
+
+
+class StateGrid:
+    """bytearray of state codes (index + 1, 0 = none) over a regular lat/lon grid."""
+
+    def __init__(self, polygons_path=STATE_POLYGONS_PATH):
+        self.states = sorted(STATE_BOUNDS)
+        cells = bytearray(GRID_ROWS * GRID_COLS)
+        self._fill_boxes(cells)
+        polygons = _load_polygons(polygons_path)
+        if polygons:
+            self._fill_polygons(cells, polygons)
+        logger.info("State grid built: %dx%d cells, %s", GRID_ROWS, GRID_COLS,
+                    f"{len(polygons)} state polygons" if polygons else "bounding boxes only")
+        self.cells = cells
+
+    def _fill_boxes(self, cells):
+        """
+        Each cell goes to the box its centre sits deepest inside, measured as a fraction of the
+        box's size — so a border cell lands in the state whose box it is most central to rather
+        than whichever box a linear scan happened to reach first.
+        """
+        depth = [0.0] * len(cells)
+        for code, state in enumerate(self.states, start=1):
+            min_lat, max_lat, min_lon, max_lon = STATE_BOUNDS[state]
+            lat_span, lon_span = max_lat - min_lat, max_lon - min_lon
+            slack = -GRID_STEP / 2 / max(lat_span, lon_span)
+            for row in range(self._row(min_lat), self._row(max_lat) + 1):
+                lat = GRID_MIN_LAT + (row + 0.5) * GRID_STEP
+                lat_depth = min(lat - min_lat, max_lat - lat) / lat_span
+                base = row * GRID_COLS
+                for col in range(self._col(min_lon), self._col(max_lon) + 1):
+                    lon = GRID_MIN_LON + (col + 0.5) * GRID_STEP
+                    d = min(lat_depth, (lon - min_lon) / lon_span, (max_lon - lon) / lon_span)
+                    i = base + col
+                    if d >= slack and (not cells[i] or d > depth[i]):
+                        cells[i] = code
+                        depth[i] = d
+
+    def _fill_polygons(self, cells, polygons):
+        """Even-odd scanline fill of every state's rings at each row's centre latitude."""
+        for code, state in enumerate(self.states, start=1):
+            rings = polygons.get(state)
+            if not rings:
+                continue
+            edges = []
+            for ring in rings:
+                edges.extend(zip(ring, ring[1:] + ring[:1]))
+            for row in range(GRID_ROWS):
+                lat = GRID_MIN_LAT + (row + 0.5) * GRID_STEP
+                xs = sorted(
+                    x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+                    for (x1, y1), (x2, y2) in edges
+                    if (y1 <= lat) != (y2 <= lat)
+                )
+                base = row * GRID_COLS
+                for west, east in zip(xs[0::2], xs[1::2]):
+                    # Cells whose centre lies between the crossings
+                    first = max(0, int((west - GRID_MIN_LON) / GRID_STEP - 0.5) + 1)
+                    last = min(GRID_COLS - 1, int((east - GRID_MIN_LON) / GRID_STEP - 0.5))
+                    for col in range(first, last + 1):
+                        cells[base + col] = code
+
+    @staticmethod
+    def _row(lat):
+        return min(GRID_ROWS - 1, max(0, int((lat - GRID_MIN_LAT) / GRID_STEP)))
+
+    @staticmethod
+    def _col(lon):
+        return min(GRID_COLS - 1, max(0, int((lon - GRID_MIN_LON) / GRID_STEP)))
+
+    def state_at(self, lat, lon):
+        """Two-letter state for a point, or None outside every box."""
+        row = int((lat - GRID_MIN_LAT) / GRID_STEP)
+        col = int((lon - GRID_MIN_LON) / GRID_STEP)
+        if not (0 <= row < GRID_ROWS and 0 <= col < GRID_COLS):
+            return None
+        code = self.cells[row * GRID_COLS + col]
+        return self.states[code - 1] if code else None
+
+    def states_covered(self, lats, lons):
+        """Sorted states touched by any of the given vertices."""
+        cells = set()
+        for lat, lon in zip(lats, lons):
+            row = int((lat - GRID_MIN_LAT) / GRID_STEP)
+            col = int((lon - GRID_MIN_LON) / GRID_STEP)
+            if 0 <= row < GRID_ROWS and 0 <= col < GRID_COLS:
+                cells.add(row * GRID_COLS + col)
+        codes = {self.cells[i] for i in cells}
+        codes.discard(0)
+        return sorted(self.states[c - 1] for c in codes)
+
+
+_GRID = None  # (version, StateGrid)
+_GRID_LOCK = threading.Lock()
+
+
+def state_grid():
+    """Process-wide grid, rebuilt if the boundary file changes."""
+    global _GRID
+    version = grid_version()
+    if _GRID is None or _GRID[0] != version:
+        with _GRID_LOCK:
+            if _GRID is None or _GRID[0] != version:
+                _GRID = (version, StateGrid())
+    return _GRID[1]
+
+
+def state_at(lat, lon):
+    return state_grid().state_at(lat, lon)
+
+
+# === PERSISTED COVERAGE (path → fingerprint + states) ===
+COVERAGE_VERSION = 3  # bump when coverage or the file layout changes (v2: routes + PoPs, v3: by path)
+_COVERAGE = None  # (cache file path, {path: [fingerprint, [states]]})
+_COVERAGE_LOCK = threading.Lock()
+
+
+def _coverage_path():
+    return os.path.join(geo.GEOMETRY_CACHE_DIR, f"state_coverage.{grid_version()}.v{COVERAGE_VERSION}.json")
+
+
+def _load_coverage(path):
+    global _COVERAGE
+    if _COVERAGE is None or _COVERAGE[0] != path:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                _COVERAGE = (path, json.load(f))
+        except (OSError, ValueError):
+            _COVERAGE = (path, {})
+    return _COVERAGE[1]
+
+
+def _save_coverage(out_path, coverage):
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(coverage, f, separators=(',', ':'))
+    os.replace(tmp_path, out_path)
+
+    # Drop coverage files from older grids / cache versions
+    current = os.path.basename(out_path)
+    for f in os.listdir(os.path.dirname(out_path)):
+        if f.startswith("state_coverage.") and f.endswith(".json") and f != current:
+            try:
+                os.remove(os.path.join(os.path.dirname(out_path), f))
+            except OSError:
+                pass
+
+
+def coverage_for_paths(paths):
+    """
+    {path: [states]} for provider files — every state with a route vertex or a PoP. Cached
+    results are a dict read; only files whose fingerprint is new get loaded and rasterized,
+    and the cache file is rewritten once. One entry per path, so a changed file replaces its
+    old entry, and entries for files that changed or disappeared since are dropped here too.
+    """
+    with _COVERAGE_LOCK:
+        cache_path = _coverage_path()
+        coverage = _load_coverage(cache_path)
+        result, changed = {}, False
+        for path in paths:
+            fingerprint = source_fingerprint(path)
+            if fingerprint is None:
+                continue
+            entry = coverage.get(path)
+            states = entry[1] if entry and entry[0] == fingerprint else None
+            if states is None:
+                try:
+                    geom = load_geometry(path)
+                except Exception as e:
+                    logger.warning("Coverage parse error [%s]: %s", os.path.basename(path), e)
+                    continue
+                states = state_grid().states_covered(
+                    chain(geom.lat, geom.pop_lat), chain(geom.lon, geom.pop_lon)) if geom is not None else []
+                coverage[path] = [fingerprint, states]
+                changed = True
+                logger.info("State coverage [%s]: %s", os.path.basename(path), ", ".join(states) or "none")
+            result[path] = states
+        for path in [p for p in coverage if p not in result]:
+            entry = coverage[path]
+            if entry[0] != source_fingerprint(path):
+                del coverage[path]
+                changed = True
+        if changed:
+            _save_coverage(cache_path, coverage)
+        return result
@@ -0,0 +1,219 @@
+# tiles.py — Viewport tiles for fiber routes: /erate/tiles/<provider>/<z>/<x>/<y>
+# A tile is every route piece that crosses the tile's box, taken from the LOD level that
+# matches the zoom. Rendered tiles are kept in memory (LRU), keyed by the source fingerprints;
+# low zooms (the seeded range) are also kept on disk next to the geometry cache. Deeper zooms
+# stay memory-only, so panning around at street level can't fill the disk.
+
+import os
+import json
+import hashlib
+import logging
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from math import atan, sinh, pi, degrees, radians, log, tan, cos
+
+import geo
+from geo import load_geometry, lod_tolerance_for_zoom
+
+logger = logging.getLogger('erate.tiles')
+
+TILE_MEMORY_LIMIT = 4096       # tiles held in process
+TILE_BUFFER = 0.05             # fraction of the tile added on each side so lines run past the edge
+TILE_MAX_ZOOM = 18
+TILE_SEED_MAX_ZOOM = 6         # seed_tiles() pre-renders up to this zoom
+# deepest zoom written to disk — a bounded tile count per provider
+TILE_DISK_MAX_ZOOM = int(os.getenv('TILE_DISK_MAX_ZOOM', str(TILE_SEED_MAX_ZOOM)))
+
+
+# === TILE MATH (web mercator, XYZ scheme) ===
+def tile_bounds(z, x, y):
+    """(min_lat, max_lat, min_lon, max_lon) of an XYZ tile."""
+    n = 2 ** z
+
+    def lat_at(row):
+        return degrees(atan(sinh(pi * (1 - 2 * row / n))))
+
+    return lat_at(y + 1), lat_at(y), x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0
+
+
+def tiles_for_bounds(z, min_lat, max_lat, min_lon, max_lon):
+    """Every (x, y) at zoom z that intersects a lat/lon box."""
+    n = 2 ** z
+
+    def col(lon):
+        return min(n - 1, max(0, int((lon + 180.0) / 360.0 * n)))
+
+    def row(lat):
+        lat = max(min(lat, 85.0511), -85.0511)
+        r = radians(lat)
+        return min(n - 1, max(0, int((1 - log(tan(r) + 1 / cos(r)) / pi) / 2 * n)))
+
+    for x in range(col(min_lon), col(max_lon) + 1):
+        for y in range(row(max_lat), row(min_lat) + 1):
+            yield x, y
+
+
+# === CLIPPING ===
+def clip_routes(geom, min_lat, max_lat, min_lon, max_lon):
+    """
+    Yield (name, [[lat, lon], ...]) pieces of every route that crosses the box.
+    A piece is a run of consecutive segments whose own bounding box touches the box,
+    so long segments that only pass through the tile are kept too.
+    """
+    bounds = geom.route_bounds()
+    lat, lon, offsets = geom.lat, geom.lon, geom.offsets
+    for i in range(geom.n_routes):
+        b = i * 4
+        if bounds[b] > max_lat or bounds[b + 1] < min_lat or bounds[b + 2] > max_lon or bounds[b + 3] < min_lon:
+            continue
+        start, end = offsets[i], offsets[i + 1]
+        r_lat, r_lon = lat[start:end].tolist(), lon[start:end].tolist()
+        name = geom.route_name(i)
+        piece = []
+        for j in range(len(r_lat) - 1):
+            a_lat, b_lat, a_lon, b_lon = r_lat[j], r_lat[j + 1], r_lon[j], r_lon[j + 1]
+            if (min(a_lat, b_lat) > max_lat or max(a_lat, b_lat) < min_lat
+                    or min(a_lon, b_lon) > max_lon or max(a_lon, b_lon) < min_lon):
+                if len(piece) > 1:
+                    yield name, piece
+                piece = []
+                continue
+            if not piece:
+                piece.append([a_lat, a_lon])
+            piece.append([b_lat, b_lon])
+        if len(piece) > 1:
+            yield name, piece
+
+
+def render_tile(sources, z, x, y):
+    """JSON bytes for one tile over [(name, color, path), ...]."""
+    min_lat, max_lat, min_lon, max_lon = tile_bounds(z, x, y)
+    pad_lat, pad_lon = (max_lat - min_lat) * TILE_BUFFER, (max_lon - min_lon) * TILE_BUFFER
+    box = (min_lat - pad_lat, max_lat + pad_lat, min_lon - pad_lon, max_lon + pad_lon)
+    tolerance = lod_tolerance_for_zoom(z)
+
+    lines = []
+    for name, color, path in sources:
+        geom = load_geometry(path)
+        if geom is None or geom.bbox is None:
+            continue
+        g_min_lat, g_max_lat, g_min_lon, g_max_lon = geom.bbox
+        if g_min_lat > box[1] or g_max_lat < box[0] or g_min_lon > box[3] or g_max_lon < box[2]:
+            continue
+        for _, coords in clip_routes(geom.lod(tolerance), *box):
+            lines.append({"name": name, "color": color, "coords": coords})
+    return json.dumps({"lines": lines}, separators=(',', ':')).encode('utf-8')
+
+
+# === TILE CACHE (memory LRU + disk) ===
+_TILES = OrderedDict()
+_TILES_LOCK = threading.Lock()
+_DISK_KEYS = set()  # provider cache dirs already checked for stale siblings
+
+
+def _sources_key(provider, sources):
+    """Cache key for a provider's current source versions — changes whenever a file does."""
+    parts = [provider] + [f"{path}|{geo.source_fingerprint(path)}" for _, _, path in sources]
+    return hashlib.sha1("\n".join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def _tile_dir(provider, key):
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in provider)
+    return os.path.join(geo.GEOMETRY_CACHE_DIR, "tiles", f"{safe}.{key}")
+
+
+def _drop_stale_tile_dirs(provider, key):
+    """Remove this provider's tile dirs from older source versions (once per key per process)."""
+    if key in _DISK_KEYS:
+        return
+    _DISK_KEYS.add(key)
+    current = _tile_dir(provider, key)
+    root, prefix = os.path.dirname(current), os.path.basename(current).rsplit('.', 1)[0] + "."
+    try:
+        entries = os.listdir(root)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.startswith(prefix) and os.path.join(root, entry) != current:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+def get_tile(provider, sources, z, x, y):
+    """Tile bytes for a provider, from memory, then disk (z <= TILE_DISK_MAX_ZOOM), then rendered."""
+    key = _sources_key(provider, sources)
+    mem_key = (key, z, x, y)
+    with _TILES_LOCK:
+        data = _TILES.get(mem_key)
+        if data is not None:
+            _TILES.move_to_end(mem_key)
+            return data
+
+    if z > TILE_DISK_MAX_ZOOM:
+        data = render_tile(sources, z, x, y)
+    else:
+        data = _disk_tile(provider, key, sources, z, x, y)
+
+    with _TILES_LOCK:
+        _TILES[mem_key] = data
+        while len(_TILES) > TILE_MEMORY_LIMIT:
+            _TILES.popitem(last=False)
+    return data
+
+
+def _disk_tile(provider, key, sources, z, x, y):
+    """Tile bytes from the disk cache, rendered and written on a miss."""
+    _drop_stale_tile_dirs(provider, key)
+    disk_path = os.path.join(_tile_dir(provider, key), str(z), str(x), f"{y}.json")
+    try:
+        with open(disk_path, 'rb') as f:
+            return f.read()
+    except OSError:
+        pass
+    data = render_tile(sources, z, x, y)
+    try:
+        os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(disk_path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, disk_path)
+    except OSError as e:
+        logger.warning("Tile cache write failed [%s]: %s", disk_path, e)
+    return data
+
+
+def seed_tiles(provider, sources, max_zoom=TILE_SEED_MAX_ZOOM):
+    """Pre-render every tile covering the provider's footprint up to max_zoom. Returns the count."""
+    boxes = []
+    for _, _, path in sources:
+        geom = load_geometry(path)
+        if geom is not None and geom.bbox is not None:
+            boxes.append(geom.bbox)
+    count = 0
+    for z in range(max_zoom + 1):
+        seen = set()
+        for box in boxes:
+            for x, y in tiles_for_bounds(z, *box):
+                if (x, y) not in seen:
+                    seen.add((x, y))
+                    get_tile(provider, sources, z, x, y)
+                    count += 1
+    logger.info("Seeded %d tiles for %s (z0–%d)", count, provider, max_zoom)
+    return count
+
+
+def seed_all(providers, cache_dir=None, max_zoom=TILE_SEED_MAX_ZOOM):
+    """
+    seed_tiles for {provider: sources} — a warm-up stage, so it runs in a pool process
+    (cache_dir: the parent's geometry cache). Returns the total tile count.
+    """
+    if cache_dir:
+        geo.GEOMETRY_CACHE_DIR = cache_dir
+    total = 0
+    for provider, sources in providers.items():
+        try:
+            total += seed_tiles(provider, sources, max_zoom)
+        except Exception as e:
+            logger.warning("Tile seeding failed [%s]: %s", provider, e)
+    return total
@@ -0,0 +1,148 @@
+# warmup.py — Compile every provider file (geometry + LOD pyramid) across all cores
+# Parsing a dense KMZ is single-threaded CPU work, so a warm-up fans the catalog out to a
+# process pool: each child compiles one file's artifacts into the shared geometry cache, the
+# parent only mmaps the results. Follow-up stages (jobs that read the compiled geometry) run
+# in the same pool afterwards, so their CPU time never lands on a web worker's GIL.
+# Progress is kept in one dict the admin page polls.
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import geo
+from geo import load_geometry, LOD_TOLERANCES
+
+logger = logging.getLogger('erate.warmup')
+
+WARMUP_WORKERS = int(os.getenv('WARMUP_WORKERS', '0')) or os.cpu_count() or 1
+
+_STATE = {
+    "running": False,
+    "total": 0,
+    "done": 0,
+    "failed": 0,
+    "current": [],
+    "started": None,
+    "finished": None,
+    "errors": [],
+}
+_STATE_LOCK = threading.Lock()
+
+
+def _compile_one(path, cache_dir):
+    """Child process: compile base artifact + every LOD level. Returns (vertices, seconds)."""
+    geo.GEOMETRY_CACHE_DIR = cache_dir
+    t0 = time.time()
+    geom = load_geometry(path)
+    if geom is None:
+        return 0, 0.0
+    for tolerance in LOD_TOLERANCES:
+        geom.lod(tolerance)
+    return geom.n_vertices, time.time() - t0
+
+
+def warmup_status():
+    """Snapshot of the current / last warm-up."""
+    with _STATE_LOCK:
+        status = dict(_STATE)
+        status["current"] = list(_STATE["current"])
+        status["errors"] = list(_STATE["errors"])
+    return status
+
+
+def _run_stages(pool, stages):
+    """Run [(label, fn, args)] in the pool, one after another — each may depend on the last."""
+    for label, fn, args in stages:
+        t0 = time.time()
+        try:
+            pool.submit(fn, *args).result()
+            logger.info("Warm-up stage [%s] done in %.1fs", label, time.time() - t0)
+            error = None
+        except Exception as e:
+            logger.warning("Warm-up stage failed [%s]: %s", label, e)
+            error = f"{label}: {e}"
+        with _STATE_LOCK:
+            if error:
+                _STATE["errors"].append(error)
+
+
+def _run(paths, workers, stages=()):
+    t0 = time.time()
+    try:
+        # spawn, not fork: the parent is a threaded web worker holding DB connections
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {pool.submit(_compile_one, path, geo.GEOMETRY_CACHE_DIR): path for path in paths}
+            for future in as_completed(futures):
+                path = futures[future]
+                name = os.path.basename(path)
+                try:
+                    vertices, seconds = future.result()
+                    # Artifacts are on disk now — mapping them here is just an mmap
+                    load_geometry(path)
+                    logger.info("Warm-up [%s]: %d vertices in %.1fs", name, vertices, seconds)
+                    error = None
+                except Exception as e:
+                    logger.warning("Warm-up failed [%s]: %s", name, e)
+                    error = f"{name}: {e}"
+                with _STATE_LOCK:
+                    _STATE["done"] += 1
+                    if error:
+                        _STATE["failed"] += 1
+                        _STATE["errors"].append(error)
+                    if name in _STATE["current"]:
+                        _STATE["current"].remove(name)
+            _run_stages(pool, stages)
+    except Exception as e:
+        logger.error("Warm-up aborted: %s", e)
+        with _STATE_LOCK:
+            _STATE["errors"].append(f"aborted: {e}")
+    finally:
+        with _STATE_LOCK:
+            _STATE["running"] = False
+            _STATE["finished"] = time.time()
+    logger.info("Warm-up complete: %d files in %.1fs (%d failed)", len(paths), time.time() - t0, _STATE["failed"])
+
+
+def _begin(paths):
+    """Claim the run and reset progress. False if a warm-up is already running."""
+    with _STATE_LOCK:
+        if _STATE["running"]:
+            return False
+        _STATE.update(
+            running=True, total=len(paths), done=0, failed=0,
+            current=[os.path.basename(p) for p in paths],
+            started=time.time(), finished=None, errors=[],
+        )
+    return True
+
+
+def _existing(paths):
+    return [p for p in dict.fromkeys(paths) if os.path.exists(p)]
+
+
+def start_warmup(paths, workers=WARMUP_WORKERS, stages=()):
+    """
+    Start a background warm-up over `paths`, then `stages` ([(label, fn, args)], picklable
+    top-level functions). Returns False if one is already running.
+    """
+    paths = _existing(paths)
+    if not _begin(paths):
+        return False
+    logger.info("Warm-up started: %d files on %d processes", len(paths), workers)
+    thread = threading.Thread(target=_run, args=(paths, min(workers, max(1, len(paths))), stages), daemon=True)
+    thread.start()
+    return True
+
+
+def warm_all(paths, workers=WARMUP_WORKERS, stages=()):
+    """Blocking warm-up — for callers that already run in their own thread or process."""
+    paths = _existing(paths)
+    if not _begin(paths):
+        return False
+    logger.info("Warm-up (blocking): %d files on %d processes", len(paths), workers)
+    _run(paths, min(workers, max(1, len(paths))), stages)
+    return True
@@ -0,0 +1,217 @@
+# zip_centroids.py — Offline ZIP / city centroids for placing applicants without a geocoder
+# Usage: python zip_centroids.py [--db] [source ...]
+#   source: a USAC 470 CSV (default: 470schema.csv, else templates/470schema.csv) or a Census
+#           ZCTA gazetteer file (tab-separated GEOID / INTPTLAT / INTPTLONG; by default any
+#           *Gaz_zcta_national*.txt next to this file is picked up)
+#   --db:   also use every erate row that has coordinates (needs DATABASE_URL)
+# The shipped table comes from the 470 sample only; the app rebuilds it with --db after every
+# 470 import and at warm-up (erate.rebuild_zip_centroids).
+# Centroids are the median coordinate of the applicants in each ZIP and each city+state
+# (gazetteer ZIPs win over applicant medians). The result is written to zip_centroids.csv,
+# which the app loads into a small columnar index: one dict lookup per placement.
+
+import os
+import re
+import sys
+import csv
+import glob
+import logging
+import threading
+from array import array
+from statistics import median
+
+logger = logging.getLogger('erate.zipgeo')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ZIP_CENTROIDS_PATH = os.path.join(BASE_DIR, "zip_centroids.csv")
+DEFAULT_SOURCES = (os.path.join(BASE_DIR, "470schema.csv"), os.path.join(BASE_DIR, "templates", "470schema.csv"))
+GAZETTEER_GLOB = os.path.join(BASE_DIR, "*Gaz_zcta_national*.txt")
+
+# Accuracy flags, best first
+ACCURACY_ZIP = "zip"
+ACCURACY_CITY = "city"
+
+
+def normalize_zip(zip_code):
+    """Five-digit ZIP ('1845' → '01845', '01845-1234' → '01845'), or None."""
+    digits = re.sub(r"\D", "", str(zip_code or "").split("-")[0])[:5]
+    return digits.zfill(5) if digits and int(digits) else None
+
+
+def normalize_city(city):
+    return " ".join(re.sub(r"[^\w\s]", " ", (city or "").lower()).split())
+
+
+def _coords(lat, lon):
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not lat or not lon or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+# === BUILD ===
+def _applicant_points(path):
+    """(zip, city, state, lat, lon) for every row of a USAC 470 CSV with coordinates."""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            point = _coords(row.get('Latitude'), row.get('Longitude'))
+            if point:
+                yield (row.get('Billed Entity Zip Code'), row.get('Billed Entity City'),
+                       (row.get('Billed Entity State') or '').strip().upper()) + point
+
+
+def _db_points(database_url=None):
+    import psycopg
+    conn = psycopg.connect(database_url or os.environ['DATABASE_URL'], connect_timeout=10)
+    with conn.cursor(name="zip_centroid_points") as cur:
+        cur.execute("SELECT zip_code, city, state, latitude, longitude FROM erate "
+                    "WHERE latitude <> 0 AND longitude <> 0")
+        for zip_code, city, state, lat, lon in cur:
+            yield zip_code, city, (state or '').strip().upper(), float(lat), float(lon)
+    conn.close()
+
+
+def _gazetteer(path):
+    """{zip: (lat, lon)} from a Census ZCTA gazetteer file."""
+    out = {}
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        header = [h.strip() for h in next(reader)]
+        i_zip, i_lat, i_lon = header.index('GEOID'), header.index('INTPTLAT'), header.index('INTPTLONG')
+        for row in reader:
+            point = _coords(row[i_lat], row[i_lon])
+            if point:
+                out[row[i_zip].strip().zfill(5)] = point
+    return out
+
+
+def _is_gazetteer(path):
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        return 'INTPTLAT' in f.readline()
+
+
+def default_sources():
+    """The first 470 sample CSV that exists, plus any ZCTA gazetteer dropped next to this file."""
+    return [p for p in DEFAULT_SOURCES if os.path.exists(p)][:1] + sorted(glob.glob(GAZETTEER_GLOB))
+
+
+def build(sources=None, use_db=False, out_path=ZIP_CENTROIDS_PATH, database_url=None):
+    """
+    Write the centroid table. Returns (zip count, city count). An unchanged table is left in
+    place, so its fingerprint — and every fiber distance placed from it — stays valid.
+    """
+    sources = list(sources or default_sources())
+    by_zip, by_city, zip_state, gazetteer = {}, {}, {}, {}
+    feeds = [_db_points(database_url)] if use_db else []
+    for path in sources:
+        if _is_gazetteer(path):
+            gazetteer.update(_gazetteer(path))
+        else:
+            feeds.append(_applicant_points(path))
+    for feed in feeds:
+        for zip_code, city, state, lat, lon in feed:
+            zip5 = normalize_zip(zip_code)
+            if zip5:
+                by_zip.setdefault(zip5, []).append((lat, lon))
+                zip_state.setdefault(zip5, state)
+            city_key = normalize_city(city)
+            if city_key and state:
+                by_city.setdefault((city_key, state), []).append((lat, lon))
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["kind", "key", "state", "latitude", "longitude", "samples"])
+        for zip5 in sorted(set(by_zip) | set(gazetteer)):
+            points = by_zip.get(zip5, [])
+            lat, lon = gazetteer.get(zip5) or (median(p[0] for p in points), median(p[1] for p in points))
+            writer.writerow([ACCURACY_ZIP, zip5, zip_state.get(zip5, ''), f"{lat:.6f}", f"{lon:.6f}", len(points)])
+        for (city_key, state), points in sorted(by_city.items()):
+            writer.writerow([ACCURACY_CITY, city_key, state, f"{median(p[0] for p in points):.6f}",
+                             f"{median(p[1] for p in points):.6f}", len(points)])
+    if _same_contents(tmp_path, out_path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, out_path)
+    return len(set(by_zip) | set(gazetteer)), len(by_city)
+
+
+def _same_contents(path_a, path_b):
+    try:
+        with open(path_a, 'rb') as a, open(path_b, 'rb') as b:
+            return a.read() == b.read()
+    except OSError:
+        return False
+
+
+# === LOOKUP (used by erate._applicant_coords) ===
+class CentroidIndex:
+    """Key → row in two float32 columns; ZIPs keyed by int, cities by (name, state)."""
+
+    def __init__(self, path=ZIP_CENTROIDS_PATH):
+        self.lat, self.lon = array('f'), array('f')
+        self.zips, self.cities = {}, {}
+        if not os.path.exists(path):
+            logger.warning("ZIP centroid table missing: %s (run python zip_centroids.py)", path)
+            return
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for kind, key, state, lat, lon, _ in csv.reader(f):
+                if kind == ACCURACY_ZIP:
+                    self.zips[int(key)] = len(self.lat)
+                elif kind == ACCURACY_CITY:
+                    self.cities[(key, state)] = len(self.lat)
+                else:
+                    continue
+                self.lat.append(float(lat))
+                self.lon.append(float(lon))
+        logger.info("ZIP centroids: %d ZIPs, %d cities", len(self.zips), len(self.cities))
+
+    def locate(self, zip_code, city=None, state=None):
+        """(lat, lon, accuracy) from ZIP, else city + state, else (None, None, None)."""
+        zip5 = normalize_zip(zip_code)
+        i = self.zips.get(int(zip5)) if zip5 else None
+        accuracy = ACCURACY_ZIP
+        if i is None and city and state:
+            i = self.cities.get((normalize_city(city), state.strip().upper()))
+            accuracy = ACCURACY_CITY
+        if i is None:
+            return None, None, None
+        return float(self.lat[i]), float(self.lon[i]), accuracy
+
+
+_INDEX = None  # (file version, CentroidIndex)
+_INDEX_LOCK = threading.Lock()
+
+
+def _table_version(path=ZIP_CENTROIDS_PATH):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def centroid_index():
+    """Process-wide index, reloaded when the table is rebuilt (by any process)."""
+    global _INDEX
+    version = _table_version()
+    if _INDEX is None or _INDEX[0] != version:
+        with _INDEX_LOCK:
+            if _INDEX is None or _INDEX[0] != version:
+                _INDEX = (version, CentroidIndex())
+    return _INDEX[1]
+
+
+def locate(zip_code, city=None, state=None):
+    return centroid_index().locate(zip_code, city, state)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    use_db = '--db' in args
+    sources = [a for a in args if a != '--db']
+    zips, cities = build(sources, use_db=use_db)
+    print(f"Done! {zips} ZIPs, {cities} cities → {ZIP_CENTROIDS_PATH}")